@@ -0,0 +1,183 @@
+-- Registro de cambios del calendario para sincronización incremental (GET /api/calendar/changes)
+-- Cada insert/update/delete de calendar_events y event_reminders deja una fila en calendar_changes
+-- (los borrados quedan como lápida). El cursor del cliente es (txid, seq): solo se entregan
+-- cambios de transacciones ya terminadas, así una transacción lenta no se salta aunque su
+-- seq sea menor que el de otra que confirmó antes.
+-- Ejecutar después de add_event_reminders.sql
+
+ALTER TABLE calendar_events ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+ALTER TABLE event_reminders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+CREATE TABLE IF NOT EXISTS calendar_changes (
+  seq BIGSERIAL PRIMARY KEY,
+  txid BIGINT NOT NULL DEFAULT (pg_current_xact_id()::text::bigint),
+  entity TEXT NOT NULL CHECK (entity IN ('event', 'reminder')),
+  entity_id UUID NOT NULL,
+  event_id UUID NOT NULL,
+  op TEXT NOT NULL CHECK (op IN ('upsert', 'delete')),
+  changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_calendar_changes_cursor ON calendar_changes(txid, seq);
+CREATE INDEX IF NOT EXISTS idx_calendar_changes_changed_at ON calendar_changes(changed_at);
+
+-- Mayor txid purgado: un cursor anterior ya no puede sincronizarse (410 -> recarga completa)
+CREATE TABLE IF NOT EXISTS calendar_changes_horizon (
+  id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  purged_txid BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO calendar_changes_horizon (id, purged_txid) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
+
+
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := NOW();
+  RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION log_calendar_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_entity TEXT := TG_ARGV[0];
+  v_row JSONB;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    v_row := to_jsonb(OLD);
+  ELSE
+    v_row := to_jsonb(NEW);
+  END IF;
+
+  INSERT INTO calendar_changes (entity, entity_id, event_id, op)
+  VALUES (
+    v_entity,
+    (v_row->>'id')::uuid,
+    COALESCE(v_row->>'event_id', v_row->>'id')::uuid,
+    CASE WHEN TG_OP = 'DELETE' THEN 'delete' ELSE 'upsert' END
+  );
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS calendar_events_touch_updated_at ON calendar_events;
+CREATE TRIGGER calendar_events_touch_updated_at
+  BEFORE UPDATE ON calendar_events
+  FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+  EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS event_reminders_touch_updated_at ON event_reminders;
+CREATE TRIGGER event_reminders_touch_updated_at
+  BEFORE UPDATE ON event_reminders
+  FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+  EXECUTE FUNCTION touch_updated_at();
+
+-- Un UPDATE que no cambia nada no genera cambio
+DROP TRIGGER IF EXISTS calendar_events_log_insert_delete ON calendar_events;
+CREATE TRIGGER calendar_events_log_insert_delete
+  AFTER INSERT OR DELETE ON calendar_events
+  FOR EACH ROW EXECUTE FUNCTION log_calendar_change('event');
+
+DROP TRIGGER IF EXISTS calendar_events_log_update ON calendar_events;
+CREATE TRIGGER calendar_events_log_update
+  AFTER UPDATE ON calendar_events
+  FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+  EXECUTE FUNCTION log_calendar_change('event');
+
+DROP TRIGGER IF EXISTS event_reminders_log_insert_delete ON event_reminders;
+CREATE TRIGGER event_reminders_log_insert_delete
+  AFTER INSERT OR DELETE ON event_reminders
+  FOR EACH ROW EXECUTE FUNCTION log_calendar_change('reminder');
+
+DROP TRIGGER IF EXISTS event_reminders_log_update ON event_reminders;
+CREATE TRIGGER event_reminders_log_update
+  AFTER UPDATE ON event_reminders
+  FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+  EXECUTE FUNCTION log_calendar_change('reminder');
+
+
+-- Cambios posteriores a (p_txid, p_seq), compactados por entidad: cada evento o recordatorio
+-- aparece una vez, con su fila actual si sigue existiendo o como borrado si no.
+-- p_limit = 0 solo devuelve el horizonte actual (cursor inicial).
+CREATE OR REPLACE FUNCTION calendar_changes_since(p_txid BIGINT, p_seq BIGINT, p_limit INT)
+RETURNS SETOF JSONB
+LANGUAGE sql
+STABLE
+AS $$
+  WITH horizon AS (
+    -- Transacciones con txid menor que xmin ya terminaron: sus cambios no pueden aparecer después
+    SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS xmin
+  ),
+  page AS (
+    SELECT c.txid, c.seq, c.entity, c.entity_id
+      FROM calendar_changes c
+     WHERE (c.txid, c.seq) > (p_txid, p_seq)
+       AND c.txid < (SELECT xmin FROM horizon)
+     ORDER BY c.txid, c.seq
+     LIMIT p_limit
+  ),
+  touched AS (
+    SELECT DISTINCT entity, entity_id FROM page
+  ),
+  last_change AS (
+    SELECT txid, seq FROM page ORDER BY txid DESC, seq DESC LIMIT 1
+  )
+  SELECT jsonb_build_object(
+    'xmin', (SELECT xmin FROM horizon),
+    'purged_txid', (SELECT purged_txid FROM calendar_changes_horizon),
+    'count', (SELECT count(*) FROM page),
+    'last_txid', (SELECT txid FROM last_change),
+    'last_seq', (SELECT seq FROM last_change),
+    'events_upserted', COALESCE((
+      SELECT jsonb_agg(to_jsonb(ce))
+        FROM touched t JOIN calendar_events ce ON ce.id = t.entity_id
+       WHERE t.entity = 'event'
+    ), '[]'::jsonb),
+    'events_deleted', COALESCE((
+      SELECT jsonb_agg(t.entity_id)
+        FROM touched t
+       WHERE t.entity = 'event'
+         AND NOT EXISTS (SELECT 1 FROM calendar_events ce WHERE ce.id = t.entity_id)
+    ), '[]'::jsonb),
+    'reminders_upserted', COALESCE((
+      SELECT jsonb_agg(to_jsonb(er))
+        FROM touched t JOIN event_reminders er ON er.id = t.entity_id
+       WHERE t.entity = 'reminder'
+    ), '[]'::jsonb),
+    'reminders_deleted', COALESCE((
+      SELECT jsonb_agg(t.entity_id)
+        FROM touched t
+       WHERE t.entity = 'reminder'
+         AND NOT EXISTS (SELECT 1 FROM event_reminders er WHERE er.id = t.entity_id)
+    ), '[]'::jsonb)
+  );
+$$;
+
+
+-- Limpieza periódica (p. ej. pg_cron diario): SELECT purge_calendar_changes(INTERVAL '30 days');
+CREATE OR REPLACE FUNCTION purge_calendar_changes(p_older_than INTERVAL DEFAULT INTERVAL '30 days')
+RETURNS BIGINT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_max_txid BIGINT;
+  v_deleted BIGINT;
+BEGIN
+  WITH removed AS (
+    DELETE FROM calendar_changes WHERE changed_at < NOW() - p_older_than RETURNING txid
+  )
+  SELECT max(txid), count(*) INTO v_max_txid, v_deleted FROM removed;
+
+  IF v_max_txid IS NOT NULL THEN
+    UPDATE calendar_changes_horizon SET purged_txid = GREATEST(purged_txid, v_max_txid);
+  END IF;
+  RETURN v_deleted;
+END;
+$$;
+
+-- Completado
+SELECT 'Calendar change log created successfully!' as result;
@@ -0,0 +1,260 @@
+-- Funciones RPC transaccionales para crear, actualizar e importar eventos del calendario.
+-- Cada llamada ejecuta en una sola transacción (y un solo round trip desde el backend):
+--   evento + recordatorios + pedido (Pedido / Factura Proforma) + vinculación
+--   + cierre del pedido (Factura Comisiones IBERFOODS).
+-- Si algo falla, no queda nada a medio escribir.
+-- Ejecutar después de add_orders_system.sql y add_event_reminders.sql
+
+-- Evento con sus recordatorios y su pedido (si existe) como JSON
+CREATE OR REPLACE FUNCTION calendar_event_with_relations(p_event calendar_events)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT to_jsonb(p_event)
+    || jsonb_build_object(
+      'reminders', COALESCE(
+        (SELECT jsonb_agg(to_jsonb(er) ORDER BY er.reminder_date)
+           FROM event_reminders er
+          WHERE er.event_id = p_event.id),
+        '[]'::jsonb
+      ),
+      'order', (SELECT to_jsonb(o) FROM orders o WHERE o.calendar_event_id = p_event.id LIMIT 1)
+    );
+$$;
+
+
+CREATE OR REPLACE FUNCTION create_calendar_event(p_event JSONB, p_reminders JSONB DEFAULT NULL)
+RETURNS SETOF JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_input calendar_events;
+  v_event calendar_events;
+  v_type_name TEXT;
+BEGIN
+  v_input := jsonb_populate_record(NULL::calendar_events, p_event);
+
+  INSERT INTO calendar_events (
+    title, description, fecha_inicio, fecha_fin, event_type_id, custom_fields,
+    order_number, client, supplier, amount, linked_order_id, created_by
+  )
+  VALUES (
+    v_input.title, v_input.description, v_input.fecha_inicio, v_input.fecha_fin,
+    v_input.event_type_id, COALESCE(v_input.custom_fields, '{}'::jsonb),
+    v_input.order_number, v_input.client, v_input.supplier, v_input.amount,
+    v_input.linked_order_id, v_input.created_by
+  )
+  RETURNING * INTO v_event;
+
+  IF jsonb_typeof(p_reminders) = 'array' THEN
+    INSERT INTO event_reminders (event_id, title, description, reminder_date)
+    SELECT v_event.id, r->>'title', r->>'description', (r->>'reminder_date')::timestamp
+      FROM jsonb_array_elements(p_reminders) AS r;
+  END IF;
+
+  SELECT name INTO v_type_name FROM event_types WHERE id = v_event.event_type_id;
+
+  -- Si el evento es tipo "Pedido" o "Factura Proforma", crear entrada en orders
+  IF v_type_name IN ('Pedido', 'Factura Proforma') THEN
+    INSERT INTO orders (calendar_event_id, order_number, supplier, client, amount, status, created_by)
+    VALUES (
+      v_event.id, COALESCE(v_event.order_number, ''), COALESCE(v_event.supplier, ''),
+      COALESCE(v_event.client, ''), v_event.amount, 'active', v_event.created_by
+    );
+  END IF;
+
+  -- Si el evento tiene linked_order_id, crear vinculación en event_links
+  IF v_event.linked_order_id IS NOT NULL THEN
+    INSERT INTO event_links (order_id, event_id) VALUES (v_event.linked_order_id, v_event.id);
+
+    -- Si es "Factura Comisiones IBERFOODS", marcar pedido como completado
+    IF v_type_name = 'Factura Comisiones IBERFOODS' THEN
+      UPDATE orders SET status = 'completed' WHERE id = v_event.linked_order_id;
+    END IF;
+  END IF;
+
+  RETURN NEXT calendar_event_with_relations(v_event);
+END;
+$$;
+
+
+-- p_reminders NULL: no tocar los recordatorios.
+-- p_reminders array: se aplica como diff contra los recordatorios actuales. Los elementos con
+-- "id" se actualizan solo si cambian; los que no traen id reutilizan un recordatorio idéntico
+-- o se insertan; los recordatorios que no aparecen se borran. El resultado incluye
+-- reminder_changes con los ids insertados, actualizados y borrados.
+CREATE OR REPLACE FUNCTION update_calendar_event(p_event_id UUID, p_event JSONB, p_reminders JSONB DEFAULT NULL)
+RETURNS SETOF JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_input calendar_events;
+  v_current calendar_events;
+  v_event calendar_events;
+  v_type_name TEXT;
+  v_reminder JSONB;
+  v_reminder_id UUID;
+  v_reminder_date TIMESTAMP;
+  v_keep UUID[] := ARRAY[]::UUID[];
+  v_inserted UUID[] := ARRAY[]::UUID[];
+  v_updated UUID[] := ARRAY[]::UUID[];
+  v_deleted UUID[] := ARRAY[]::UUID[];
+BEGIN
+  SELECT * INTO v_current FROM calendar_events WHERE id = p_event_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  v_input := jsonb_populate_record(NULL::calendar_events, p_event);
+
+  UPDATE calendar_events SET
+    title = v_input.title,
+    description = v_input.description,
+    fecha_inicio = v_input.fecha_inicio,
+    fecha_fin = v_input.fecha_fin,
+    event_type_id = v_input.event_type_id,
+    custom_fields = COALESCE(v_input.custom_fields, '{}'::jsonb),
+    order_number = v_input.order_number,
+    client = v_input.client,
+    supplier = v_input.supplier,
+    amount = v_input.amount,
+    linked_order_id = v_input.linked_order_id
+  WHERE id = p_event_id
+  RETURNING * INTO v_event;
+
+  IF jsonb_typeof(p_reminders) = 'array' THEN
+    -- Primero los que traen id, para que no los reclame un elemento sin id
+    FOR v_reminder IN
+      SELECT r FROM jsonb_array_elements(p_reminders) AS r ORDER BY (r->>'id') IS NULL
+    LOOP
+      v_reminder_id := NULLIF(v_reminder->>'id', '')::uuid;
+      v_reminder_date := (v_reminder->>'reminder_date')::timestamp;
+
+      IF v_reminder_id IS NOT NULL
+         AND EXISTS (SELECT 1 FROM event_reminders WHERE id = v_reminder_id AND event_id = p_event_id) THEN
+        UPDATE event_reminders SET
+          title = v_reminder->>'title',
+          description = v_reminder->>'description',
+          reminder_date = v_reminder_date
+        WHERE id = v_reminder_id
+          AND (title, description, reminder_date)
+              IS DISTINCT FROM (v_reminder->>'title', v_reminder->>'description', v_reminder_date);
+        IF FOUND THEN
+          v_updated := v_updated || v_reminder_id;
+        END IF;
+      ELSE
+        -- Sin id (o id ajeno al evento): reutilizar un recordatorio idéntico aún no asignado
+        SELECT id INTO v_reminder_id
+          FROM event_reminders
+         WHERE event_id = p_event_id
+           AND NOT (id = ANY(v_keep))
+           AND title = v_reminder->>'title'
+           AND description IS NOT DISTINCT FROM v_reminder->>'description'
+           AND reminder_date = v_reminder_date
+         LIMIT 1;
+
+        IF v_reminder_id IS NULL THEN
+          INSERT INTO event_reminders (event_id, title, description, reminder_date)
+          VALUES (p_event_id, v_reminder->>'title', v_reminder->>'description', v_reminder_date)
+          RETURNING id INTO v_reminder_id;
+          v_inserted := v_inserted || v_reminder_id;
+        END IF;
+      END IF;
+
+      v_keep := v_keep || v_reminder_id;
+    END LOOP;
+
+    WITH removed AS (
+      DELETE FROM event_reminders
+       WHERE event_id = p_event_id AND NOT (id = ANY(v_keep))
+      RETURNING id
+    )
+    SELECT COALESCE(array_agg(id), ARRAY[]::UUID[]) INTO v_deleted FROM removed;
+  END IF;
+
+  SELECT name INTO v_type_name FROM event_types WHERE id = v_event.event_type_id;
+
+  -- Si el evento es tipo "Pedido" o "Factura Proforma", actualizar en orders
+  IF v_type_name IN ('Pedido', 'Factura Proforma') THEN
+    UPDATE orders SET
+      order_number = COALESCE(v_event.order_number, ''),
+      supplier = COALESCE(v_event.supplier, ''),
+      client = COALESCE(v_event.client, ''),
+      amount = v_event.amount
+    WHERE calendar_event_id = p_event_id;
+  END IF;
+
+  -- Manejar cambios en linked_order_id
+  IF v_event.linked_order_id IS DISTINCT FROM v_current.linked_order_id THEN
+    IF v_current.linked_order_id IS NOT NULL THEN
+      DELETE FROM event_links WHERE event_id = p_event_id;
+    END IF;
+
+    IF v_event.linked_order_id IS NOT NULL THEN
+      INSERT INTO event_links (order_id, event_id) VALUES (v_event.linked_order_id, p_event_id);
+
+      IF v_type_name = 'Factura Comisiones IBERFOODS' THEN
+        UPDATE orders SET status = 'completed' WHERE id = v_event.linked_order_id;
+      END IF;
+    END IF;
+  END IF;
+
+  -- reminder_changes solo si se enviaron recordatorios (igual que el flujo por pasos)
+  RETURN NEXT calendar_event_with_relations(v_event) || jsonb_build_object(
+    'reminder_changes', CASE WHEN jsonb_typeof(p_reminders) = 'array' THEN jsonb_build_object(
+      'inserted', to_jsonb(v_inserted),
+      'updated', to_jsonb(v_updated),
+      'deleted', to_jsonb(v_deleted)
+    ) END
+  );
+END;
+$$;
+
+
+-- Importación masiva (POST /api/import/calendar): un bloque de eventos con sus
+-- recordatorios, pedidos, vínculos y pedidos completados en una sola transacción.
+-- El backend genera los ids y aplica las mismas reglas que create_calendar_event;
+-- si una fila falla (FK, tipo, longitud) no se inserta nada del bloque.
+CREATE OR REPLACE FUNCTION import_calendar_batch(
+  p_events JSONB,
+  p_reminders JSONB DEFAULT '[]',
+  p_orders JSONB DEFAULT '[]',
+  p_links JSONB DEFAULT '[]',
+  p_completed JSONB DEFAULT '[]'
+)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO calendar_events (
+    id, title, description, fecha_inicio, fecha_fin, event_type_id, custom_fields,
+    order_number, client, supplier, amount, linked_order_id, created_by
+  )
+  SELECT e.id, e.title, e.description, e.fecha_inicio, e.fecha_fin, e.event_type_id,
+         COALESCE(e.custom_fields, '{}'::jsonb),
+         e.order_number, e.client, e.supplier, e.amount, e.linked_order_id, e.created_by
+    FROM jsonb_populate_recordset(NULL::calendar_events, p_events) AS e;
+
+  INSERT INTO event_reminders (event_id, title, description, reminder_date)
+  SELECT r.event_id, r.title, r.description, r.reminder_date
+    FROM jsonb_populate_recordset(NULL::event_reminders, p_reminders) AS r;
+
+  INSERT INTO orders (id, calendar_event_id, order_number, supplier, client, amount, status, created_by)
+  SELECT o.id, o.calendar_event_id, o.order_number, o.supplier, o.client, o.amount,
+         COALESCE(o.status, 'active'), o.created_by
+    FROM jsonb_populate_recordset(NULL::orders, p_orders) AS o;
+
+  INSERT INTO event_links (order_id, event_id)
+  SELECT l.order_id, l.event_id
+    FROM jsonb_populate_recordset(NULL::event_links, p_links) AS l;
+
+  -- "Factura Comisiones IBERFOODS" vinculada: el pedido pasa a completado
+  UPDATE orders
+     SET status = 'completed'
+   WHERE id IN (SELECT value::uuid FROM jsonb_array_elements_text(p_completed));
+END;
+$$;
+
+-- Completado
+SELECT 'Calendar event RPC functions created successfully!' as result;
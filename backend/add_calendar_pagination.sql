@@ -0,0 +1,10 @@
+-- Índices para GET /calendar con ventana de fechas y paginación por cursor
+-- Ejecutar después de add_event_reminders.sql
+
+-- Orden estable (fecha_inicio, id) para la paginación keyset
+CREATE INDEX IF NOT EXISTS idx_calendar_events_start_id ON calendar_events(fecha_inicio, id);
+
+-- La ventana [from, to] usa idx_calendar_events_dates (fecha_inicio, fecha_fin)
+-- y los recordatorios dentro de la ventana usan idx_event_reminders_date
+CREATE INDEX IF NOT EXISTS idx_calendar_events_dates ON calendar_events(fecha_inicio, fecha_fin);
+CREATE INDEX IF NOT EXISTS idx_event_reminders_date ON event_reminders(reminder_date);
@@ -0,0 +1,12 @@
+-- Búsqueda por custom_fields para GET /api/calendar/search
+-- Índice GIN (jsonb_path_ops) para custom_fields @> '{"clave": valor}': resuelve
+-- cualquier combinación de claves de CALENDAR_SEARCH_FIELDS sin recorrer la tabla.
+-- Ejecutar después de add_calendar_pagination.sql
+
+CREATE INDEX IF NOT EXISTS idx_calendar_events_custom_fields
+  ON calendar_events USING GIN (custom_fields jsonb_path_ops);
+
+ANALYZE calendar_events;
+
+-- Completado
+SELECT 'Calendar search index created successfully!' as result;
@@ -0,0 +1,29 @@
+-- Ventana de fechas de GET /calendar (y de /export/calendar) resuelta en SQL: eventos
+-- que solapan [p_from, p_to] o con algún recordatorio dentro, en una sola consulta y
+-- sin lista de IDs en la URL (que además se truncaba con max-rows).
+-- PostgREST embebe los recordatorios y aplica el cursor, el orden y el límite sobre
+-- el resultado: GET /rpc/calendar_events_window?select=*,reminders:event_reminders(*)
+-- Ejecutar después de add_calendar_pagination.sql
+
+-- SQL STABLE de una sola sentencia: el planificador la expande en la consulta de
+-- PostgREST y usa idx_calendar_events_start_id para el orden y idx_event_reminders_date
+-- para el EXISTS (un único hashed SubPlan por consulta)
+CREATE OR REPLACE FUNCTION calendar_events_window(p_from DATE DEFAULT NULL, p_to DATE DEFAULT NULL)
+RETURNS SETOF calendar_events
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT e.*
+    FROM calendar_events e
+   WHERE ((p_to IS NULL OR e.fecha_inicio <= p_to) AND (p_from IS NULL OR e.fecha_fin >= p_from))
+      OR EXISTS (
+        SELECT 1
+          FROM event_reminders r
+         WHERE r.event_id = e.id
+           AND (p_from IS NULL OR r.reminder_date >= p_from)
+           AND (p_to IS NULL OR r.reminder_date < p_to + 1)
+      );
+$$;
+
+-- Completado
+SELECT 'Calendar window function created successfully!' as result;
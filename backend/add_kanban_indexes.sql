@@ -0,0 +1,30 @@
+-- Índices para GET /api/kanban: cada columna se lee ordenada por (position, id)
+-- con paginación por cursor, y los filtros se resuelven en la consulta.
+-- Ejecutar después de add_kanban_rank.sql
+
+-- Tareas sin clave (insertadas por versiones anteriores del backend): al final de su
+-- columna, para que la paginación por (position, id) pueda ser NOT NULL
+UPDATE kanban_tasks t
+   SET position = COALESCE(m.max_position, '') || kanban_rank_key(r.row_num * 1000, 4)
+  FROM (
+    SELECT id, status, ROW_NUMBER() OVER (PARTITION BY status ORDER BY created_at, id) AS row_num
+      FROM kanban_tasks
+     WHERE position IS NULL
+  ) r
+  LEFT JOIN (
+    SELECT status, max(position) AS max_position FROM kanban_tasks GROUP BY status
+  ) m ON m.status = r.status
+ WHERE t.id = r.id;
+
+ALTER TABLE kanban_tasks ALTER COLUMN position SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_kanban_tasks_status_position ON kanban_tasks(status, position, id);
+
+-- Filtros habituales del tablero ("mis tareas", por tipo) sin recorrer las tareas archivadas
+CREATE INDEX IF NOT EXISTS idx_kanban_tasks_assigned_status_position ON kanban_tasks(assigned_to, status, position, id);
+CREATE INDEX IF NOT EXISTS idx_kanban_tasks_type_status_position ON kanban_tasks(task_type_id, status, position, id);
+
+ANALYZE kanban_tasks;
+
+-- Completado
+SELECT 'Kanban indexes created successfully!' as result;
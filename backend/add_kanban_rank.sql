@@ -0,0 +1,219 @@
+-- Orden fraccional del Kanban: kanban_tasks.position pasa de INTEGER a una clave de texto
+-- (alfabeto 0-9A-Za-z, collation "C", nunca termina en '0'). Mover una tarjeta solo reescribe
+-- esa fila: su nueva clave se calcula entre las de sus vecinas, sin renumerar la columna.
+-- También crea kanban_apply_moves (PUT /api/kanban/batch) y create_kanban_task (POST
+-- /api/kanban), que renumeran la columna cuando las claves se alargan o se repiten.
+-- Ejecutar después de add_position_to_kanban.sql (o migrations_consolidated.sql)
+
+-- Valor entero -> clave de ancho fijo en base 62 sin ceros finales (conserva el orden)
+CREATE OR REPLACE FUNCTION kanban_rank_key(p_value BIGINT, p_width INT)
+RETURNS TEXT
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  v_digits CONSTANT TEXT := '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz';
+  v_key TEXT := '';
+BEGIN
+  FOR i IN 1..p_width LOOP
+    v_key := substr(v_digits, (p_value % 62)::int + 1, 1) || v_key;
+    p_value := p_value / 62;
+  END LOOP;
+  RETURN rtrim(v_key, '0');
+END;
+$$;
+
+ALTER TABLE kanban_tasks ADD COLUMN IF NOT EXISTS position INTEGER DEFAULT 0;
+
+DO $$
+BEGIN
+  IF (SELECT data_type FROM information_schema.columns
+       WHERE table_name = 'kanban_tasks' AND column_name = 'position') <> 'text' THEN
+    ALTER TABLE kanban_tasks ADD COLUMN position_key TEXT COLLATE "C";
+
+    -- Claves repartidas uniformemente en cada columna, respetando el orden actual
+    UPDATE kanban_tasks t
+       SET position_key = kanban_rank_key(r.slot, 4)
+      FROM (
+        SELECT id,
+               ROW_NUMBER() OVER w * (14776336 / (COUNT(*) OVER (PARTITION BY status) + 1)) AS slot
+          FROM kanban_tasks
+        WINDOW w AS (PARTITION BY status ORDER BY COALESCE(position, 0), created_at, id)
+      ) r
+     WHERE t.id = r.id;
+
+    ALTER TABLE kanban_tasks DROP COLUMN position;
+    ALTER TABLE kanban_tasks RENAME COLUMN position_key TO position;
+  END IF;
+END $$;
+
+
+-- Clave para añadir al final de una columna (igual que rank_key_after en server.py)
+CREATE OR REPLACE FUNCTION kanban_rank_after(p_key TEXT)
+RETURNS TEXT
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  v_digits CONSTANT TEXT := '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz';
+BEGIN
+  IF p_key IS NULL OR p_key = '' THEN
+    RETURN 'V';
+  END IF;
+  FOR i IN 1..length(p_key) LOOP
+    IF substr(p_key, i, 1) <> 'z' THEN
+      RETURN substr(p_key, 1, i - 1) || substr(v_digits, strpos(v_digits, substr(p_key, i, 1)) + 1, 1);
+    END IF;
+  END LOOP;
+  RETURN p_key || '1';
+END;
+$$;
+
+-- Serializa las escrituras de orden en las columnas indicadas (hasta el COMMIT). Se
+-- bloquean siempre en el mismo orden para no provocar interbloqueos.
+CREATE OR REPLACE FUNCTION kanban_lock_columns(p_statuses TEXT[])
+RETURNS VOID
+LANGUAGE sql
+AS $$
+  SELECT pg_advisory_xact_lock(hashtext('kanban_tasks:' || s))
+    FROM (SELECT DISTINCT unnest(p_statuses) AS s ORDER BY 1) statuses;
+$$;
+
+-- Reparte de nuevo las claves de una columna a intervalos iguales (conserva el orden
+-- actual, desempatando por id). Deja al menos 62² claves libres entre vecinas.
+-- Mantenimiento manual: SELECT kanban_renormalize('todo');
+CREATE OR REPLACE FUNCTION kanban_renormalize(p_status TEXT)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_count BIGINT;
+  v_width INT := 4;
+BEGIN
+  SELECT count(*) INTO v_count FROM kanban_tasks WHERE status = p_status;
+  WHILE power(62, v_width) < (v_count + 1) * 3844 LOOP
+    v_width := v_width + 1;
+  END LOOP;
+
+  UPDATE kanban_tasks t
+     SET position = kanban_rank_key(r.slot, v_width)
+    FROM (
+      SELECT id,
+             ROW_NUMBER() OVER (ORDER BY position NULLS LAST, id) * (power(62, v_width)::bigint / (v_count + 1)) AS slot
+        FROM kanban_tasks
+       WHERE status = p_status
+    ) r
+   WHERE t.id = r.id;
+END;
+$$;
+
+-- Columnas en las que alguna de las tareas indicadas tiene una clave demasiado larga
+-- (más de 48 caracteres; el backend admite hasta 64) o repetida por otra tarea
+CREATE OR REPLACE FUNCTION kanban_columns_to_renormalize(p_ids UUID[])
+RETURNS TEXT[]
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT COALESCE(array_agg(DISTINCT t.status), ARRAY[]::TEXT[])
+    FROM kanban_tasks t
+   WHERE t.id = ANY(p_ids)
+     AND (length(t.position) > 48
+          OR EXISTS (
+            SELECT 1 FROM kanban_tasks o
+             WHERE o.status = t.status AND o.position = t.position AND o.id <> t.id
+          ));
+$$;
+
+-- Aplica varios {id, status, position} en un solo UPDATE. Todo o nada: si algún id no
+-- existe no se modifica ninguna fila y no devuelve nada. Devuelve las tareas movidas y,
+-- si hubo que renumerar alguna columna, también el resto de tareas de esa columna.
+CREATE OR REPLACE FUNCTION kanban_apply_moves(p_changes JSONB)
+RETURNS SETOF kanban_tasks
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_ids UUID[];
+  v_found INT;
+  v_renormalize TEXT[];
+BEGIN
+  SELECT array_agg(DISTINCT c.id) INTO v_ids
+    FROM jsonb_to_recordset(p_changes) AS c(id UUID);
+
+  -- Columnas de origen y de destino
+  PERFORM kanban_lock_columns(ARRAY(
+    SELECT status FROM kanban_tasks WHERE id = ANY(v_ids)
+    UNION
+    SELECT c.status FROM jsonb_to_recordset(p_changes) AS c(status TEXT) WHERE c.status IS NOT NULL
+  ));
+
+  SELECT count(*) INTO v_found FROM kanban_tasks WHERE id = ANY(v_ids);
+  IF v_found <> cardinality(v_ids) THEN
+    RETURN;
+  END IF;
+
+  UPDATE kanban_tasks t
+     SET status = COALESCE(c.status, t.status),
+         position = COALESCE(c.position, t.position)
+    FROM jsonb_to_recordset(p_changes) AS c(id UUID, status TEXT, position TEXT)
+   WHERE t.id = c.id;
+
+  v_renormalize := kanban_columns_to_renormalize(v_ids);
+  PERFORM kanban_renormalize(s) FROM unnest(v_renormalize) AS s;
+
+  RETURN QUERY
+  SELECT * FROM kanban_tasks
+   WHERE id = ANY(v_ids) OR status = ANY(v_renormalize)
+   ORDER BY status, position, id;
+END;
+$$;
+
+-- Crea una tarea; sin position la añade al final de su columna. El bloqueo de la columna
+-- evita que dos altas simultáneas calculen la misma clave. Devuelve la tarea creada en
+-- la primera fila y, si hubo que renumerar la columna, después el resto de sus tareas.
+CREATE OR REPLACE FUNCTION create_kanban_task(p_task JSONB)
+RETURNS SETOF kanban_tasks
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_input kanban_tasks;
+  v_task kanban_tasks;
+BEGIN
+  v_input := jsonb_populate_record(NULL::kanban_tasks, p_task);
+  v_input.status := COALESCE(v_input.status, 'todo');
+  PERFORM kanban_lock_columns(ARRAY[v_input.status]);
+
+  IF v_input.position IS NULL THEN
+    SELECT kanban_rank_after(max(position)) INTO v_input.position
+      FROM kanban_tasks
+     WHERE status = v_input.status;
+  END IF;
+
+  INSERT INTO kanban_tasks (title, description, status, assigned_to, priority, task_type_id, position, created_by)
+  VALUES (
+    v_input.title, v_input.description, v_input.status, v_input.assigned_to,
+    COALESCE(v_input.priority, 'medium'), v_input.task_type_id, v_input.position, v_input.created_by
+  )
+  RETURNING * INTO v_task;
+
+  IF cardinality(kanban_columns_to_renormalize(ARRAY[v_task.id])) > 0 THEN
+    PERFORM kanban_renormalize(v_task.status);
+    RETURN QUERY SELECT * FROM kanban_tasks WHERE id = v_task.id;
+    RETURN QUERY SELECT * FROM kanban_tasks WHERE status = v_task.status AND id <> v_task.id ORDER BY position, id;
+  ELSE
+    RETURN NEXT v_task;
+  END IF;
+END;
+$$;
+
+-- Corrige las claves repetidas (altas simultáneas anteriores a create_kanban_task) o
+-- demasiado largas que ya estén en la tabla
+SELECT kanban_renormalize(status)
+  FROM (
+    SELECT DISTINCT status
+      FROM kanban_tasks
+     GROUP BY status, position
+    HAVING count(*) > 1 OR max(length(position)) > 48
+  ) columns_to_fix;
+
+-- Completado
+SELECT 'Kanban fractional ordering created successfully!' as result;
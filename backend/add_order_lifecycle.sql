@@ -0,0 +1,210 @@
+-- Ciclo de vida de cada pedido: una fila por pedido en order_lifecycle con la fecha de
+-- cada documento (Pedido, Albarán, Factura Proforma, Factura, Factura Comisiones
+-- IBERFOODS) y el número de eventos vinculados. Los triggers la recalculan solo para
+-- los pedidos afectados al escribir orders, event_links o calendar_events, así el
+-- sidebar (embebido en GET /api/orders) y los informes leen una fila indexada.
+-- Ejecutar después de add_order_reports.sql
+
+CREATE TABLE IF NOT EXISTS order_lifecycle (
+  order_id UUID PRIMARY KEY REFERENCES orders(id) ON DELETE CASCADE,
+  order_number VARCHAR(100) NOT NULL,
+  client VARCHAR(255) NOT NULL,
+  supplier VARCHAR(255) NOT NULL,
+  amount DECIMAL(10,2),
+  status VARCHAR(20),
+  -- Fecha del evento que creó el pedido (o la de alta si ya no existe)
+  order_date DATE NOT NULL,
+  -- Primera fecha de cada documento, entre el evento del pedido y los vinculados
+  pedido_at DATE,
+  albaran_at DATE,
+  factura_proforma_at DATE,
+  factura_at DATE,
+  factura_comisiones_at DATE,
+  linked_events INT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_lifecycle_date ON order_lifecycle(order_date);
+CREATE INDEX IF NOT EXISTS idx_order_lifecycle_status ON order_lifecycle(status, order_date);
+
+-- Recalcula (upsert) las filas de los pedidos indicados; los borrados desaparecen por
+-- el ON DELETE CASCADE. Los índices de event_links(order_id) y calendar_events(id)
+-- hacen que cada pedido cueste unas pocas lecturas.
+CREATE OR REPLACE FUNCTION refresh_order_lifecycle(p_order_ids UUID[])
+RETURNS VOID
+LANGUAGE sql
+AS $$
+  INSERT INTO order_lifecycle AS ol (
+    order_id, order_number, client, supplier, amount, status, order_date,
+    pedido_at, albaran_at, factura_proforma_at, factura_at, factura_comisiones_at,
+    linked_events, updated_at
+  )
+  SELECT o.id, o.order_number, o.client, o.supplier, o.amount, o.status,
+         COALESCE(e.fecha_inicio, o.created_at::date),
+         d.pedido_at, d.albaran_at, d.factura_proforma_at, d.factura_at, d.factura_comisiones_at,
+         COALESCE(d.linked_events, 0), NOW()
+    FROM orders o
+    LEFT JOIN calendar_events e ON e.id = o.calendar_event_id
+    LEFT JOIN LATERAL (
+      SELECT min(ce.fecha_inicio) FILTER (WHERE et.name = 'Pedido') AS pedido_at,
+             min(ce.fecha_inicio) FILTER (WHERE et.name = 'Albarán') AS albaran_at,
+             min(ce.fecha_inicio) FILTER (WHERE et.name = 'Factura Proforma') AS factura_proforma_at,
+             min(ce.fecha_inicio) FILTER (WHERE et.name = 'Factura') AS factura_at,
+             min(ce.fecha_inicio) FILTER (WHERE et.name = 'Factura Comisiones IBERFOODS') AS factura_comisiones_at,
+             count(*) FILTER (WHERE docs.linked) AS linked_events
+        FROM (
+          SELECT o.calendar_event_id AS event_id, FALSE AS linked
+          UNION ALL
+          SELECT l.event_id, TRUE FROM event_links l WHERE l.order_id = o.id
+        ) docs
+        JOIN calendar_events ce ON ce.id = docs.event_id
+        JOIN event_types et ON et.id = ce.event_type_id
+    ) d ON TRUE
+   WHERE o.id = ANY(p_order_ids)
+  ON CONFLICT (order_id) DO UPDATE SET
+    order_number = EXCLUDED.order_number,
+    client = EXCLUDED.client,
+    supplier = EXCLUDED.supplier,
+    amount = EXCLUDED.amount,
+    status = EXCLUDED.status,
+    order_date = EXCLUDED.order_date,
+    pedido_at = EXCLUDED.pedido_at,
+    albaran_at = EXCLUDED.albaran_at,
+    factura_proforma_at = EXCLUDED.factura_proforma_at,
+    factura_at = EXCLUDED.factura_at,
+    factura_comisiones_at = EXCLUDED.factura_comisiones_at,
+    linked_events = EXCLUDED.linked_events,
+    updated_at = EXCLUDED.updated_at;
+$$;
+
+-- Triggers por sentencia con tablas de transición: un UPDATE o una importación masiva
+-- recalcula cada pedido afectado una sola vez
+CREATE OR REPLACE FUNCTION order_lifecycle_from_orders()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_order_lifecycle(ARRAY(SELECT id FROM new_rows));
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION order_lifecycle_from_links()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM refresh_order_lifecycle(ARRAY(SELECT DISTINCT order_id FROM new_rows));
+  ELSE
+    -- Al borrar un pedido, sus vínculos caen en cascada: el pedido ya no existe y no
+    -- se inserta nada
+    PERFORM refresh_order_lifecycle(ARRAY(SELECT DISTINCT order_id FROM old_rows));
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+-- Cambiar la fecha o el tipo de un evento cambia el ciclo de los pedidos que creó o a
+-- los que está vinculado. Trigger por fila con WHEN: el resto de actualizaciones del
+-- calendario no lo ejecutan. Borrar un evento no necesita trigger propio: sus vínculos
+-- (y los pedidos que creó) se borran en cascada.
+CREATE OR REPLACE FUNCTION order_lifecycle_from_events()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM refresh_order_lifecycle(ARRAY(
+    SELECT id FROM orders WHERE calendar_event_id = NEW.id
+    UNION
+    SELECT order_id FROM event_links WHERE event_id = NEW.id
+  ));
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS order_lifecycle_orders_insert ON orders;
+CREATE TRIGGER order_lifecycle_orders_insert
+  AFTER INSERT ON orders
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION order_lifecycle_from_orders();
+
+DROP TRIGGER IF EXISTS order_lifecycle_orders_update ON orders;
+CREATE TRIGGER order_lifecycle_orders_update
+  AFTER UPDATE ON orders
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION order_lifecycle_from_orders();
+
+DROP TRIGGER IF EXISTS order_lifecycle_links_insert ON event_links;
+CREATE TRIGGER order_lifecycle_links_insert
+  AFTER INSERT ON event_links
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION order_lifecycle_from_links();
+
+DROP TRIGGER IF EXISTS order_lifecycle_links_delete ON event_links;
+CREATE TRIGGER order_lifecycle_links_delete
+  AFTER DELETE ON event_links
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION order_lifecycle_from_links();
+
+DROP TRIGGER IF EXISTS order_lifecycle_events_update ON calendar_events;
+CREATE TRIGGER order_lifecycle_events_update
+  AFTER UPDATE OF fecha_inicio, event_type_id ON calendar_events
+  FOR EACH ROW
+  WHEN (OLD.fecha_inicio IS DISTINCT FROM NEW.fecha_inicio OR OLD.event_type_id IS DISTINCT FROM NEW.event_type_id)
+  EXECUTE FUNCTION order_lifecycle_from_events();
+
+-- Carga inicial (y reconstrucción completa si alguna vez se renombra un tipo de evento)
+SELECT refresh_order_lifecycle(ARRAY(SELECT id FROM orders));
+
+ANALYZE order_lifecycle;
+
+
+-- El informe de pedidos pasa a leer order_lifecycle: una fila por pedido, sin
+-- agregar event_links ni calendar_events en cada consulta
+CREATE OR REPLACE FUNCTION order_report(
+  p_group_by TEXT[],
+  p_from DATE DEFAULT NULL,
+  p_to DATE DEFAULT NULL,
+  p_statuses TEXT[] DEFAULT NULL
+)
+RETURNS TABLE (
+  client TEXT,
+  supplier TEXT,
+  month DATE,
+  status TEXT,
+  orders BIGINT,
+  total_amount NUMERIC,
+  avg_amount NUMERIC,
+  commissioned BIGINT,
+  avg_days_to_commission NUMERIC,
+  max_days_to_commission INT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH lifecycle AS (
+    SELECT l.*, l.factura_comisiones_at - l.order_date AS days_to_commission
+      FROM order_lifecycle l
+     WHERE (p_from IS NULL OR l.order_date >= p_from)
+       AND (p_to IS NULL OR l.order_date <= p_to)
+       AND (p_statuses IS NULL OR l.status = ANY(p_statuses))
+  )
+  SELECT
+    CASE WHEN 'client' = ANY(p_group_by) THEN l.client END::text AS client,
+    CASE WHEN 'supplier' = ANY(p_group_by) THEN l.supplier END::text AS supplier,
+    CASE WHEN 'month' = ANY(p_group_by) THEN date_trunc('month', l.order_date)::date END AS month,
+    CASE WHEN 'status' = ANY(p_group_by) THEN l.status END::text AS status,
+    count(*) AS orders,
+    COALESCE(sum(l.amount), 0) AS total_amount,
+    round(avg(l.amount), 2) AS avg_amount,
+    count(l.days_to_commission) AS commissioned,
+    round(avg(l.days_to_commission), 1) AS avg_days_to_commission,
+    max(l.days_to_commission) AS max_days_to_commission
+  FROM lifecycle l
+  GROUP BY 1, 2, 3, 4
+  ORDER BY 3 NULLS FIRST, 1 NULLS FIRST, 2 NULLS FIRST, 4 NULLS FIRST;
+$$;
+
+-- Completado
+SELECT 'Order lifecycle created successfully!' as result;
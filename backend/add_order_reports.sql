@@ -0,0 +1,65 @@
+-- Informe agregado de pedidos para GET /api/reports/orders.
+-- Agrupa por cualquier combinación de client, supplier, month y status (las dimensiones no
+-- pedidas quedan a NULL) con count/sum/avg de amount y el tiempo hasta la factura de
+-- comisiones: días entre el evento del pedido y el primer evento
+-- "Factura Comisiones IBERFOODS" vinculado al pedido en event_links.
+-- Ejecutar después de add_orders_system.sql
+
+CREATE OR REPLACE FUNCTION order_report(
+  p_group_by TEXT[],
+  p_from DATE DEFAULT NULL,
+  p_to DATE DEFAULT NULL,
+  p_statuses TEXT[] DEFAULT NULL
+)
+RETURNS TABLE (
+  client TEXT,
+  supplier TEXT,
+  month DATE,
+  status TEXT,
+  orders BIGINT,
+  total_amount NUMERIC,
+  avg_amount NUMERIC,
+  commissioned BIGINT,
+  avg_days_to_commission NUMERIC,
+  max_days_to_commission INT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH commission AS (
+    SELECT l.order_id, min(ce.fecha_inicio) AS invoiced_on
+      FROM event_links l
+      JOIN calendar_events ce ON ce.id = l.event_id
+      JOIN event_types et ON et.id = ce.event_type_id
+     WHERE et.name = 'Factura Comisiones IBERFOODS'
+     GROUP BY l.order_id
+  ),
+  lifecycle AS (
+    -- Fecha del pedido: la del evento que lo creó (o la de alta si ya no existe)
+    SELECT o.*, COALESCE(e.fecha_inicio, o.created_at::date) AS order_date,
+           c.invoiced_on - COALESCE(e.fecha_inicio, o.created_at::date) AS days_to_commission
+      FROM orders o
+      LEFT JOIN calendar_events e ON e.id = o.calendar_event_id
+      LEFT JOIN commission c ON c.order_id = o.id
+     WHERE (p_from IS NULL OR COALESCE(e.fecha_inicio, o.created_at::date) >= p_from)
+       AND (p_to IS NULL OR COALESCE(e.fecha_inicio, o.created_at::date) <= p_to)
+       AND (p_statuses IS NULL OR o.status = ANY(p_statuses))
+  )
+  SELECT
+    CASE WHEN 'client' = ANY(p_group_by) THEN l.client END::text AS client,
+    CASE WHEN 'supplier' = ANY(p_group_by) THEN l.supplier END::text AS supplier,
+    CASE WHEN 'month' = ANY(p_group_by) THEN date_trunc('month', l.order_date)::date END AS month,
+    CASE WHEN 'status' = ANY(p_group_by) THEN l.status END::text AS status,
+    count(*) AS orders,
+    COALESCE(sum(l.amount), 0) AS total_amount,
+    round(avg(l.amount), 2) AS avg_amount,
+    count(l.days_to_commission) AS commissioned,
+    round(avg(l.days_to_commission), 1) AS avg_days_to_commission,
+    max(l.days_to_commission) AS max_days_to_commission
+  FROM lifecycle l
+  GROUP BY 1, 2, 3, 4
+  ORDER BY 3 NULLS FIRST, 1 NULLS FIRST, 2 NULLS FIRST, 4 NULLS FIRST;
+$$;
+
+-- Completado
+SELECT 'Order report function created successfully!' as result;
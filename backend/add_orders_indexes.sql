@@ -0,0 +1,16 @@
+-- Índices para GET /api/orders filtrado y paginado por cursor (created_at, id).
+-- El estado siempre se filtra (por defecto 'active'), por eso va primero; cliente y
+-- proveedor se resuelven con su propio índice sin recorrer el histórico.
+-- Ejecutar después de add_orders_system.sql
+
+CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_status_client_created ON orders(status, client, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_status_supplier_created ON orders(status, supplier, created_at, id);
+
+-- Sustituido por idx_orders_status_created
+DROP INDEX IF EXISTS idx_orders_status;
+
+ANALYZE orders;
+
+-- Completado
+SELECT 'Orders indexes created successfully!' as result;
@@ -0,0 +1,30 @@
+-- Eventos pendientes (GET /api/pending-events) con una sola consulta indexada.
+-- custom_fields.is_pending se normaliza a booleano JSON y se expone como columna
+-- generada calendar_events.is_pending, indexada junto con el orden del listado.
+-- Ejecutar después de add_calendar_pagination.sql
+
+-- Conversión única: "true"/true -> true; cualquier otro valor se elimina
+-- (el frontend solo envía is_pending cuando el evento está pendiente)
+UPDATE calendar_events
+   SET custom_fields = CASE
+         WHEN custom_fields->>'is_pending' = 'true' THEN custom_fields || '{"is_pending": true}'::jsonb
+         ELSE custom_fields - 'is_pending'
+       END
+ WHERE custom_fields ? 'is_pending'
+   AND custom_fields->'is_pending' IS DISTINCT FROM 'true'::jsonb;
+
+-- Se mantiene sola al escribir custom_fields (rutas, RPC y resolución del pendiente)
+ALTER TABLE calendar_events
+  ADD COLUMN IF NOT EXISTS is_pending BOOLEAN
+  GENERATED ALWAYS AS (COALESCE(custom_fields->>'is_pending' = 'true', FALSE)) STORED;
+
+-- Índice completo y no parcial: PostgREST envía el filtro como parámetro
+-- (is_pending = $1) y con un plan genérico el índice parcial no se usaría.
+-- El orden del listado sale del propio índice.
+CREATE INDEX IF NOT EXISTS idx_calendar_events_pending
+  ON calendar_events(is_pending, fecha_inicio, id);
+
+ANALYZE calendar_events;
+
+-- Completado
+SELECT 'Pending events index created successfully!' as result;
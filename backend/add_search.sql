@@ -0,0 +1,152 @@
+-- Búsqueda de texto completo (GET /api/search?q=) en eventos, pedidos y tareas.
+-- Cada tabla tiene una columna generada search_vector (configuración spanish, sin acentos)
+-- con índice GIN; search_all ordena por relevancia y pagina por cursor (rank, type, id).
+-- Ejecutar después de add_orders_system.sql y migrations_consolidated.sql
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() no es IMMUTABLE (depende del search_path): envoltorio con el esquema y el
+-- diccionario fijos para poder usarlo en columnas generadas e índices
+DO $$
+DECLARE
+  v_schema TEXT;
+BEGIN
+  SELECT n.nspname INTO v_schema
+    FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+   WHERE e.extname = 'unaccent';
+
+  EXECUTE format(
+    'CREATE OR REPLACE FUNCTION f_unaccent(TEXT) RETURNS TEXT LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT '
+    'AS $f$ SELECT %I.unaccent(%L::regdictionary, $1) $f$',
+    v_schema, v_schema || '.unaccent'
+  );
+END $$;
+
+-- Texto normalizado para indexar y para buscar: sin acentos y con los separadores como
+-- espacios, así "P-000123" son las palabras "p" y "000123" (el parser leería "-000123").
+-- Cuerpo SQL estándar (RETURN, PostgreSQL 14+): f_unaccent se resuelve al crearla y no
+-- depende del search_path, que pg_dump/pg_restore dejan vacío al recalcular las
+-- columnas generadas.
+CREATE OR REPLACE FUNCTION search_text(TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE PARALLEL SAFE STRICT
+RETURN regexp_replace(f_unaccent($1), '[^[:alnum:]]+', ' ', 'g');
+
+-- Peso A: lo que se busca por identificador (título, número de pedido);
+-- B: cliente y proveedor; C: descripción. Se concatena con || porque concat_ws
+-- no es IMMUTABLE y no se admite en columnas generadas
+ALTER TABLE calendar_events
+  ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('spanish', search_text(COALESCE(title, '') || ' ' || COALESCE(order_number, ''))), 'A')
+    || setweight(to_tsvector('spanish', search_text(COALESCE(client, '') || ' ' || COALESCE(supplier, ''))), 'B')
+    || setweight(to_tsvector('spanish', search_text(COALESCE(description, ''))), 'C')
+  ) STORED;
+
+ALTER TABLE orders
+  ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('spanish', search_text(COALESCE(order_number, ''))), 'A')
+    || setweight(to_tsvector('spanish', search_text(COALESCE(client, '') || ' ' || COALESCE(supplier, ''))), 'B')
+  ) STORED;
+
+ALTER TABLE kanban_tasks
+  ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('spanish', search_text(COALESCE(title, ''))), 'A')
+    || setweight(to_tsvector('spanish', search_text(COALESCE(description, ''))), 'C')
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_calendar_events_search ON calendar_events USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_orders_search ON orders USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_kanban_tasks_search ON kanban_tasks USING GIN (search_vector);
+
+
+-- Texto del usuario -> tsquery: cada palabra pasa por el mismo análisis que al indexar
+-- (spanish, sin stopwords) y se busca como prefijo ("ped" encuentra "pedido"); todas
+-- son obligatorias. El cast directo a tsquery evita volver a lematizar los lexemas
+-- (tras search_text solo contienen letras y dígitos).
+CREATE OR REPLACE FUNCTION search_tsquery(p_query TEXT)
+RETURNS TSQUERY
+LANGUAGE sql
+IMMUTABLE
+RETURN (
+  SELECT string_agg(lexeme || ':*', ' & ')::tsquery
+    FROM unnest(to_tsvector('spanish', search_text(p_query)))
+);
+
+
+-- Solo se calcula (type, id, rank) para las coincidencias; los datos a mostrar y
+-- ts_headline (caro) se obtienen después, para las filas de la página.
+-- p_max_candidates acota las coincidencias por tabla que pasan a la paginación: las N
+-- de mayor relevancia (desempate por id), así cada página parte del mismo conjunto.
+CREATE OR REPLACE FUNCTION search_all(
+  p_query TEXT,
+  p_types TEXT[],
+  p_limit INT,
+  p_after_rank REAL DEFAULT NULL,
+  p_after_type TEXT DEFAULT NULL,
+  p_after_id UUID DEFAULT NULL,
+  p_max_candidates INT DEFAULT 5000
+)
+RETURNS TABLE (type TEXT, id UUID, title TEXT, subtitle TEXT, date TEXT, rank REAL, headline TEXT)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH q AS (
+    SELECT search_tsquery(p_query) AS query
+  ),
+  matches AS (
+    (SELECT 'event'::text AS type, e.id, ts_rank(e.search_vector, q.query) AS rank
+       FROM calendar_events e, q
+      WHERE 'event' = ANY(p_types) AND e.search_vector @@ q.query
+      ORDER BY 3 DESC, 2
+      LIMIT p_max_candidates)
+    UNION ALL
+    (SELECT 'order', o.id, ts_rank(o.search_vector, q.query)
+       FROM orders o, q
+      WHERE 'order' = ANY(p_types) AND o.search_vector @@ q.query
+      ORDER BY 3 DESC, 2
+      LIMIT p_max_candidates)
+    UNION ALL
+    (SELECT 'task', t.id, ts_rank(t.search_vector, q.query)
+       FROM kanban_tasks t, q
+      WHERE 'task' = ANY(p_types) AND t.search_vector @@ q.query
+      ORDER BY 3 DESC, 2
+      LIMIT p_max_candidates)
+  ),
+  page AS (
+    SELECT *
+      FROM matches m
+     WHERE p_after_rank IS NULL
+        OR m.rank < p_after_rank
+        OR (m.rank = p_after_rank AND (m.type, m.id) > (p_after_type, p_after_id))
+     ORDER BY m.rank DESC, m.type, m.id
+     LIMIT p_limit
+  ),
+  rows AS (
+    SELECT p.type, p.id, p.rank,
+           COALESCE(e.title, o.order_number, t.title) AS title,
+           CASE p.type
+             WHEN 'event' THEN concat_ws(' · ', e.order_number, e.client, e.supplier)
+             WHEN 'order' THEN concat_ws(' · ', o.client, o.supplier)
+             ELSE t.status
+           END AS subtitle,
+           COALESCE(e.fecha_inicio::text, o.created_at::text, t.created_at::text) AS date,
+           COALESCE(e.description, t.description) AS body
+      FROM page p
+      LEFT JOIN calendar_events e ON p.type = 'event' AND e.id = p.id
+      LEFT JOIN orders o ON p.type = 'order' AND o.id = p.id
+      LEFT JOIN kanban_tasks t ON p.type = 'task' AND t.id = p.id
+  )
+  SELECT r.type, r.id, r.title, NULLIF(r.subtitle, ''), r.date, r.rank,
+         CASE WHEN r.body <> '' THEN
+           ts_headline('spanish', r.body, (SELECT query FROM q), 'MaxWords=20, MinWords=5, StartSel=<b>, StopSel=</b>')
+         END
+    FROM rows r
+   ORDER BY r.rank DESC, r.type, r.id;
+$$;
+
+-- Completado
+SELECT 'Full-text search created successfully!' as result;
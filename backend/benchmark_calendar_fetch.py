@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark: eventos + recordatorios en dos consultas (IN con todos los ids)
+frente a una sola consulta con embebido PostgREST, para 1k/10k/100k eventos.
+"""
+import os
+import sys
+import time
+import asyncio
+import statistics
+from dotenv import load_dotenv
+from supabase import acreate_client
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
+SIZES = [int(size) for size in os.getenv('BENCHMARK_EVENT_COUNTS', '1000,10000,100000').split(',')]
+REPEAT = int(os.getenv('BENCHMARK_REPEAT', '5'))
+PAGE_SIZE = 1000  # max-rows habitual de PostgREST en Supabase
+
+if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+    print("❌ Error: Falta configuración de Supabase en .env")
+    sys.exit(1)
+
+
+async def fetch_pages(supabase, columns, total):
+    rows = []
+    for offset in range(0, total, PAGE_SIZE):
+        end = min(offset + PAGE_SIZE, total) - 1
+        result = await supabase.table('calendar_events').select(columns).order('fecha_inicio').order('id').range(offset, end).execute()
+        rows.extend(result.data or [])
+        if len(result.data or []) < end - offset + 1:
+            break
+    return rows
+
+
+async def two_step(supabase, total):
+    events = await fetch_pages(supabase, '*', total)
+    event_ids = [event['id'] for event in events]
+    reminders = []
+    # El IN (...) completo supera el límite de URL; se trocea como haría el cliente
+    for start in range(0, len(event_ids), 200):
+        result = await supabase.table('event_reminders').select('*').in_('event_id', event_ids[start:start + 200]).execute()
+        reminders.extend(result.data or [])
+    return len(events)
+
+
+async def embedded(supabase, total):
+    events = await fetch_pages(supabase, '*,reminders:event_reminders(*)', total)
+    return len(events)
+
+
+async def measure(label, func, supabase, total):
+    timings = []
+    fetched = 0
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fetched = await func(supabase, total)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"   {label:<10} {fetched:>7} eventos  mediana={statistics.median(timings):8.1f}ms  max={max(timings):8.1f}ms")
+    return fetched
+
+
+async def main():
+    print("🚀 Benchmark de GET /calendar: dos consultas vs embebido\n")
+    supabase = await acreate_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+    for total in SIZES:
+        print(f"📊 {total} eventos")
+        fetched = await measure("two-step", two_step, supabase, total)
+        await measure("embedded", embedded, supabase, total)
+        if fetched < total:
+            print(f"   ⚠️  La tabla solo tiene {fetched} eventos; carga más datos para medir este tamaño")
+        print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark: coste de serializar GET /calendar por cada 10k eventos.
+Compara la ruta por defecto de FastAPI (validar contra response_model + json)
+con FAST_JSON_RESPONSES (filas del repositorio sin validar + orjson).
+No consulta Supabase: los eventos son sintéticos, con dos recordatorios cada uno.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import statistics
+from typing import List
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+load_dotenv()
+
+SIZES = [int(size) for size in os.getenv('BENCHMARK_EVENT_COUNTS', '1000,10000,100000').split(',')]
+REPEAT = int(os.getenv('BENCHMARK_REPEAT', '5'))
+
+if not os.getenv('SUPABASE_URL') or not os.getenv('SUPABASE_SERVICE_KEY'):
+    print("❌ Error: Falta configuración de Supabase en .env")
+    sys.exit(1)
+
+from server import CALENDAR_TRUSTED_DEFAULTS, CalendarEvent, complete_trusted_rows  # noqa: E402
+
+
+def make_events(total):
+    events = []
+    for index in range(total):
+        event_id = str(uuid.uuid4())
+        day = f"2025-{index % 12 + 1:02d}-{index % 28 + 1:02d}"
+        events.append({
+            'id': event_id,
+            'title': f'Pedido {index}',
+            'description': 'Entrega de mercancía en almacén',
+            'fecha_inicio': day,
+            'fecha_fin': day,
+            'event_type_id': str(uuid.uuid4()),
+            'custom_fields': {'is_pending': index % 10 == 0, 'referencia': f'REF-{index}'},
+            'created_by': str(uuid.uuid4()),
+            'created_at': f'{day}T09:00:00+00:00',
+            'order_number': f'P-{index:06d}',
+            'client': 'Cliente SA',
+            'supplier': 'Proveedor SL',
+            'amount': 1250.5 + index,
+            'linked_order_id': None,
+            # Mismo orden de columnas que CALENDAR_TRUSTED_SELECT
+            'reminders': [
+                {
+                    'title': f'Recordatorio {n}',
+                    'description': None,
+                    'reminder_date': f'{day}T08:00:00',
+                    'id': str(uuid.uuid4()),
+                    'event_id': event_id,
+                    'created_at': f'{day}T09:00:00+00:00',
+                }
+                for n in range(2)
+            ],
+        })
+    return events
+
+
+RESPONSE_FIELD = create_response_field(name='Response_get_events', type_=List[CalendarEvent])
+
+
+async def validated(events, response_class):
+    """Ruta por defecto: validación contra response_model y después el render"""
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=events, is_coroutine=True)
+    return response_class(content).body
+
+
+async def trusted(events, response_class):
+    """FAST_JSON_RESPONSES: las filas ya tienen la forma de la respuesta"""
+    return response_class(complete_trusted_rows(events, CALENDAR_TRUSTED_DEFAULTS)).body
+
+
+async def measure(label, func, events, response_class):
+    timings = []
+    body = b''
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        body = await func(events, response_class)
+        timings.append((time.perf_counter() - started) * 1000)
+    per_10k = statistics.median(timings) * 10000 / len(events)
+    print(f"   {label:<28} median={statistics.median(timings):9.1f} ms  "
+          f"per 10k={per_10k:8.1f} ms  bytes={len(body)}")
+    return per_10k
+
+
+async def main():
+    for total in SIZES:
+        events = make_events(total)
+        print(f"\n📊 {total} eventos (x{REPEAT})")
+        # Las dos rutas deben producir exactamente el mismo cuerpo
+        same = await validated(events, ORJSONResponse) == await trusted([dict(e) for e in events], ORJSONResponse)
+        print(f"   {'✅' if same else '❌'} mismo cuerpo con y sin response_model")
+        baseline = await measure('response_model + json', validated, events, JSONResponse)
+        await measure('response_model + orjson', validated, events, ORJSONResponse)
+        await measure('trusted + json', trusted, events, JSONResponse)
+        fast = await measure('trusted + orjson', trusted, events, ORJSONResponse)
+        print(f"   ⚡ FAST_JSON_RESPONSES: {baseline / fast:.1f}x más rápido")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,36 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, UploadFile, File, status
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from supabase import create_client, Client
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.concurrency import run_in_threadpool
+from supabase import AsyncClient, AsyncClientOptions
+from postgrest import APIError, ReturnMethod
+import httpx
 import os
+import json
+import base64
+import hashlib
+import uuid
 import logging
+import asyncio
+import re
+import time
+import importlib
+import zlib
+import csv
+import io
+import zipfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timezone, timedelta
+from xml.sax.saxutils import escape as xml_escape
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError, field_validator
+from typing import List, Optional, Dict, Any, Callable, Iterator, Set, Tuple
+from datetime import date, datetime, timezone, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 
@@ -16,12 +38,107 @@ ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Supabase connection
+# Cliente asíncrono: las llamadas a PostgREST no bloquean el event loop de uvicorn.
+# Todas las rutas comparten un único pool de conexiones HTTP (keep-alive).
 supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_SERVICE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_CONNECTIONS', '50'))
+SUPABASE_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_KEEPALIVE_CONNECTIONS', '20'))
+SUPABASE_TIMEOUT_SECONDS = float(os.environ.get('SUPABASE_TIMEOUT_SECONDS', '30'))
+
+supabase_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=SUPABASE_MAX_CONNECTIONS,
+        max_keepalive_connections=SUPABASE_MAX_KEEPALIVE_CONNECTIONS,
+    ),
+    timeout=SUPABASE_TIMEOUT_SECONDS,
+    follow_redirects=True,
+    http2=True,
+)
+supabase: AsyncClient = AsyncClient(
+    supabase_url,
+    supabase_key,
+    AsyncClientOptions(httpx_client=supabase_http_client),
+)
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cuesta ~200-300 ms de CPU por llamada: se ejecuta en un pool acotado fuera del event loop.
+# Si cambia BCRYPT_ROUNDS, los hashes con otro coste se regeneran en el siguiente login.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '100'))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+class PasswordHasher:
+    """Pool de hilos acotado para bcrypt con métricas de profundidad de cola"""
+
+    def __init__(self, context: CryptContext, max_workers: int, max_queue: int):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        # Contadores solo modificados desde el event loop, no necesitan lock
+        self.in_flight = 0
+        self.peak_queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.total_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    async def _run(self, func, *args):
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service busy, please retry"
+            )
+
+        self.in_flight += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, password_hash: str):
+        """Devuelve (es_válida, nuevo_hash); nuevo_hash es None si el coste no ha cambiado"""
+        valid, new_hash = await self._run(self.context.verify_and_update, password, password_hash)
+        if new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'bcrypt_rounds': BCRYPT_ROUNDS,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'peak_queue_depth': self.peak_queue_depth,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'rehashed': self.rehashed,
+            'avg_ms': (self.total_seconds / self.completed * 1000) if self.completed else 0.0,
+        }
+
+password_hasher = PasswordHasher(pwd_context, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
 
 # JWT settings
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -31,8 +148,502 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 # Security
 security = HTTPBearer()
 
+# Caché de usuarios autenticados (por proceso). El TTL acota cuánto tarda otro
+# worker en ver un cambio de rol; en este proceso update/delete invalidan al momento.
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '60'))
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', '1024'))
+
+class TTLCache:
+    """Caché LRU en memoria con expiración por entrada y contadores de aciertos"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+        }
+
+user_cache = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+# Caché de tablas de tipos (event_types / task_types): se cargan completas una vez
+# y las rutas de tipos escriben a través de ella. El TTL recoge cambios de otros workers.
+TYPE_CACHE_TTL_SECONDS = float(os.environ.get('TYPE_CACHE_TTL_SECONDS', '300'))
+DOCUMENT_TYPE_NAMES = ['Pedido', 'Albarán', 'Factura Proforma', 'Factura', 'Factura Comisiones IBERFOODS']
+
+def normalize_event_type(event_type: Dict[str, Any]) -> Dict[str, Any]:
+    # Asegurar que todos los tipos tengan category (fallback para datos antiguos)
+    if 'category' not in event_type or not event_type['category']:
+        # Inferir categoría basándose en el nombre
+        event_type['category'] = 'document' if event_type['name'] in DOCUMENT_TYPE_NAMES else 'event'
+    return event_type
+
+class TypeCache:
+    """Copia versionada en memoria de una tabla de tipos con ETag por contenido"""
+
+    def __init__(self, table: str, ttl_seconds: float, normalize=None):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.normalize = normalize or (lambda row: row)
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.version = 0
+        self.etag = ''
+        self.refreshes = 0
+
+    def _bump(self):
+        # ETag derivado del contenido: coincide entre workers con los mismos datos
+        self.version += 1
+        digest = hashlib.sha1(
+            json.dumps(sorted(self._rows.values(), key=lambda row: row['id']), sort_keys=True, default=str).encode()
+        ).hexdigest()
+        self.etag = f'"{digest}"'
+
+    async def refresh(self):
+        result = await supabase.table(self.table).select('*').execute()
+        self._rows = {row['id']: self.normalize(row) for row in result.data or []}
+        self._loaded_at = time.monotonic()
+        self.refreshes += 1
+        self._bump()
+
+    async def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl_seconds:
+                await self.refresh()
+
+    async def all(self) -> List[Dict[str, Any]]:
+        await self._ensure_loaded()
+        return list(self._rows.values())
+
+    async def get(self, type_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not type_id:
+            return None
+        await self._ensure_loaded()
+        row = self._rows.get(type_id)
+        if row is None:
+            # Puede haberse creado en otro worker: una recarga antes de darlo por inexistente
+            async with self._lock:
+                await self.refresh()
+            row = self._rows.get(type_id)
+        return row
+
+    async def get_name(self, type_id: Optional[str]) -> Optional[str]:
+        row = await self.get(type_id)
+        return row['name'] if row else None
+
+    async def current_etag(self) -> str:
+        await self._ensure_loaded()
+        return self.etag
+
+    def upsert(self, row: Dict[str, Any]):
+        if self._loaded_at is None:
+            return
+        self._rows[row['id']] = self.normalize(dict(row))
+        self._bump()
+
+    def remove(self, type_id: str):
+        if self._rows.pop(type_id, None) is not None:
+            self._bump()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'size': len(self._rows),
+            'version': self.version,
+            'refreshes': self.refreshes,
+            'ttl_seconds': self.ttl_seconds,
+        }
+
+event_type_cache = TypeCache('event_types', TYPE_CACHE_TTL_SECONDS, normalize_event_type)
+task_type_cache = TypeCache('task_types', TYPE_CACHE_TTL_SECONDS)
+
+# Versiones por colección para GET condicionales (If-None-Match -> 304 sin consultar Supabase).
+# Las rutas que escriben suben la versión; como el contador es del proceso, el ETag
+# caduca cada COLLECTION_ETAG_MAX_AGE_SECONDS para recoger escrituras de otros workers
+# (0 = sin caducidad, solo seguro con un único worker).
+COLLECTION_ETAG_MAX_AGE_SECONDS = float(os.environ.get('COLLECTION_ETAG_MAX_AGE_SECONDS', '60'))
+
+class CollectionVersions:
+    """Contadores de versión por colección (calendar, kanban, orders)"""
+
+    def __init__(self, max_age_seconds: float):
+        self.max_age_seconds = max_age_seconds
+        # Distinto en cada arranque: un reinicio invalida los ETags emitidos
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions: Dict[str, int] = {}
+        self.not_modified = 0
+
+    def bump(self, *collections: str):
+        for collection in collections:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+
+    def version(self, collection: str) -> int:
+        return self._versions.get(collection, 0)
+
+    def etag(self, collection: str, variant: str = '') -> str:
+        parts = [collection, self.epoch, str(self._versions.get(collection, 0))]
+        if self.max_age_seconds > 0:
+            parts.append(str(int(time.time() // self.max_age_seconds)))
+        if variant:
+            # Cada ruta y combinación de parámetros (ventana, cursor, fields...) es una representación distinta
+            parts.append(hashlib.sha1(variant.encode()).hexdigest()[:12])
+        return f'"{"-".join(parts)}"'
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'versions': dict(self._versions),
+            'not_modified': self.not_modified,
+            'max_age_seconds': self.max_age_seconds,
+        }
+
+collection_versions = CollectionVersions(COLLECTION_ETAG_MAX_AGE_SECONDS)
+
+# Canal en vivo (GET /api/live, Server-Sent Events): las rutas que escriben publican
+# mensajes compactos {collection, op, ids, by}; `ids` vacío significa "recarga la colección".
+# El broker lleva los mensajes entre workers y el hub los reparte a las conexiones del
+# proceso. Por defecto el broker es local; LIVE_BROKER_CLASS=modulo:Clase carga otro.
+LIVE_COLLECTIONS = ['calendar', 'kanban', 'orders']
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', '100'))
+LIVE_REPLAY_SIZE = int(os.environ.get('LIVE_REPLAY_SIZE', '500'))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', '15'))
+LIVE_BROKER_CLASS = os.environ.get('LIVE_BROKER_CLASS', '')
+LIVE_TICKET_TTL_SECONDS = int(os.environ.get('LIVE_TICKET_TTL_SECONDS', '60'))
+
+class ChangeBroker(ABC):
+    """Transporte de mensajes del canal en vivo entre workers.
+
+    `start` recibe la función de entrega del hub, que debe llamarse desde el bucle
+    de eventos por cada mensaje recibido (incluidos los publicados por este proceso).
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Callable[[Dict[str, Any]], None]):
+        ...
+
+    @abstractmethod
+    async def publish(self, message: Dict[str, Any]):
+        ...
+
+    async def stop(self):
+        pass
+
+class InProcessBroker(ChangeBroker):
+    """Entrega directa dentro del proceso (un solo worker, desarrollo y pruebas)"""
+
+    def __init__(self):
+        self._deliver: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    async def start(self, deliver):
+        self._deliver = deliver
+
+    async def publish(self, message):
+        if self._deliver is not None:
+            self._deliver(message)
+
+class ChangeHub:
+    """Reparte los mensajes del broker a las colas de las conexiones SSE de este proceso"""
+
+    def __init__(self, broker: ChangeBroker, queue_size: int, replay_size: int):
+        self.broker = broker
+        self.queue_size = queue_size
+        # Los ids de evento SSE son "<epoch>-<seq>": tras un reinicio o en otro worker no
+        # coinciden y el cliente recibe un reset en lugar de un hueco silencioso
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._recent: deque = deque(maxlen=replay_size)
+        self._subscribers: Dict[asyncio.Queue, Set[str]] = {}
+        self._started = False
+        self.published = 0
+        self.delivered = 0
+        self.resets = 0
+
+    def _event_id(self) -> str:
+        return f"{self.epoch}-{self._seq}"
+
+    async def start(self):
+        if not self._started:
+            self._started = True
+            await self.broker.start(self._deliver)
+
+    async def stop(self):
+        for queue in list(self._subscribers):
+            self._put(queue, None)
+        await self.broker.stop()
+
+    def _put(self, queue: asyncio.Queue, entry):
+        try:
+            queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            # Cliente lento: se descarta lo pendiente y se le pide recargar
+            while not queue.empty():
+                queue.get_nowait()
+            self.resets += 1
+            queue.put_nowait((self._event_id(), None) if entry is not None else None)
+
+    def _deliver(self, message: Dict[str, Any]):
+        self._seq += 1
+        entry = (self._event_id(), message)
+        self._recent.append((self._seq, entry))
+        for queue, collections in self._subscribers.items():
+            if message['collection'] in collections:
+                self.delivered += 1
+                self._put(queue, entry)
+
+    async def publish(self, message: Dict[str, Any]):
+        await self.start()
+        self.published += 1
+        await self.broker.publish(message)
+
+    def subscribe(self, collections: List[str], last_event_id: Optional[str] = None) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        if last_event_id:
+            # Reconexión: reenviar lo perdido si sigue en el búfer, o reset si no
+            epoch, _, seq = last_event_id.rpartition('-')
+            oldest = self._recent[0][0] if self._recent else self._seq + 1
+            if epoch != self.epoch or not seq.isdigit() or int(seq) < oldest - 1:
+                self.resets += 1
+                queue.put_nowait((self._event_id(), None))
+            else:
+                for entry_seq, entry in self._recent:
+                    if entry_seq > int(seq) and entry[1]['collection'] in collections:
+                        self._put(queue, entry)
+        self._subscribers[queue] = set(collections)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'broker': type(self.broker).__name__,
+            'subscribers': len(self._subscribers),
+            'published': self.published,
+            'delivered': self.delivered,
+            'resets': self.resets,
+        }
+
+def load_change_broker() -> ChangeBroker:
+    if not LIVE_BROKER_CLASS:
+        return InProcessBroker()
+    module_name, _, class_name = LIVE_BROKER_CLASS.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+change_hub = ChangeHub(load_change_broker(), LIVE_QUEUE_SIZE, LIVE_REPLAY_SIZE)
+
+# Compresión de respuestas: gzip o brotli según Accept-Encoding, a partir de
+# COMPRESSION_MIN_SIZE bytes. No se tocan respuestas ya codificadas, tipos ya
+# comprimidos (imágenes, zip, xlsx) ni el canal SSE, que debe salir sin búfer.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_ALGORITHMS = [
+    name.strip() for name in os.environ.get('COMPRESSION_ALGORITHMS', 'br,gzip').split(',') if name.strip()
+]
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+COMPRESSION_SKIP_TYPES = (
+    'text/event-stream', 'image/', 'audio/', 'video/', 'application/zip', 'application/gzip',
+    'application/x-gzip', 'application/vnd.openxmlformats',
+)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class StreamCompressor:
+    """Compresor incremental: cada trozo se vacía al enviarlo (streaming sin retener datos)"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == 'br':
+            chunk = self._compressor.process(data)
+            return chunk + (self._compressor.finish() if final else self._compressor.flush())
+        chunk = self._compressor.compress(data)
+        return chunk + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class ResponseCompression:
+    """Configuración y contadores de la compresión de respuestas"""
+
+    def __init__(self, minimum_size: int, algorithms: List[str]):
+        self.minimum_size = minimum_size
+        # brotli es opcional: sin el paquete solo se ofrece gzip
+        self.algorithms = [
+            name for name in algorithms if name == 'gzip' or (name == 'br' and brotli is not None)
+        ]
+        self.compressed: Dict[str, int] = {}
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def negotiate(self, accept_encoding: str) -> Optional[str]:
+        """Algoritmo con mayor q en Accept-Encoding; a igual q, el primero de la configuración"""
+        weights: Dict[str, float] = {}
+        for part in accept_encoding.split(','):
+            name, _, params = part.partition(';')
+            quality = 1.0
+            for param in params.split(';'):
+                key, _, value = param.strip().partition('=')
+                if key == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            if name.strip():
+                weights[name.strip().lower()] = quality
+        best, best_quality = None, 0.0
+        for name in self.algorithms:
+            quality = weights.get(name, weights.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def compressible(self, status_code: int, headers: MutableHeaders) -> bool:
+        if status_code < 200 or status_code in (204, 304) or 'content-encoding' in headers:
+            return False
+        content_type = headers.get('content-type', '').lower()
+        return not content_type.startswith(COMPRESSION_SKIP_TYPES)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'algorithms': self.algorithms,
+            'minimum_size': self.minimum_size,
+            'compressed': dict(self.compressed),
+            'skipped': self.skipped,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+        }
+
+response_compression = ResponseCompression(COMPRESSION_MIN_SIZE, COMPRESSION_ALGORITHMS)
+
+class CompressionMiddleware:
+    """Middleware ASGI que comprime el cuerpo según response_compression"""
+
+    def __init__(self, app, compression: ResponseCompression):
+        self.app = app
+        self.compression = compression
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+
+        compression = self.compression
+        encoding = compression.negotiate(Headers(scope=scope).get('accept-encoding', ''))
+        start_message = None
+        compressor: Optional[StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message['type'] == 'http.response.start':
+                # Se retiene hasta ver el primer trozo del cuerpo
+                start_message = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message['headers'])
+                if not compression.compressible(start_message['status'], headers):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                headers.add_vary_header('Accept-Encoding')
+                if encoding is None or (not more_body and len(body) < compression.minimum_size):
+                    compression.skipped += 1
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = StreamCompressor(encoding)
+                compression.compressed[encoding] = compression.compressed.get(encoding, 0) + 1
+                headers['Content-Encoding'] = encoding
+                # Otra representación del mismo recurso: el ETag pasa a débil
+                etag = headers.get('etag')
+                if etag and not etag.startswith('W/'):
+                    headers['ETag'] = f'W/{etag}'
+                if 'content-length' in headers:
+                    del headers['content-length']
+                data = compressor.compress(body, final=not more_body)
+                if not more_body:
+                    headers['Content-Length'] = str(len(data))
+                await send(start_message)
+            else:
+                data = compressor.compress(body, final=not more_body)
+
+            compression.bytes_in += len(body)
+            compression.bytes_out += len(data)
+            if data or not more_body:
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+# Serialización rápida (opcional): orjson como clase de respuesta por defecto y los listados
+# del repositorio se devuelven sin re-validar cada fila contra su response_model
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'false').lower() in ('1', 'true', 'yes')
+try:
+    import orjson
+except ImportError:
+    orjson = None
+if FAST_JSON_RESPONSES and orjson is None:
+    logging.getLogger(__name__).warning("FAST_JSON_RESPONSES requires orjson; falling back to JSONResponse")
+    FAST_JSON_RESPONSES = False
+FastJSONResponse = ORJSONResponse if FAST_JSON_RESPONSES else JSONResponse
+
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -59,6 +670,10 @@ class Token(BaseModel):
     token_type: str
     user: User
 
+class LiveTicket(BaseModel):
+    ticket: str
+    expires_in: int
+
 class EventTypeCreate(BaseModel):
     name: str
     color: str
@@ -89,6 +704,8 @@ class EventReminderCreate(BaseModel):
     title: str
     description: Optional[str] = None
     reminder_date: str
+    # Al editar: id del recordatorio existente (solo se reescribe si cambia)
+    id: Optional[str] = None
 
 class EventReminder(EventReminderCreate):
     model_config = ConfigDict(extra="ignore")
@@ -96,6 +713,11 @@ class EventReminder(EventReminderCreate):
     event_id: str
     created_at: Optional[str] = None
 
+class ReminderChanges(BaseModel):
+    inserted: List[str] = []
+    updated: List[str] = []
+    deleted: List[str] = []
+
 class CalendarEventCreate(BaseModel):
     title: str
     description: Optional[str] = None
@@ -129,6 +751,9 @@ class CalendarEvent(BaseModel):
     amount: Optional[float] = None
     linked_order_id: Optional[str] = None
     reminders: Optional[List[EventReminder]] = None
+    order: Optional["Order"] = None
+    # Solo en PUT /calendar/{id} con recordatorios: qué filas se tocaron
+    reminder_changes: Optional[ReminderChanges] = None
 
 class OrderCreate(BaseModel):
     calendar_event_id: str
@@ -137,6 +762,16 @@ class OrderCreate(BaseModel):
     client: str
     amount: Optional[float] = None
 
+class OrderLifecycle(BaseModel):
+    """Fila de order_lifecycle (add_order_lifecycle.sql): fecha de cada documento del pedido"""
+    order_date: str
+    pedido_at: Optional[str] = None
+    albaran_at: Optional[str] = None
+    factura_proforma_at: Optional[str] = None
+    factura_at: Optional[str] = None
+    factura_comisiones_at: Optional[str] = None
+    linked_events: int = 0
+
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str
@@ -148,6 +783,56 @@ class Order(BaseModel):
     status: str
     created_by: str
     created_at: Optional[str] = None
+    lifecycle: Optional[OrderLifecycle] = None
+
+CalendarEvent.model_rebuild()
+
+class CalendarEventChanges(BaseModel):
+    upserted: List[CalendarEvent] = []
+    deleted: List[str] = []
+
+class EventReminderChanges(BaseModel):
+    upserted: List[EventReminder] = []
+    deleted: List[str] = []
+
+class CalendarChanges(BaseModel):
+    cursor: str
+    has_more: bool = False
+    events: CalendarEventChanges
+    reminders: EventReminderChanges
+
+class SearchResult(BaseModel):
+    type: str
+    id: str
+    title: Optional[str] = None
+    subtitle: Optional[str] = None
+    date: Optional[str] = None
+    rank: float
+    headline: Optional[str] = None
+
+class OrderReportRow(BaseModel):
+    client: Optional[str] = None
+    supplier: Optional[str] = None
+    month: Optional[str] = None
+    status: Optional[str] = None
+    orders: int
+    total_amount: float
+    avg_amount: Optional[float] = None
+    commissioned: int
+    avg_days_to_commission: Optional[float] = None
+    max_days_to_commission: Optional[int] = None
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ImportReport(BaseModel):
+    rows: int
+    imported: int
+    orders_created: int
+    links_created: int
+    reminders_created: int
+    errors: List[ImportRowError] = []
 
 class EventLinkCreate(BaseModel):
     order_id: str
@@ -160,13 +845,46 @@ class EventLink(BaseModel):
     event_id: str
     created_at: Optional[str] = None
 
+# Claves de orden fraccional del Kanban (add_kanban_rank.sql): texto en base 62 con
+# collation "C" que nunca termina en '0', así siempre cabe otra clave entre dos vecinas
+RANK_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+RANK_KEY_PATTERN = re.compile(r'^[0-9A-Za-z]{0,63}[1-9A-Za-z]$')
+
+def rank_key_from_int(value: int) -> str:
+    """Posición INTEGER anterior a la migración -> clave con el mismo orden"""
+    value = max(value, 0) + 1
+    key = ''
+    for _ in range(6):
+        key = RANK_DIGITS[value % 62] + key
+        value //= 62
+    return key.rstrip('0')
+
+def rank_key_after(key: Optional[str]) -> str:
+    """Clave para añadir al final de una columna: crece un carácter cada ~60 inserciones.
+
+    Solo sin create_kanban_task en la BD, que calcula la clave bajo bloqueo y renumera
+    la columna antes de que las claves pasen de 48 caracteres.
+    """
+    if not key:
+        return 'V'
+    for index, char in enumerate(key):
+        if char != 'z':
+            return key[:index] + RANK_DIGITS[RANK_DIGITS.index(char) + 1]
+    return key + '1'
+
+def validate_rank_key(key: Optional[str]) -> Optional[str]:
+    if key is not None and not RANK_KEY_PATTERN.match(key):
+        raise HTTPException(status_code=400, detail=f"Invalid position key: {key}")
+    return key
+
 class KanbanTaskCreate(BaseModel):
     title: str
     description: Optional[str] = None
     assigned_to: Optional[str] = None
     priority: str = "medium"
     task_type_id: Optional[str] = None
-    position: Optional[int] = 0
+    # Sin position la tarea se añade al final de su columna
+    position: Optional[str] = None
 
 class KanbanTask(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -177,10 +895,16 @@ class KanbanTask(BaseModel):
     assigned_to: Optional[str] = None
     priority: str
     task_type_id: Optional[str] = None
-    position: int = 0
+    position: Optional[str] = None
     created_by: str
     created_at: Optional[str] = None
 
+    @field_validator('position', mode='before')
+    @classmethod
+    def legacy_position(cls, value):
+        # Columna INTEGER si aún no se ejecutó add_kanban_rank.sql
+        return rank_key_from_int(value) if isinstance(value, int) else value
+
 class KanbanTaskUpdate(BaseModel):
     status: Optional[str] = None
     title: Optional[str] = None
@@ -188,42 +912,237 @@ class KanbanTaskUpdate(BaseModel):
     assigned_to: Optional[str] = None
     priority: Optional[str] = None
     task_type_id: Optional[str] = None
-    position: Optional[int] = None
+    position: Optional[str] = None
 
-# Helper functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+class KanbanColumn(BaseModel):
+    status: str
+    tasks: List[KanbanTask]
+    # Cursor para pedir la siguiente página de esta columna (GET /kanban?cursor=...)
+    next_cursor: Optional[str] = None
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+class KanbanTaskMove(BaseModel):
+    id: str
+    status: Optional[str] = None
+    position: Optional[str] = None
+
+class KanbanTaskBatch(BaseModel):
+    changes: List[KanbanTaskMove]
+
+# Paginación y proyección del calendario
+CALENDAR_PAGE_MAX_SIZE = int(os.environ.get('CALENDAR_PAGE_MAX_SIZE', '1000'))
+# Eventos por bloque en GET /calendar con Accept: application/x-ndjson
+CALENDAR_STREAM_CHUNK_SIZE = int(os.environ.get('CALENDAR_STREAM_CHUNK_SIZE', '500'))
+CALENDAR_EVENT_COLUMNS = [
+    name for name in CalendarEvent.model_fields if name not in ('reminders', 'order', 'reminder_changes')
+]
+# Embebido PostgREST: recordatorios en la misma consulta (FK event_reminders.event_id)
+CALENDAR_REMINDERS_EMBED = 'reminders:event_reminders(*)'
+
+# Columnas exactas de cada response_model: con FAST_JSON_RESPONSES la fila de PostgREST
+# ya tiene la forma de la respuesta y se serializa sin pasar por pydantic
+def model_columns(model, exclude=()) -> str:
+    return ','.join(name for name in model.model_fields if name not in exclude)
+
+CALENDAR_TRUSTED_SELECT = f"{','.join(CALENDAR_EVENT_COLUMNS)},reminders:event_reminders({model_columns(EventReminder)})"
+KANBAN_TASK_COLUMNS = model_columns(KanbanTask)
+ORDER_COLUMNS = model_columns(Order, exclude=('lifecycle',))
+# Campos del response_model que no siempre vienen en la fila: el modelo los emite como
+# null al final, la respuesta rápida los añade igual (mismo cuerpo en los dos modos)
+CALENDAR_TRUSTED_DEFAULTS = {'reminders': None, 'order': None, 'reminder_changes': None}
+ORDER_TRUSTED_DEFAULTS = {'lifecycle': None}
+# Embebido uno a uno (order_lifecycle.order_id es PK y FK de orders)
+ORDER_LIFECYCLE_EMBED = f"lifecycle:order_lifecycle({model_columns(OrderLifecycle)})"
+# Sincronización incremental (add_calendar_changes.sql)
+CALENDAR_CHANGES_MAX_LIMIT = int(os.environ.get('CALENDAR_CHANGES_MAX_LIMIT', '5000'))
+# Búsqueda por custom_fields (add_calendar_search.sql): solo las claves de la lista,
+# cada una con su tipo JSON (text, number, boolean, date) para que @> use el índice GIN
+CALENDAR_SEARCH_TYPES = ('text', 'number', 'boolean', 'date')
+CALENDAR_SEARCH_FIELDS = {
+    name.strip(): (kind.strip() or 'text')
+    for name, _, kind in (
+        entry.partition(':')
+        for entry in os.environ.get('CALENDAR_SEARCH_FIELDS', 'container_number:text,lot:text,order_date:date').split(',')
+    )
+    if name.strip()
+}
+# Un tipo mal escrito convertiría el filtro en un ilike de texto: se rechaza al arrancar
+_unknown_search_types = {
+    f"{name}:{kind}" for name, kind in CALENDAR_SEARCH_FIELDS.items() if kind not in CALENDAR_SEARCH_TYPES
+}
+if _unknown_search_types:
+    raise ValueError(
+        f"CALENDAR_SEARCH_FIELDS: unknown type in {', '.join(sorted(_unknown_search_types))} "
+        f"(use {', '.join(CALENDAR_SEARCH_TYPES)})"
+    )
+CALENDAR_SEARCH_PAGE_SIZE = 100
 
-def create_access_token(data: dict):
+# Helper functions
+def encode_cursor(*values) -> str:
+    """Cursor opaco (base64 url-safe) con los valores de la clave de ordenación"""
+    raw = json.dumps(list(values), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def decode_calendar_cursor(cursor: str):
+    """Cursor de calendario: (fecha_inicio, id) del último evento de la página anterior"""
+    last_start, last_id = decode_cursor(cursor, 2)
+    try:
+        return date.fromisoformat(str(last_start)).isoformat(), str(uuid.UUID(str(last_id)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_calendar_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Valida la proyección ?fields=a,b,c contra las columnas de CalendarEvent"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in CALENDAR_EVENT_COLUMNS + ['reminders']]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+def parse_custom_field_filters(params: Dict[str, str]) -> Dict[str, Any]:
+    """Convierte ?clave=valor al tipo declarado en CALENDAR_SEARCH_FIELDS"""
+    filters: Dict[str, Any] = {}
+    for name, raw in params.items():
+        kind = CALENDAR_SEARCH_FIELDS.get(name)
+        if kind is None:
+            allowed = ', '.join(CALENDAR_SEARCH_FIELDS)
+            raise HTTPException(status_code=400, detail=f"Unknown search field: {name} (allowed: {allowed})")
+        try:
+            if kind == 'number':
+                value = float(raw)
+                filters[name] = int(value) if value.is_integer() else value
+            elif kind == 'boolean':
+                if raw.lower() not in ('true', 'false'):
+                    raise ValueError(raw)
+                filters[name] = raw.lower() == 'true'
+            elif kind == 'date':
+                filters[name] = date.fromisoformat(raw).isoformat()
+            else:
+                filters[name] = raw
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid value for {name}")
+    if not filters:
+        raise HTTPException(status_code=400, detail="At least one custom field filter is required")
+    return filters
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación de If-None-Match (lista de ETags o '*') con el ETag actual"""
+    if not if_none_match or not etag:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+def set_etag(response: Response, etag: str):
+    # no-cache: el navegador revalida siempre con If-None-Match
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+def not_modified_response(etag: str) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_etag(response, etag)
+    return response
+
+def complete_trusted_rows(rows: List[Dict[str, Any]], defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Añade (en su sitio) las claves de `defaults` que falten en cada fila"""
+    for row in rows:
+        for key, value in defaults.items():
+            if key not in row:
+                row[key] = value
+    return rows
+
+def trusted_rows_response(content: Any, response: Response) -> Response:
+    """Filas leídas con las columnas del response_model: se serializan sin re-validarlas.
+
+    Conserva las cabeceras ya puestas en `response` (ETag, X-Next-Cursor).
+    """
+    return FastJSONResponse(content=content, headers=dict(response.headers))
+
+def ndjson_line(row: Dict[str, Any]) -> bytes:
+    """Una fila por línea (application/x-ndjson)"""
+    if orjson is not None:
+        return orjson.dumps(row) + b'\n'
+    return (json.dumps(row, ensure_ascii=False, default=str) + '\n').encode()
+
+async def record_change(op: str, changes: Dict[str, List[str]], current_user: User):
+    """Sube la versión de las colecciones tocadas y lo publica en el canal en vivo"""
+    collection_versions.bump(*changes)
+    for collection, ids in changes.items():
+        message = {'collection': collection, 'op': op, 'ids': ids, 'by': current_user.id}
+        try:
+            await change_hub.publish(message)
+        except Exception as e:
+            # La escritura ya está hecha: un fallo del canal no debe convertirla en error
+            logger.warning(f"Could not publish live change for {collection}: {e}")
+
+def check_collection_not_modified(
+    request: Request, response: Response, collection: str, representation: str = ''
+) -> Optional[Response]:
+    """304 si el cliente ya tiene la versión actual de la colección; si no, pone el ETag y devuelve None.
+
+    El ETag se calcula antes de consultar: si hay una escritura a mitad de la consulta,
+    la siguiente petición ya no coincide y recibe el cuerpo completo. `representation`
+    distingue formatos de la misma URL (p. ej. NDJSON según Accept).
+    """
+    etag = collection_versions.etag(collection, f'{request.url.path}?{request.url.query}{representation}')
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        collection_versions.not_modified += 1
+        return not_modified_response(etag)
+    set_etag(response, etag)
+    return None
+
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify_and_update(plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await get_user_from_token(credentials.credentials)
+
+async def get_user_from_token(token: str, scope: Optional[str] = None) -> User:
+    """Usuario del JWT; `scope` exige un token de uso específico (los de sesión no llevan)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
-        if user_id is None:
+        if user_id is None or payload.get("scope") != scope:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user
     
-    result = supabase.table('users').select('*').eq('id', user_id).execute()
+    result = await supabase.table('users').select('*').eq('id', user_id).execute()
     if not result.data:
         raise credentials_exception
     
-    return User(**result.data[0])
+    user = User(**result.data[0])
+    user_cache.set(user_id, user)
+    return user
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -237,7 +1156,7 @@ async def get_admin_user(current_user: User = Depends(get_current_user)):
 @api_router.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate):
     # Check if user exists
-    result = supabase.table('users').select('*').eq('email', user_data.email).execute()
+    result = await supabase.table('users').select('*').eq('email', user_data.email).execute()
     if result.data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -247,12 +1166,12 @@ async def register(user_data: UserCreate):
     # Create user
     user_dict = {
         'email': user_data.email,
-        'password_hash': get_password_hash(user_data.password),
+        'password_hash': await get_password_hash(user_data.password),
         'name': user_data.name,
         'role': user_data.role
     }
     
-    result = supabase.table('users').insert(user_dict).execute()
+    result = await supabase.table('users').insert(user_dict).execute()
     user = User(**result.data[0])
     
     # Create token
@@ -262,7 +1181,7 @@ async def register(user_data: UserCreate):
 
 @api_router.post("/auth/login", response_model=Token)
 async def login(login_data: UserLogin):
-    result = supabase.table('users').select('*').eq('email', login_data.email).execute()
+    result = await supabase.table('users').select('*').eq('email', login_data.email).execute()
     if not result.data:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -270,11 +1189,19 @@ async def login(login_data: UserLogin):
         )
     
     user_data = result.data[0]
-    if not verify_password(login_data.password, user_data['password_hash']):
+    password_valid, new_password_hash = await verify_password(login_data.password, user_data['password_hash'])
+    if not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
+
+    # Rehash transparente si cambió el coste de bcrypt
+    if new_password_hash:
+        try:
+            await supabase.table('users').update({'password_hash': new_password_hash}).eq('id', user_data['id']).execute()
+        except Exception as e:
+            logger.warning(f"Could not rehash password for user {user_data['id']}: {e}")
     
     user = User(**user_data)
     access_token = create_access_token(data={"sub": user.id})
@@ -284,21 +1211,35 @@ async def login(login_data: UserLogin):
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@api_router.get("/metrics")
+async def get_metrics(current_user: User = Depends(get_admin_user)):
+    """Métricas internas del proceso (pools y cachés)"""
+    return {
+        'password_hashing': password_hasher.stats(),
+        'user_cache': user_cache.stats(),
+        'event_type_cache': event_type_cache.stats(),
+        'task_type_cache': task_type_cache.stats(),
+        'collection_versions': collection_versions.stats(),
+        'live_updates': change_hub.stats(),
+        'compression': response_compression.stats(),
+        'report_cache': report_cache.stats(),
+    }
+
 # User routes
 @api_router.get("/users", response_model=List[User])
 async def get_users(current_user: User = Depends(get_admin_user)):
-    result = supabase.table('users').select('id, email, name, role, created_at').execute()
+    result = await supabase.table('users').select('id, email, name, role, created_at').execute()
     return result.data
 
 @api_router.post("/users", response_model=User)
 async def create_user_by_admin(user_data: UserCreate, current_user: User = Depends(get_admin_user)):
     # Check if email already exists
-    existing = supabase.table('users').select('*').eq('email', user_data.email).execute()
+    existing = await supabase.table('users').select('*').eq('email', user_data.email).execute()
     if existing.data:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password and create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     data = {
         'email': user_data.email,
         'name': user_data.name,
@@ -306,20 +1247,21 @@ async def create_user_by_admin(user_data: UserCreate, current_user: User = Depen
         'role': user_data.role if hasattr(user_data, 'role') else 'user'
     }
     
-    result = supabase.table('users').insert(data).execute()
+    result = await supabase.table('users').insert(data).execute()
     return User(**result.data[0])
 
 @api_router.put("/users/{user_id}", response_model=User)
 async def update_user(user_id: str, user_update: dict, current_user: User = Depends(get_admin_user)):
     # Remove password if empty
     if 'password' in user_update and user_update['password']:
-        user_update['password_hash'] = get_password_hash(user_update['password'])
+        user_update['password_hash'] = await get_password_hash(user_update['password'])
         del user_update['password']  # Remove the plain password field
     elif 'password' in user_update and not user_update['password']:
         del user_update['password']
     
     try:
-        result = supabase.table('users').update(user_update).eq('id', user_id).execute()
+        result = await supabase.table('users').update(user_update).eq('id', user_id).execute()
+        user_cache.invalidate(user_id)
         if not result.data:
             raise HTTPException(status_code=404, detail="User not found")
         return User(**result.data[0])
@@ -331,9 +1273,12 @@ async def update_user(user_id: str, user_update: dict, current_user: User = Depe
 @api_router.delete("/users/{user_id}")
 async def delete_user(user_id: str, current_user: User = Depends(get_admin_user)):
     try:
-        result = supabase.table('users').delete().eq('id', user_id).execute()
+        result = await supabase.table('users').delete().eq('id', user_id).execute()
+        user_cache.invalidate(user_id)
         if not result.data:
             raise HTTPException(status_code=404, detail="User not found")
+        # ON DELETE CASCADE sobre created_by
+        await record_change('delete', {'calendar': [], 'kanban': [], 'orders': []}, current_user)
         return {"message": "User deleted successfully"}
     except Exception as e:
         if "invalid input syntax for type uuid" in str(e):
@@ -349,19 +1294,21 @@ async def create_event_type(event_type_data: EventTypeCreate, current_user: User
         'category': event_type_data.category,
         'created_by': current_user.id
     }
-    result = supabase.table('event_types').insert(data).execute()
+    result = await supabase.table('event_types').insert(data).execute()
+    event_type_cache.upsert(result.data[0])
     return EventType(**result.data[0])
 
 @api_router.get("/event-types", response_model=List[EventType])
-async def get_event_types(current_user: User = Depends(get_current_user)):
-    result = supabase.table('event_types').select('*').execute()
-    # Asegurar que todos los tipos tengan category (fallback para datos antiguos)
-    for event_type in result.data:
-        if 'category' not in event_type or not event_type['category']:
-            # Inferir categoría basándose en el nombre
-            doc_names = ['Pedido', 'Albarán', 'Factura Proforma', 'Factura', 'Factura Comisiones IBERFOODS']
-            event_type['category'] = 'document' if event_type['name'] in doc_names else 'event'
-    return result.data
+async def get_event_types(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    etag = await event_type_cache.current_etag()
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    set_etag(response, etag)
+    return await event_type_cache.all()
 
 @api_router.put("/event-types/{type_id}", response_model=EventType)
 async def update_event_type(
@@ -370,18 +1317,22 @@ async def update_event_type(
     current_user: User = Depends(get_admin_user)
 ):
     update_data = event_type_data.model_dump()
-    result = supabase.table('event_types').update(update_data).eq('id', type_id).execute()
+    result = await supabase.table('event_types').update(update_data).eq('id', type_id).execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Event type not found")
     
+    event_type_cache.upsert(result.data[0])
     return EventType(**result.data[0])
 
 @api_router.delete("/event-types/{type_id}")
 async def delete_event_type(type_id: str, current_user: User = Depends(get_admin_user)):
-    result = supabase.table('event_types').delete().eq('id', type_id).execute()
+    result = await supabase.table('event_types').delete().eq('id', type_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Event type not found")
+    event_type_cache.remove(type_id)
+    # ON DELETE CASCADE: se borran los eventos de ese tipo
+    await record_change('delete', {'calendar': [], 'orders': []}, current_user)
     return {"message": "Event type deleted successfully"}
 
 # Task Type routes
@@ -392,13 +1343,21 @@ async def create_task_type(task_type_data: TaskTypeCreate, current_user: User =
         'color': task_type_data.color,
         'created_by': current_user.id
     }
-    result = supabase.table('task_types').insert(data).execute()
+    result = await supabase.table('task_types').insert(data).execute()
+    task_type_cache.upsert(result.data[0])
     return TaskType(**result.data[0])
 
 @api_router.get("/task-types", response_model=List[TaskType])
-async def get_task_types(current_user: User = Depends(get_current_user)):
-    result = supabase.table('task_types').select('*').execute()
-    return result.data
+async def get_task_types(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    etag = await task_type_cache.current_etag()
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+    set_etag(response, etag)
+    return await task_type_cache.all()
 
 @api_router.put("/task-types/{type_id}", response_model=TaskType)
 async def update_task_type(
@@ -407,25 +1366,38 @@ async def update_task_type(
     current_user: User = Depends(get_admin_user)
 ):
     update_data = task_type_data.model_dump()
-    result = supabase.table('task_types').update(update_data).eq('id', type_id).execute()
+    result = await supabase.table('task_types').update(update_data).eq('id', type_id).execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Task type not found")
     
+    task_type_cache.upsert(result.data[0])
     return TaskType(**result.data[0])
 
 @api_router.delete("/task-types/{type_id}")
 async def delete_task_type(type_id: str, current_user: User = Depends(get_admin_user)):
-    result = supabase.table('task_types').delete().eq('id', type_id).execute()
+    result = await supabase.table('task_types').delete().eq('id', type_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Task type not found")
+    task_type_cache.remove(type_id)
+    # ON DELETE SET NULL en kanban_tasks.task_type_id
+    await record_change('update', {'kanban': []}, current_user)
     return {"message": "Task type deleted successfully"}
 
 # Calendar routes
-@api_router.post("/calendar", response_model=CalendarEvent)
-async def create_event(event_data: CalendarEventCreate, current_user: User = Depends(get_current_user)):
+def normalize_reminder_date(value: str) -> str:
+    try:
+        if "T" in value:
+            parsed = datetime.fromisoformat(value)
+        else:
+            parsed = datetime.fromisoformat(f"{value}T00:00:00")
+        return parsed.isoformat()
+    except Exception:
+        return value
+
+def prepare_event_payload(event_data: CalendarEventCreate):
+    """Normaliza el cuerpo de POST/PUT /calendar y separa los recordatorios"""
     data = event_data.model_dump()
-    data['created_by'] = current_user.id
 
     if data.get('custom_fields') is None:
         data['custom_fields'] = {}
@@ -436,51 +1408,99 @@ async def create_event(event_data: CalendarEventCreate, current_user: User = Dep
             data[field] = None
     
     reminders_payload = data.pop('reminders', None)
-
+    if reminders_payload is not None:
+        reminders_payload = [
+            {
+                **({'id': reminder['id']} if reminder.get('id') else {}),
+                'title': reminder['title'],
+                'description': reminder.get('description'),
+                'reminder_date': normalize_reminder_date(reminder['reminder_date'])
+            }
+            for reminder in reminders_payload
+        ]
+    return data, reminders_payload
+
+def reminder_content(reminder: Dict[str, Any]):
+    return (reminder['title'], reminder.get('description'), normalize_reminder_date(reminder['reminder_date']))
+
+def diff_reminders(existing: List[Dict[str, Any]], payload: List[Dict[str, Any]]):
+    """Mismo diff que update_calendar_event: (a insertar, a actualizar, ids a borrar)"""
+    existing_by_id = {reminder['id']: reminder for reminder in existing}
+    kept = set()
+    to_insert: List[Dict[str, Any]] = []
+    to_update: List[Dict[str, Any]] = []
+
+    # Primero los que traen id, para que no los reclame un elemento sin id
+    for reminder in sorted(payload, key=lambda item: not item.get('id')):
+        current = existing_by_id.get(reminder.get('id'))
+        if current is not None:
+            if reminder_content(current) != reminder_content(reminder):
+                to_update.append(reminder)
+            kept.add(current['id'])
+            continue
+
+        # Sin id (o id ajeno al evento): reutilizar un recordatorio idéntico aún no asignado
+        match = next(
+            (row for row in existing if row['id'] not in kept and reminder_content(row) == reminder_content(reminder)),
+            None
+        )
+        if match is not None:
+            kept.add(match['id'])
+        else:
+            to_insert.append({key: value for key, value in reminder.items() if key != 'id'})
+
+    to_delete = [reminder['id'] for reminder in existing if reminder['id'] not in kept]
+    return to_insert, to_update, to_delete
+
+# Funciones transaccionales de add_calendar_event_rpc.sql, por nombre (sin entrada = aún
+# no comprobada): una BD con una versión anterior del fichero puede tener solo algunas
+calendar_event_rpc_available: Dict[str, bool] = {}
+
+async def call_calendar_event_rpc(function_name: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Ejecuta la RPC en una sola transacción; None si la función no existe en la BD"""
+    if calendar_event_rpc_available.get(function_name) is False:
+        return None
+    try:
+        result = await supabase.rpc(function_name, params).execute()
+    except APIError as e:
+        if e.code == 'PGRST202':
+            calendar_event_rpc_available[function_name] = False
+            logger.warning(
+                f"RPC {function_name} not found, falling back to step-by-step writes. "
+                "Run add_calendar_event_rpc.sql and restart the server."
+            )
+            return None
+        raise
+    calendar_event_rpc_available[function_name] = True
+    return result.data or []
+
+async def create_event_in_steps(data: Dict[str, Any], reminders_payload, current_user: User) -> Dict[str, Any]:
+    """Flujo por pasos (sin transacción) mientras no exista create_calendar_event en la BD"""
     # Crear evento en calendar_events
-    result = supabase.table('calendar_events').insert(data).execute()
+    result = await supabase.table('calendar_events').insert(data).execute()
     created_event = result.data[0]
 
     reminders_result: List[Dict[str, Any]] = []
-    def normalize_reminder_date(value: str) -> str:
-        try:
-            if "T" in value:
-                parsed = datetime.fromisoformat(value)
-            else:
-                parsed = datetime.fromisoformat(f"{value}T00:00:00")
-            return parsed.isoformat()
-        except Exception:
-            return value
-
     if reminders_payload:
-        reminder_rows = []
-        for reminder in reminders_payload:
-            reminder_rows.append({
-                'event_id': created_event['id'],
-                'title': reminder['title'],
-                'description': reminder.get('description'),
-                'reminder_date': normalize_reminder_date(reminder['reminder_date'])
-            })
-        insert_result = supabase.table('event_reminders').insert(reminder_rows).execute()
+        reminder_rows = [{**reminder, 'event_id': created_event['id']} for reminder in reminders_payload]
+        insert_result = await supabase.table('event_reminders').insert(reminder_rows).execute()
         if insert_result.data:
             reminders_result = insert_result.data
 
     # Si el evento es tipo "Pedido" o "Factura Proforma", crear entrada en orders
-    event_type_result = supabase.table('event_types').select('name').eq('id', data['event_type_id']).execute()
-    if event_type_result.data:
-        event_type_name = event_type_result.data[0]['name']
-
-        if event_type_name in ['Pedido', 'Factura Proforma']:
-            order_data = {
-                'calendar_event_id': created_event['id'],
-                'order_number': data.get('order_number', ''),
-                'supplier': data.get('supplier', ''),
-                'client': data.get('client', ''),
-                'amount': data.get('amount'),
-                'status': 'active',
-                'created_by': current_user.id
-            }
-            supabase.table('orders').insert(order_data).execute()
+    event_type_name = await event_type_cache.get_name(data['event_type_id'])
+    if event_type_name in ['Pedido', 'Factura Proforma']:
+        order_data = {
+            'calendar_event_id': created_event['id'],
+            'order_number': data.get('order_number') or '',
+            'supplier': data.get('supplier') or '',
+            'client': data.get('client') or '',
+            'amount': data.get('amount'),
+            'status': 'active',
+            'created_by': current_user.id
+        }
+        order_result = await supabase.table('orders').insert(order_data).execute()
+        created_event['order'] = order_result.data[0] if order_result.data else None
     
     # Si el evento tiene linked_order_id, crear vinculación en event_links
     if data.get('linked_order_id'):
@@ -488,108 +1508,732 @@ async def create_event(event_data: CalendarEventCreate, current_user: User = Dep
             'order_id': data['linked_order_id'],
             'event_id': created_event['id']
         }
-        supabase.table('event_links').insert(link_data).execute()
+        await supabase.table('event_links').insert(link_data).execute()
         
         # Si es "Factura Comisiones IBERFOODS", marcar pedido como completado
-        if event_type_result.data:
-            event_type_name = event_type_result.data[0]['name']
-            if event_type_name == 'Factura Comisiones IBERFOODS':
-                supabase.table('orders').update({'status': 'completed'}).eq('id', data['linked_order_id']).execute()
+        if event_type_name == 'Factura Comisiones IBERFOODS':
+            await supabase.table('orders').update({'status': 'completed'}).eq('id', data['linked_order_id']).execute()
     
     created_event['reminders'] = reminders_result
+    return created_event
+
+@api_router.post("/calendar", response_model=CalendarEvent)
+async def create_event(event_data: CalendarEventCreate, current_user: User = Depends(get_current_user)):
+    """Crea el evento con recordatorios, pedido y vinculación en una sola llamada transaccional"""
+    data, reminders_payload = prepare_event_payload(event_data)
+    data['created_by'] = current_user.id
+    if reminders_payload:
+        # En un evento nuevo no hay recordatorios que reutilizar
+        reminders_payload = [{key: value for key, value in reminder.items() if key != 'id'} for reminder in reminders_payload]
+
+    rpc_result = await call_calendar_event_rpc(
+        'create_calendar_event',
+        {'p_event': data, 'p_reminders': reminders_payload}
+    )
+    if rpc_result is None:
+        created_event = await create_event_in_steps(data, reminders_payload, current_user)
+    else:
+        created_event = rpc_result[0]
+    await record_change('create', {'calendar': [created_event['id']], 'orders': []}, current_user)
+
     return CalendarEvent(**created_event)
 
-@api_router.get("/calendar", response_model=List[CalendarEvent])
-async def get_events(current_user: User = Depends(get_current_user)):
-    result = supabase.table('calendar_events').select('*').execute()
-    events = result.data or []
+# Importación masiva (POST /import/calendar): CSV o XLSX con un documento por fila.
+# Se lee por bloques de IMPORT_BATCH_SIZE filas, se valida cada fila con
+# CalendarEventCreate y cada bloque se inserta con una petición por tabla.
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '100000'))
+# Columnas reconocidas; el resto se guarda en custom_fields
+IMPORT_COLUMNS = {
+    'title', 'description', 'fecha_inicio', 'fecha_fin', 'event_type', 'event_type_id',
+    'order_number', 'client', 'supplier', 'amount', 'linked_order_id', 'linked_order_number',
+    'reminder_title', 'reminder_date',
+}
+IMPORT_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+class ImportReader:
+    """Lector por bloques de un CSV (UTF-8, separador , ; o tabulador) o de la primera hoja de un XLSX"""
+
+    def __init__(self, upload: UploadFile):
+        self.upload = upload
+        self.columns: List[str] = []
+        self.rows: Optional[Iterator] = None
+        self.next_row = 2  # la fila 1 es la cabecera
+        self.workbook = None
+
+    def open(self):
+        name = (self.upload.filename or '').lower()
+        if name.endswith('.xlsx') or self.upload.content_type == XLSX_MEDIA_TYPE:
+            if openpyxl is None:
+                raise HTTPException(status_code=415, detail="XLSX import requires openpyxl")
+            try:
+                # read_only recorre la hoja sin cargarla entera en memoria
+                self.workbook = openpyxl.load_workbook(self.upload.file, read_only=True, data_only=True)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid XLSX file")
+            self.rows = self.workbook.active.iter_rows(values_only=True)
+        elif name.endswith('.csv') or self.upload.content_type in ('text/csv', 'application/csv'):
+            text = io.TextIOWrapper(self.upload.file, encoding='utf-8-sig', newline='')
+            try:
+                sample = text.read(4096)
+                text.seek(0)
+            except UnicodeDecodeError:
+                raise HTTPException(status_code=400, detail="CSV must be UTF-8")
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            self.rows = csv.reader(text, dialect)
+        else:
+            raise HTTPException(status_code=415, detail="Unsupported file type (use .csv or .xlsx)")
+
+        header = next(self.rows, None) or []
+        self.columns = [str(value or '').strip().lower() for value in header]
+        missing = [column for column in ('title', 'fecha_inicio') if column not in self.columns]
+        if 'event_type' not in self.columns and 'event_type_id' not in self.columns:
+            missing.append('event_type')
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+
+    def close(self):
+        # En modo read_only openpyxl mantiene abierto el ZIP hasta close()
+        if self.workbook is not None:
+            self.workbook.close()
+            self.workbook = None
+
+    def next_chunk(self, size: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """Hasta `size` filas no vacías como (número de fila, {columna: valor})"""
+        chunk = []
+        for values in self.rows:
+            number = self.next_row
+            self.next_row += 1
+            row = {column: value for column, value in zip(self.columns, values) if column}
+            if any(import_cell(value) is not None for value in row.values()):
+                chunk.append((number, row))
+                if len(chunk) >= size:
+                    break
+        return chunk
+
+def import_cell(value: Any) -> Optional[str]:
+    """Celda de CSV/XLSX -> texto sin espacios (None si está vacía)"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        # Excel guarda los números de pedido como 123.0
+        value = int(value)
+    text = str(value).strip()
+    return text or None
+
+def parse_import_date(value: str) -> str:
+    for date_format in IMPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(value[:10], date_format).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(value)
 
-    if not events:
-        return events
+def parse_import_datetime(value: str) -> str:
+    """Fecha con hora opcional: ISO (conserva la hora) o cualquier formato de IMPORT_DATE_FORMATS"""
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        return parse_import_date(value)
+
+def parse_import_row(row: Dict[str, Any], event_types: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Fila del fichero -> evento listo para insertar; ValueError con la lista de errores"""
+    cells = {column: import_cell(value) for column, value in row.items()}
+    errors: List[str] = []
+
+    type_key = cells.get('event_type_id') or (cells.get('event_type') or '').lower()
+    event_type = event_types.get(type_key)
+    if event_type is None:
+        errors.append(f"event_type: unknown '{cells.get('event_type_id') or cells.get('event_type') or ''}'")
+
+    dates = {}
+    for column in ('fecha_inicio', 'fecha_fin'):
+        raw = cells.get(column) or (cells.get('fecha_inicio') if column == 'fecha_fin' else None)
+        if raw is None:
+            continue
+        try:
+            dates[column] = parse_import_date(raw)
+        except ValueError:
+            if column == 'fecha_inicio' or cells.get('fecha_fin'):
+                errors.append(f"{column}: invalid date '{raw}'")
+    if len(dates) == 2 and dates['fecha_fin'] < dates['fecha_inicio']:
+        errors.append("fecha_fin: before fecha_inicio")
+
+    reminders = None
+    if cells.get('reminder_date'):
+        try:
+            reminder_date = parse_import_datetime(cells['reminder_date'])
+        except ValueError:
+            errors.append(f"reminder_date: invalid date '{cells['reminder_date']}'")
+        else:
+            reminders = [{'title': cells.get('reminder_title') or cells.get('title') or '', 'reminder_date': reminder_date}]
+
+    payload = {
+        **{
+            column: cells[column]
+            for column in ('title', 'description', 'order_number', 'client', 'supplier', 'amount', 'linked_order_id')
+            if cells.get(column) is not None
+        },
+        # Las fechas no válidas ya tienen su error: no se repite como "Field required"
+        **{column: dates.get(column, cells.get(column) or '') for column in ('fecha_inicio', 'fecha_fin') if cells.get('fecha_inicio')},
+        'event_type_id': event_type['id'] if event_type else '',
+        'custom_fields': {column: value for column, value in cells.items() if column not in IMPORT_COLUMNS and value is not None},
+        'reminders': reminders,
+    }
+    try:
+        event_data = CalendarEventCreate(**payload)
+    except ValidationError as e:
+        errors.extend(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+    if errors:
+        raise ValueError(errors)
+
+    data, reminders_payload = prepare_event_payload(event_data)
+    return {
+        'event': data,
+        'reminders': reminders_payload or [],
+        'type_name': event_type['name'],
+        'linked_order_number': cells.get('linked_order_number'),
+    }
+
+async def insert_import_batch_in_steps(events, reminders, orders, links, completed):
+    """Flujo por pasos (sin transacción) mientras no exista import_calendar_batch en la BD"""
+    await supabase.table('calendar_events').insert(events, returning=ReturnMethod.minimal).execute()
+    try:
+        if reminders:
+            await supabase.table('event_reminders').insert(reminders, returning=ReturnMethod.minimal).execute()
+        if orders:
+            await supabase.table('orders').insert(orders, returning=ReturnMethod.minimal).execute()
+        if links:
+            await supabase.table('event_links').insert(links, returning=ReturnMethod.minimal).execute()
+        if completed:
+            await supabase.table('orders').update({'status': 'completed'}).in_('id', sorted(completed)).execute()
+    except APIError:
+        # Se deshace borrando los eventos (recordatorios, pedidos y vínculos caen en
+        # cascada); si el borrado también falla se informa del error original
+        try:
+            await supabase.table('calendar_events').delete().in_('id', [event['id'] for event in events]).execute()
+        except Exception:
+            logger.exception("Could not roll back a failed import batch")
+        raise
+
+class CalendarImport:
+    """Estado de una importación: contadores, errores y pedidos creados por número"""
+
+    def __init__(self, current_user: User):
+        self.current_user = current_user
+        self.rows = 0
+        self.imported = 0
+        self.orders_created = 0
+        self.links_created = 0
+        self.reminders_created = 0
+        self.errors: List[Dict[str, Any]] = []
+        # order_number -> id de los pedidos creados en esta importación
+        self.orders_by_number: Dict[str, str] = {}
+
+    def fail(self, items, message: str):
+        for number, _ in items:
+            self.errors.append({'row': number, 'errors': [message]})
+
+    async def resolve_linked_orders(self, items):
+        """Rellena linked_order_id desde linked_order_number y comprueba que los pedidos existen.
+
+        Las filas que apuntan a un pedido creado por una fila anterior del mismo bloque se
+        devuelven aparte: se insertan en una segunda pasada, cuando ese pedido ya existe.
+        """
+        created_here: Set[str] = set()
+        wanted_numbers: Set[str] = set()
+        wanted_ids: Set[str] = set()
+        for _, item in items:
+            if item['linked_order_number'] and item['linked_order_number'] not in self.orders_by_number:
+                wanted_numbers.add(item['linked_order_number'])
+            if item['event'].get('linked_order_id'):
+                wanted_ids.add(item['event']['linked_order_id'])
+
+        existing_numbers: Dict[str, str] = {}
+        if wanted_numbers:
+            result = await supabase.table('orders').select('id, order_number').in_(
+                'order_number', sorted(wanted_numbers)
+            ).neq('status', 'deleted').order('created_at').execute()
+            # Si el número se repite, el pedido más reciente
+            existing_numbers = {row['order_number']: row['id'] for row in result.data or []}
+        existing_ids: Set[str] = set()
+        if wanted_ids:
+            result = await supabase.table('orders').select('id').in_('id', sorted(wanted_ids)).execute()
+            existing_ids = {row['id'] for row in result.data or []}
+
+        ready, deferred = [], []
+        for number, item in items:
+            data = item['event']
+            linked_number = item['linked_order_number']
+            deferred_item = False
+            if linked_number and not data.get('linked_order_id'):
+                if linked_number in self.orders_by_number:
+                    data['linked_order_id'] = self.orders_by_number[linked_number]
+                elif linked_number in created_here:
+                    deferred_item = True
+                elif linked_number in existing_numbers:
+                    data['linked_order_id'] = existing_numbers[linked_number]
+                else:
+                    self.errors.append({'row': number, 'errors': [f"linked_order_number: order '{linked_number}' not found"]})
+                    continue
+            elif data.get('linked_order_id') and data['linked_order_id'] not in existing_ids:
+                self.errors.append({'row': number, 'errors': [f"linked_order_id: order '{data['linked_order_id']}' not found"]})
+                continue
+            if item['type_name'] in ['Pedido', 'Factura Proforma'] and data.get('order_number'):
+                created_here.add(data['order_number'])
+            (deferred if deferred_item else ready).append((number, item))
+        return ready, deferred
+
+    async def insert_batch(self, items):
+        """Inserta eventos, recordatorios, pedidos y vínculos del bloque (todo o nada)"""
+        user_id = self.current_user.id
+        events, reminders, orders, links, completed = [], [], [], [], set()
+        new_orders: Dict[str, str] = {}
+        for _, item in items:
+            data = {**item['event'], 'id': str(uuid.uuid4()), 'created_by': user_id}
+            events.append(data)
+            reminders.extend({**reminder, 'event_id': data['id']} for reminder in item['reminders'])
+            # Mismas reglas que create_calendar_event
+            if item['type_name'] in ['Pedido', 'Factura Proforma']:
+                order_id = str(uuid.uuid4())
+                orders.append({
+                    'id': order_id,
+                    'calendar_event_id': data['id'],
+                    'order_number': data.get('order_number') or '',
+                    'supplier': data.get('supplier') or '',
+                    'client': data.get('client') or '',
+                    'amount': data.get('amount'),
+                    'status': 'active',
+                    'created_by': user_id,
+                })
+                if data.get('order_number'):
+                    new_orders[data['order_number']] = order_id
+            if data.get('linked_order_id'):
+                links.append({'order_id': data['linked_order_id'], 'event_id': data['id']})
+                if item['type_name'] == 'Factura Comisiones IBERFOODS':
+                    completed.add(data['linked_order_id'])
 
-    event_ids = [event['id'] for event in events]
-    reminders_query = supabase.table('event_reminders').select('*').in_('event_id', event_ids).execute()
-    reminders = reminders_query.data or []
+        try:
+            inserted = await call_calendar_event_rpc('import_calendar_batch', {
+                'p_events': events,
+                'p_reminders': reminders,
+                'p_orders': orders,
+                'p_links': links,
+                'p_completed': sorted(completed),
+            })
+            if inserted is None:
+                await insert_import_batch_in_steps(events, reminders, orders, links, completed)
+        except APIError as e:
+            self.fail(items, e.message or 'Insert failed')
+            return
+
+        self.imported += len(events)
+        self.reminders_created += len(reminders)
+        self.orders_created += len(orders)
+        self.links_created += len(links)
+        self.orders_by_number.update(new_orders)
+
+    async def import_chunk(self, chunk, event_types: Dict[str, Dict[str, Any]]):
+        self.rows += len(chunk)
+        items = []
+        for number, row in chunk:
+            try:
+                items.append((number, parse_import_row(row, event_types)))
+            except ValueError as e:
+                self.errors.append({'row': number, 'errors': e.args[0]})
+        while items:
+            ready, items = await self.resolve_linked_orders(items)
+            if not ready:
+                self.fail(items, 'linked_order_number: circular reference')
+                break
+            await self.insert_batch(ready)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'orders_created': self.orders_created,
+            'links_created': self.links_created,
+            'reminders_created': self.reminders_created,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+@api_router.post("/import/calendar", response_model=ImportReport)
+async def import_calendar(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+    """Importa documentos del calendario desde un CSV o XLSX (primera fila: cabecera).
+
+    Columnas: title, fecha_inicio y event_type (nombre) o event_type_id obligatorias;
+    description, fecha_fin, order_number, client, supplier, amount, linked_order_id o
+    linked_order_number (pedido existente o creado por una fila anterior),
+    reminder_date y reminder_title opcionales. Cualquier otra columna va a custom_fields.
+    Fechas en AAAA-MM-DD o DD/MM/AAAA. Los pedidos y vínculos se crean como en
+    POST /calendar. Las filas con errores se omiten y se listan en `errors`.
+    """
+    reader = ImportReader(file)
+    state = CalendarImport(current_user)
+    try:
+        await run_in_threadpool(reader.open)
+        event_types: Dict[str, Dict[str, Any]] = {}
+        for event_type in await event_type_cache.all():
+            event_types[event_type['id']] = event_type
+            event_types[event_type['name'].lower()] = event_type
+
+        while state.rows < IMPORT_MAX_ROWS:
+            try:
+                chunk = await run_in_threadpool(reader.next_chunk, min(IMPORT_BATCH_SIZE, IMPORT_MAX_ROWS - state.rows))
+            except (UnicodeDecodeError, csv.Error) as e:
+                state.errors.append({'row': reader.next_row - 1, 'errors': [f"Unreadable row: {e}"]})
+                break
+            if not chunk:
+                break
+            await state.import_chunk(chunk, event_types)
+        else:
+            if await run_in_threadpool(reader.next_chunk, 1):
+                state.errors.append({'row': reader.next_row - 1, 'errors': [f"Row limit reached ({IMPORT_MAX_ROWS}), rest of the file skipped"]})
+    finally:
+        reader.close()
+
+    if state.imported:
+        await record_change('create', {'calendar': [], 'orders': []}, current_user)
+    return state.report()
+
+async def get_event_ids_with_reminders_between(date_from: Optional[date], date_to: Optional[date]) -> List[str]:
+    """IDs de eventos con algún recordatorio dentro de la ventana (usa idx_event_reminders_date)"""
+    query = supabase.table('event_reminders').select('event_id')
+    if date_from:
+        query = query.gte('reminder_date', date_from.isoformat())
+    if date_to:
+        query = query.lt('reminder_date', (date_to + timedelta(days=1)).isoformat())
+    result = await query.execute()
+    return sorted({row['event_id'] for row in result.data or []})
+
+async def calendar_window_condition(date_from: Optional[date], date_to: Optional[date]) -> str:
+    """Filtro PostgREST de eventos que solapan [from, to] o tienen recordatorios dentro.
+
+    Solo para BDs sin calendar_events_window: necesita una consulta previa de IDs.
+    """
+    window = []
+    if date_to:
+        window.append(f"fecha_inicio.lte.{date_to.isoformat()}")
+    if date_from:
+        window.append(f"fecha_fin.gte.{date_from.isoformat()}")
+    window_condition = f"and({','.join(window)})"
+
+    # Incluir también eventos fuera de la ventana cuyos recordatorios caen dentro
+    reminder_event_ids = await get_event_ids_with_reminders_between(date_from, date_to)
+    if reminder_event_ids:
+        window_condition = f"or({window_condition},id.in.({','.join(reminder_event_ids)}))"
+    return window_condition
+
+CalendarWindow = Tuple[Optional[date], Optional[date]]
+
+# Función de add_calendar_window.sql (None = aún no comprobado)
+calendar_window_rpc_available: Optional[bool] = None
+
+def build_calendar_query(
+    columns: str,
+    window: Optional[CalendarWindow],
+    after: Optional[Tuple[str, str]] = None,
+    window_condition: Optional[str] = None,
+):
+    """Consulta ordenada por (fecha_inicio, id), a partir de `after` si se indica.
+
+    Con ventana lee de calendar_events_window; `window_condition` sustituye a la
+    función (filtro sobre la tabla) mientras no exista en la BD.
+    """
+    conditions = [window_condition] if window_condition else []
+    if after:
+        last_start, last_id = after
+        conditions.append(f"or(fecha_inicio.gt.{last_start},and(fecha_inicio.eq.{last_start},id.gt.{last_id}))")
+
+    if window and not window_condition:
+        date_from, date_to = window
+        params = {}
+        if date_from:
+            params['p_from'] = date_from.isoformat()
+        if date_to:
+            params['p_to'] = date_to.isoformat()
+        query = supabase.rpc('calendar_events_window', params, get=True).select(columns)
+    else:
+        query = supabase.table('calendar_events').select(columns)
+    if conditions:
+        query = query.or_(f"and({','.join(conditions)})")
+    return query.order('fecha_inicio').order('id')
+
+async def fetch_calendar_events(
+    columns: str, window: Optional[CalendarWindow], limit: Optional[int], after: Optional[Tuple[str, str]] = None
+) -> List[Dict[str, Any]]:
+    """Una página de eventos en una sola consulta (ventana, cursor y recordatorios incluidos)"""
+    global calendar_window_rpc_available
+    window_condition = None
+    if window and calendar_window_rpc_available is False:
+        window_condition = await calendar_window_condition(*window)
+
+    query = build_calendar_query(columns, window, after, window_condition)
+    if limit:
+        query = query.limit(limit)
+    try:
+        result = await query.execute()
+    except APIError as e:
+        if e.code != 'PGRST202' or window_condition:
+            raise
+        calendar_window_rpc_available = False
+        logger.warning(
+            "RPC calendar_events_window not found, falling back to the reminder id lookup. "
+            "Run add_calendar_window.sql and restart the server."
+        )
+        return await fetch_calendar_events(columns, window, limit, after)
+    if window:
+        calendar_window_rpc_available = True
+    return result.data or []
+
+async def calendar_event_pages(
+    columns: str, window: Optional[CalendarWindow], page_size: int, after: Optional[Tuple[str, str]] = None
+):
+    """Recorre los eventos por páginas de `page_size` (paginación por clave, sin OFFSET)"""
+    while True:
+        rows = await fetch_calendar_events(columns, window, page_size, after)
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]['fecha_inicio'], rows[-1]['id'])
+
+async def calendar_ndjson_stream(pages, keys: List[str]):
+    # Cada página sale con sus recordatorios embebidos en cuanto llega
+    async for events in pages:
+        yield b''.join(ndjson_line({key: event.get(key) for key in keys}) for event in events)
+
+@api_router.get("/calendar", response_model=List[CalendarEvent])
+async def get_events(
+    request: Request,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=CALENDAR_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Eventos que solapan [from, to], ordenados por (fecha_inicio, id).
+
+    Con `limit` se pagina por cursor: si hay más resultados, la cabecera
+    X-Next-Cursor contiene el valor a enviar como `cursor` en la siguiente
+    petición. `fields` limita las columnas devueltas (p. ej. `id,title,fecha_inicio`).
+    Los recordatorios se embeben en la misma consulta, sin un segundo IN (...).
+    Responde 304 si If-None-Match coincide con la versión actual del calendario.
+
+    Con `Accept: application/x-ndjson` devuelve un evento por línea y lo envía por
+    bloques de CALENDAR_STREAM_CHUNK_SIZE según se leen (sin `limit`: la respuesta
+    ya es incremental y no hay cabecera X-Next-Cursor).
+    """
+    projection = parse_calendar_fields(fields)
+    stream = 'application/x-ndjson' in request.headers.get('accept', '')
+    if stream and limit:
+        raise HTTPException(status_code=400, detail="limit is not supported with Accept: application/x-ndjson")
+    after = decode_calendar_cursor(cursor) if cursor else None
+    response.headers['Vary'] = 'Accept'
+    not_modified = check_collection_not_modified(request, response, 'calendar', '#ndjson' if stream else '')
+    if not_modified:
+        not_modified.headers['Vary'] = 'Accept'
+        return not_modified
+    if projection is None:
+        columns = CALENDAR_TRUSTED_SELECT if FAST_JSON_RESPONSES or stream else f"*,{CALENDAR_REMINDERS_EMBED}"
+    else:
+        required = ['id', 'fecha_inicio']
+        selected = list(dict.fromkeys(required + [f for f in projection if f != 'reminders']))
+        if 'reminders' in projection:
+            selected.append(CALENDAR_REMINDERS_EMBED)
+        columns = ','.join(selected)
+
+    window = (date_from, date_to) if date_from or date_to else None
+    if stream:
+        keys = projection or CALENDAR_EVENT_COLUMNS + ['reminders']
+        pages = calendar_event_pages(columns, window, CALENDAR_STREAM_CHUNK_SIZE, after)
+        return StreamingResponse(
+            calendar_ndjson_stream(pages, keys),
+            media_type='application/x-ndjson',
+            headers=dict(response.headers),
+        )
 
-    reminders_by_event: Dict[str, List[Dict[str, Any]]] = {}
-    for reminder in reminders:
-        reminders_by_event.setdefault(reminder['event_id'], []).append(reminder)
+    events = await fetch_calendar_events(columns, window, limit + 1 if limit else None, after)
 
-    for event in events:
-        event['reminders'] = reminders_by_event.get(event['id'], [])
+    if limit and len(events) > limit:
+        events = events[:limit]
+        response.headers['X-Next-Cursor'] = encode_cursor(events[-1]['fecha_inicio'], events[-1]['id'])
 
+    if projection is not None:
+        # Proyección parcial: no encaja en CalendarEvent, se devuelve tal cual
+        return FastJSONResponse(
+            content=jsonable_encoder([{key: event.get(key) for key in projection} for event in events]),
+            headers=dict(response.headers),
+        )
+
+    if FAST_JSON_RESPONSES:
+        return trusted_rows_response(complete_trusted_rows(events, CALENDAR_TRUSTED_DEFAULTS), response)
     return events
 
-@api_router.put("/calendar/{event_id}", response_model=CalendarEvent)
-async def update_event(
-    event_id: str,
-    event_data: CalendarEventCreate,
+@api_router.get("/calendar/changes", response_model=CalendarChanges)
+async def get_calendar_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=CALENDAR_CHANGES_MAX_LIMIT),
     current_user: User = Depends(get_current_user)
 ):
-    update_data = event_data.model_dump()
+    """Eventos y recordatorios insertados, modificados o borrados desde `since`.
+
+    Sin `since` solo devuelve el cursor actual: pedirlo antes de la carga completa
+    y luego sincronizar con `since=<cursor>` (aplicar los cambios es idempotente).
+    Con `has_more` hay que repetir con el nuevo cursor. 410 si el cursor es anterior
+    al registro purgado: el cliente debe recargar el calendario completo.
+    """
+    if since:
+        last_txid, last_seq = decode_cursor(since, 2)
+        if not isinstance(last_txid, int) or not isinstance(last_seq, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    else:
+        last_txid, last_seq = 0, 0
 
-    if update_data.get('custom_fields') is None:
-        update_data['custom_fields'] = {}
-    
-    # Convert empty strings to None for optional fields
-    for field in ['order_number', 'client', 'supplier', 'amount', 'linked_order_id']:
-        if update_data.get(field) == '':
-            update_data[field] = None
-    
+    try:
+        result = await supabase.rpc(
+            'calendar_changes_since',
+            {'p_txid': last_txid, 'p_seq': last_seq, 'p_limit': limit if since else 0}
+        ).execute()
+    except APIError as e:
+        if e.code == 'PGRST202':
+            raise HTTPException(
+                status_code=503,
+                detail="Calendar change log not installed (run add_calendar_changes.sql)"
+            )
+        raise
+    changes = result.data[0]
+
+    if since and last_txid <= changes['purged_txid']:
+        raise HTTPException(status_code=410, detail="Sync cursor expired, reload the calendar")
+
+    has_more = bool(since) and changes['count'] >= limit
+    if has_more:
+        next_cursor = (changes['last_txid'], changes['last_seq'])
+    else:
+        # Todo lo anterior a xmin ya se entregó; el cursor nunca retrocede
+        next_cursor = max((last_txid, last_seq), (changes['xmin'], 0))
+
+    return {
+        'cursor': encode_cursor(*next_cursor),
+        'has_more': has_more,
+        'events': {'upserted': changes['events_upserted'], 'deleted': changes['events_deleted']},
+        'reminders': {'upserted': changes['reminders_upserted'], 'deleted': changes['reminders_deleted']},
+    }
+
+@api_router.get("/calendar/search", response_model=List[CalendarEvent])
+async def search_events(
+    request: Request,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    limit: int = Query(CALENDAR_SEARCH_PAGE_SIZE, ge=1, le=CALENDAR_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Eventos cuyos custom_fields contienen todos los filtros (p. ej. `?container_number=MSKU123`).
+
+    Solo se admiten las claves de CALENDAR_SEARCH_FIELDS, con coincidencia exacta
+    resuelta por el índice GIN de custom_fields. Mismo orden, ventana `from`/`to`
+    y paginación por cursor (X-Next-Cursor) que GET /calendar.
+    """
+    reserved = {'from', 'to', 'limit', 'cursor'}
+    filters = parse_custom_field_filters(
+        {key: value for key, value in request.query_params.items() if key not in reserved}
+    )
+    if cursor:
+        last_start, last_id = decode_calendar_cursor(cursor)
+    not_modified = check_collection_not_modified(request, response, 'calendar')
+    if not_modified:
+        return not_modified
+
+    columns = CALENDAR_TRUSTED_SELECT if FAST_JSON_RESPONSES else f"*,{CALENDAR_REMINDERS_EMBED}"
+    query = supabase.table('calendar_events').select(columns).contains('custom_fields', filters)
+    if date_to:
+        query = query.lte('fecha_inicio', date_to.isoformat())
+    if date_from:
+        query = query.gte('fecha_fin', date_from.isoformat())
+    if cursor:
+        query = query.or_(f"fecha_inicio.gt.{last_start},and(fecha_inicio.eq.{last_start},id.gt.{last_id})")
+
+    result = await query.order('fecha_inicio').order('id').limit(limit + 1).execute()
+    events = result.data or []
+    if len(events) > limit:
+        events = events[:limit]
+        response.headers['X-Next-Cursor'] = encode_cursor(events[-1]['fecha_inicio'], events[-1]['id'])
+
+    if FAST_JSON_RESPONSES:
+        return trusted_rows_response(complete_trusted_rows(events, CALENDAR_TRUSTED_DEFAULTS), response)
+    return events
+
+async def update_event_in_steps(event_id: str, update_data: Dict[str, Any], reminders_payload) -> Dict[str, Any]:
+    """Flujo por pasos (sin transacción) mientras no exista update_calendar_event en la BD"""
     # Obtener el evento actual
-    current_event_result = supabase.table('calendar_events').select('*').eq('id', event_id).execute()
+    current_event_result = await supabase.table('calendar_events').select('*').eq('id', event_id).execute()
     if not current_event_result.data:
         raise HTTPException(status_code=404, detail="Event not found")
     
     current_event = current_event_result.data[0]
-    
-    reminders_payload = update_data.pop('reminders', None)
 
     # Actualizar el evento
-    result = supabase.table('calendar_events').update(update_data).eq('id', event_id).execute()
+    result = await supabase.table('calendar_events').update(update_data).eq('id', event_id).execute()
     updated_event = result.data[0]
 
-    updated_reminders: List[Dict[str, Any]] = []
+    reminders_query = await supabase.table('event_reminders').select('*').eq('event_id', event_id).execute()
+    updated_reminders: List[Dict[str, Any]] = reminders_query.data or []
     if reminders_payload is not None:
-        supabase.table('event_reminders').delete().eq('event_id', event_id).execute()
-        if reminders_payload:
-            reminder_rows = []
-            for reminder in reminders_payload:
-                reminder_rows.append({
-                    'event_id': event_id,
-                    'title': reminder['title'],
-                    'description': reminder.get('description'),
-                    'reminder_date': normalize_reminder_date(reminder['reminder_date'])
-                })
-            insert_result = supabase.table('event_reminders').insert(reminder_rows).execute()
-            if insert_result.data:
-                updated_reminders = insert_result.data
-    else:
-        reminders_query = supabase.table('event_reminders').select('*').eq('event_id', event_id).execute()
-        updated_reminders = reminders_query.data or []
+        # Diff contra los recordatorios actuales: solo se escriben las filas que cambian
+        to_insert, to_update, to_delete = diff_reminders(updated_reminders, reminders_payload)
+        changes = ReminderChanges(deleted=to_delete)
+        if to_delete:
+            await supabase.table('event_reminders').delete().in_('id', to_delete).execute()
+        if to_update:
+            rows = [{**reminder, 'event_id': event_id} for reminder in to_update]
+            upsert_result = await supabase.table('event_reminders').upsert(rows).execute()
+            changes.updated = [row['id'] for row in upsert_result.data or []]
+        if to_insert:
+            rows = [{**reminder, 'event_id': event_id} for reminder in to_insert]
+            insert_result = await supabase.table('event_reminders').insert(rows).execute()
+            changes.inserted = [row['id'] for row in insert_result.data or []]
+        updated_event['reminder_changes'] = changes.model_dump()
+
+        if to_insert or to_update or to_delete:
+            reminders_query = await supabase.table('event_reminders').select('*').eq('event_id', event_id).execute()
+            updated_reminders = reminders_query.data or []
     
     # Si el evento es tipo "Pedido" o "Factura Proforma", actualizar en orders
-    event_type_result = supabase.table('event_types').select('name').eq('id', update_data['event_type_id']).execute()
-    if event_type_result.data:
-        event_type_name = event_type_result.data[0]['name']
-        
-        if event_type_name in ['Pedido', 'Factura Proforma']:
-            order_result = supabase.table('orders').select('*').eq('calendar_event_id', event_id).execute()
-            if order_result.data:
-                # Actualizar orden existente
-                order_update = {
-                    'order_number': update_data.get('order_number', ''),
-                    'supplier': update_data.get('supplier', ''),
-                    'client': update_data.get('client', ''),
-                    'amount': update_data.get('amount')
-                }
-                supabase.table('orders').update(order_update).eq('calendar_event_id', event_id).execute()
+    event_type_name = await event_type_cache.get_name(update_data['event_type_id'])
+    if event_type_name in ['Pedido', 'Factura Proforma']:
+        order_update = {
+            'order_number': update_data.get('order_number') or '',
+            'supplier': update_data.get('supplier') or '',
+            'client': update_data.get('client') or '',
+            'amount': update_data.get('amount')
+        }
+        order_result = await supabase.table('orders').update(order_update).eq('calendar_event_id', event_id).execute()
+        updated_event['order'] = order_result.data[0] if order_result.data else None
     
     # Manejar cambios en linked_order_id
     if update_data.get('linked_order_id') != current_event.get('linked_order_id'):
         # Eliminar vinculación anterior si existe
         if current_event.get('linked_order_id'):
-            supabase.table('event_links').delete().eq('event_id', event_id).execute()
+            await supabase.table('event_links').delete().eq('event_id', event_id).execute()
         
         # Crear nueva vinculación si se especifica
         if update_data.get('linked_order_id'):
@@ -597,50 +2241,89 @@ async def update_event(
                 'order_id': update_data['linked_order_id'],
                 'event_id': event_id
             }
-            supabase.table('event_links').insert(link_data).execute()
+            await supabase.table('event_links').insert(link_data).execute()
             
             # Si es "Factura Comisiones IBERFOODS", marcar pedido como completado
-            if event_type_result.data:
-                event_type_name = event_type_result.data[0]['name']
-                if event_type_name == 'Factura Comisiones IBERFOODS':
-                    supabase.table('orders').update({'status': 'completed'}).eq('id', update_data['linked_order_id']).execute()
+            if event_type_name == 'Factura Comisiones IBERFOODS':
+                await supabase.table('orders').update({'status': 'completed'}).eq('id', update_data['linked_order_id']).execute()
     
     updated_event['reminders'] = updated_reminders
+    return updated_event
+
+@api_router.put("/calendar/{event_id}", response_model=CalendarEvent)
+async def update_event(
+    event_id: str,
+    event_data: CalendarEventCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Actualiza el evento y sus efectos secundarios en una sola llamada transaccional.
+
+    Si `reminders` no se envía, los recordatorios existentes no se tocan. Si se
+    envía, se aplica como diff: los que traen `id` solo se reescriben si cambian,
+    y `reminder_changes` indica qué recordatorios se insertaron, actualizaron o borraron.
+    """
+    update_data, reminders_payload = prepare_event_payload(event_data)
+
+    rpc_result = await call_calendar_event_rpc(
+        'update_calendar_event',
+        {'p_event_id': event_id, 'p_event': update_data, 'p_reminders': reminders_payload}
+    )
+    if rpc_result is None:
+        updated_event = await update_event_in_steps(event_id, update_data, reminders_payload)
+    elif not rpc_result:
+        raise HTTPException(status_code=404, detail="Event not found")
+    else:
+        updated_event = rpc_result[0]
+    await record_change('update', {'calendar': [event_id], 'orders': []}, current_user)
+
     return CalendarEvent(**updated_event)
 
 @api_router.delete("/calendar/{event_id}")
 async def delete_event(event_id: str, current_user: User = Depends(get_current_user)):
     # Verificar si el evento existe y obtener sus datos
-    event_result = supabase.table('calendar_events').select('*').eq('id', event_id).execute()
+    event_result = await supabase.table('calendar_events').select('*').eq('id', event_id).execute()
     if not event_result.data:
         raise HTTPException(status_code=404, detail="Event not found")
     
     # Eliminar el evento (CASCADE eliminará la orden automáticamente si existe)
-    result = supabase.table('calendar_events').delete().eq('id', event_id).execute()
+    result = await supabase.table('calendar_events').delete().eq('id', event_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Event not found")
+    await record_change('delete', {'calendar': [event_id], 'orders': []}, current_user)
     
     return {"message": "Event deleted successfully"}
 
 
 @api_router.get("/pending-events", response_model=List[CalendarEvent])
-async def get_pending_events(current_user: User = Depends(get_current_user)):
-    # Buscar eventos cuyo custom_fields->>is_pending sea 'true'
-    result = supabase.table('calendar_events').select('*').filter('custom_fields->>is_pending', 'eq', 'true').execute()
+async def get_pending_events(request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    # Los pendientes son un filtro sobre calendar_events: comparten versión con /calendar
+    not_modified = check_collection_not_modified(request, response, 'calendar')
+    if not_modified:
+        return not_modified
 
-    pending_events = result.data if result.data else []
+    columns = ','.join(CALENDAR_EVENT_COLUMNS) if FAST_JSON_RESPONSES else '*'
 
-    # Compatibilidad: si se guardó como boolean JSON true, fallback con contains
-    if not pending_events:
-        alt_result = supabase.table('calendar_events').select('*').contains('custom_fields', {'is_pending': True}).execute()
-        pending_events = alt_result.data if alt_result.data else []
+    # Columna generada is_pending (add_pending_events_index.sql), con índice (is_pending, fecha_inicio, id)
+    try:
+        result = await supabase.table('calendar_events').select(columns).eq('is_pending', 'true') \
+            .order('fecha_inicio').order('id').execute()
+    except APIError as e:
+        if e.code != '42703':
+            raise
+        # Sin la migración: ->> devuelve 'true' tanto para el booleano JSON como para el texto
+        result = await supabase.table('calendar_events').select(columns).filter('custom_fields->>is_pending', 'eq', 'true') \
+            .order('fecha_inicio').order('id').execute()
+
+    pending_events = result.data if result.data else []
 
+    if FAST_JSON_RESPONSES:
+        return trusted_rows_response(complete_trusted_rows(pending_events, CALENDAR_TRUSTED_DEFAULTS), response)
     return pending_events
 
 
 @api_router.post("/pending-events/{event_id}/resolve")
 async def resolve_pending_event(event_id: str, current_user: User = Depends(get_current_user)):
-    event_result = supabase.table('calendar_events').select('custom_fields').eq('id', event_id).execute()
+    event_result = await supabase.table('calendar_events').select('custom_fields').eq('id', event_id).execute()
     if not event_result.data:
         raise HTTPException(status_code=404, detail="Event not found")
 
@@ -648,31 +2331,195 @@ async def resolve_pending_event(event_id: str, current_user: User = Depends(get_
     if 'is_pending' in custom_fields:
         custom_fields.pop('is_pending')
 
-    result = supabase.table('calendar_events').update({'custom_fields': custom_fields}).eq('id', event_id).execute()
+    result = await supabase.table('calendar_events').update({'custom_fields': custom_fields}).eq('id', event_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Event not found")
+    await record_change('update', {'calendar': [event_id]}, current_user)
 
     return {"message": "Pending flag removed"}
 
 # Kanban routes
+KANBAN_BATCH_MAX_SIZE = int(os.environ.get('KANBAN_BATCH_MAX_SIZE', '500'))
+KANBAN_STATUSES = ['todo', 'in_progress', 'done']
+KANBAN_COLUMN_PAGE_SIZE = int(os.environ.get('KANBAN_COLUMN_PAGE_SIZE', '100'))
+KANBAN_COLUMN_PAGE_MAX_SIZE = 500
+
+# Función create_kanban_task de add_kanban_rank.sql (None = aún no comprobado)
+kanban_create_rpc_available: Optional[bool] = None
+
+async def create_task_with_rpc(data: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Alta con la clave asignada en SQL; None si la función no existe en la BD"""
+    global kanban_create_rpc_available
+    if kanban_create_rpc_available is False:
+        return None
+    try:
+        result = await supabase.rpc('create_kanban_task', {'p_task': data}).execute()
+    except APIError as e:
+        if e.code == 'PGRST202':
+            kanban_create_rpc_available = False
+            logger.warning(
+                "RPC create_kanban_task not found, falling back to unlocked inserts. "
+                "Run add_kanban_rank.sql and restart the server."
+            )
+            return None
+        raise
+    kanban_create_rpc_available = True
+    return result.data or []
+
 @api_router.post("/kanban", response_model=KanbanTask)
 async def create_task(task_data: KanbanTaskCreate, current_user: User = Depends(get_current_user)):
+    """Crea la tarea; sin `position` se añade al final de la columna 'todo'.
+
+    La clave se calcula en la BD con la columna bloqueada, así dos altas simultáneas
+    no reciben la misma. Si hubo que renumerar la columna, se notifican todas sus tareas.
+    """
     data = task_data.model_dump()
     data['created_by'] = current_user.id
+    validate_rank_key(data['position'])
+
+    rows = await create_task_with_rpc(data)
+    if rows:
+        await record_change('create', {'kanban': [row['id'] for row in rows]}, current_user)
+        return KanbanTask(**rows[0])
+
+    if data['position'] is None:
+        # Al final de la columna 'todo' (estado por defecto)
+        last_result = await supabase.table('kanban_tasks').select('position').eq('status', 'todo') \
+            .order('position', desc=True, nullsfirst=False).limit(1).execute()
+        last_position = last_result.data[0]['position'] if last_result.data else None
+        if isinstance(last_position, int):
+            # Columna INTEGER (sin add_kanban_rank.sql): se deja el valor por defecto
+            data.pop('position')
+        else:
+            data['position'] = rank_key_after(last_position)
     
-    result = supabase.table('kanban_tasks').insert(data).execute()
+    result = await supabase.table('kanban_tasks').insert(data).execute()
+    await record_change('create', {'kanban': [result.data[0]['id']]}, current_user)
     return KanbanTask(**result.data[0])
 
-@api_router.get("/kanban", response_model=List[KanbanTask])
-async def get_tasks(current_user: User = Depends(get_current_user)):
-    # Ordenar solo por status (position se manejará en el cliente si no existe la columna)
-    result = supabase.table('kanban_tasks').select('*').order('status').execute()
-    
-    # Asegurar que todos tengan campo position (fallback para datos antiguos o sin columna)
-    for task in result.data:
-        if 'position' not in task or task['position'] is None:
-            task['position'] = 0
-    
+def split_filter_values(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+async def get_kanban_column(
+    column_status: str,
+    limit: int,
+    filters: Dict[str, List[str]],
+    after: Optional[List[Any]] = None
+) -> Dict[str, Any]:
+    """Una página de una columna ordenada por (position, id) (idx_kanban_tasks_status_position)"""
+    columns = KANBAN_TASK_COLUMNS if FAST_JSON_RESPONSES else '*'
+    query = supabase.table('kanban_tasks').select(columns).eq('status', column_status)
+    for column, values in filters.items():
+        query = query.in_(column, values) if len(values) > 1 else query.eq(column, values[0])
+
+    if after:
+        last_position, last_id = after
+        # gte acota el rango del índice; el or desempata por id dentro de la misma clave
+        query = query.gte('position', last_position).or_(
+            f"position.gt.{last_position},and(position.eq.{last_position},id.gt.{last_id})"
+        )
+
+    result = await query.order('position').order('id').limit(limit + 1).execute()
+    tasks = result.data or []
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(column_status, tasks[-1]['position'], tasks[-1]['id'])
+    if FAST_JSON_RESPONSES:
+        # Lo que haría KanbanTask.legacy_position con la columna INTEGER (el cursor
+        # conserva el entero)
+        for task in tasks:
+            if isinstance(task.get('position'), int):
+                task['position'] = rank_key_from_int(task['position'])
+    return {'status': column_status, 'tasks': tasks, 'next_cursor': next_cursor}
+
+@api_router.get("/kanban", response_model=List[KanbanColumn])
+async def get_tasks(
+    request: Request,
+    response: Response,
+    limit: int = Query(KANBAN_COLUMN_PAGE_SIZE, ge=1, le=KANBAN_COLUMN_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    assigned_to: Optional[str] = None,
+    task_type_id: Optional[str] = None,
+    priority: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Tareas agrupadas por columna y ordenadas por (status, position).
+
+    `limit` es el tamaño de página de cada columna; con `cursor` (el `next_cursor`
+    de una columna) se devuelve solo la siguiente página de esa columna. Los filtros
+    admiten varios valores separados por comas y se aplican en la consulta.
+    """
+    not_modified = check_collection_not_modified(request, response, 'kanban')
+    if not_modified:
+        return not_modified
+
+    filters = {
+        column: values
+        for column, values in (
+            ('assigned_to', split_filter_values(assigned_to)),
+            ('task_type_id', split_filter_values(task_type_id)),
+            ('priority', split_filter_values(priority)),
+        )
+        if values
+    }
+
+    if cursor:
+        column_status, last_position, last_id = decode_cursor(cursor, 3)
+        # position es entero si aún no se ejecutó add_kanban_rank.sql
+        valid_position = (
+            isinstance(last_position, int)
+            or (isinstance(last_position, str) and RANK_KEY_PATTERN.match(last_position))
+        )
+        if column_status not in KANBAN_STATUSES or not valid_position:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        try:
+            last_id = str(uuid.UUID(str(last_id)))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        columns = [await get_kanban_column(column_status, limit, filters, [last_position, last_id])]
+    else:
+        # Una consulta por columna, en paralelo
+        columns = await asyncio.gather(*(get_kanban_column(column_status, limit, filters) for column_status in KANBAN_STATUSES))
+
+    if FAST_JSON_RESPONSES:
+        return trusted_rows_response(columns, response)
+    return columns
+
+@api_router.put("/kanban/batch", response_model=List[KanbanTask])
+async def update_tasks_batch(batch: KanbanTaskBatch, current_user: User = Depends(get_current_user)):
+    """Aplica varios {id, status, position} en un solo UPDATE (todo o nada).
+
+    `position` es la clave fraccional calculada por el cliente entre las de las
+    tarjetas vecinas: mover una tarjeta solo modifica esa fila. Si una clave pasa de
+    48 caracteres o coincide con la de otra tarea, la BD renumera esa columna y la
+    respuesta incluye todas sus tareas con las claves nuevas.
+    """
+    if len(batch.changes) > KANBAN_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"Too many changes (max {KANBAN_BATCH_MAX_SIZE})")
+
+    # Si un id se repite, gana el último cambio
+    changes: Dict[str, Dict[str, Any]] = {}
+    for change in batch.changes:
+        validate_rank_key(change.position)
+        changes[change.id] = change.model_dump()
+    if not changes:
+        return []
+
+    try:
+        result = await supabase.rpc('kanban_apply_moves', {'p_changes': list(changes.values())}).execute()
+    except APIError as e:
+        if e.code == 'PGRST202':
+            raise HTTPException(
+                status_code=503,
+                detail="Kanban batch updates not installed (run add_kanban_rank.sql)"
+            )
+        raise
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    # Incluye las tareas de las columnas renumeradas, si las hay
+    await record_change('update', {'kanban': [row['id'] for row in result.data]}, current_user)
     return result.data
 
 @api_router.put("/kanban/{task_id}", response_model=KanbanTask)
@@ -685,84 +2532,183 @@ async def update_task(
     
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
+    validate_rank_key(update_data.get('position'))
     
-    # Eliminar 'position' si está presente (columna aún no existe en DB)
-    # Esto permite que el drag & drop funcione sin error hasta que se ejecute el SQL
-    if 'position' in update_data:
-        update_data.pop('position')
-    
-    # Si después de eliminar position no queda nada, no hacer update
-    if not update_data:
-        # Solo devolver la tarea actual sin actualizar
-        result = supabase.table('kanban_tasks').select('*').eq('id', task_id).execute()
-        if not result.data:
-            raise HTTPException(status_code=404, detail="Task not found")
-        task = result.data[0]
-        task['position'] = 0  # Fallback
-        return KanbanTask(**task)
-    
-    result = supabase.table('kanban_tasks').update(update_data).eq('id', task_id).execute()
+    result = await supabase.table('kanban_tasks').update(update_data).eq('id', task_id).execute()
     
     if not result.data:
         raise HTTPException(status_code=404, detail="Task not found")
+    await record_change('update', {'kanban': [task_id]}, current_user)
     
-    # Agregar position al resultado si no existe
-    task = result.data[0]
-    if 'position' not in task:
-        task['position'] = 0
-    
-    return KanbanTask(**task)
+    return KanbanTask(**result.data[0])
 
 @api_router.delete("/kanban/{task_id}")
 async def delete_task(task_id: str, current_user: User = Depends(get_current_user)):
-    result = supabase.table('kanban_tasks').delete().eq('id', task_id).execute()
+    result = await supabase.table('kanban_tasks').delete().eq('id', task_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Task not found")
+    await record_change('delete', {'kanban': [task_id]}, current_user)
     return {"message": "Task deleted successfully"}
 
 # Orders routes (Sistema de pedidos en sidebar)
+ORDER_STATUSES = ['active', 'completed', 'deleted']
+ORDERS_PAGE_MAX_SIZE = 500
+
+def decode_orders_cursor(cursor: str):
+    """Cursor de pedidos: (created_at, id) del último pedido de la página anterior"""
+    last_created_at, last_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(str(last_created_at)).isoformat(), str(uuid.UUID(str(last_id)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_orders_filters(
+    order_status: str,
+    client: Optional[str],
+    supplier: Optional[str],
+    date_from: Optional[date],
+    date_to: Optional[date],
+    min_amount: Optional[float],
+    max_amount: Optional[float],
+) -> Dict[str, Any]:
+    statuses = split_filter_values(order_status)
+    unknown = [value for value in statuses if value not in ORDER_STATUSES]
+    if not statuses or unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid status (allowed: {', '.join(ORDER_STATUSES)})")
+    return {
+        'status': statuses,
+        'client': split_filter_values(client),
+        'supplier': split_filter_values(supplier),
+        'date_from': date_from,
+        'date_to': date_to,
+        'min_amount': min_amount,
+        'max_amount': max_amount,
+    }
+
+def build_orders_query(select: str, filters: Dict[str, Any], after: Optional[Tuple[str, str]] = None):
+    """Consulta de pedidos filtrada y ordenada por (created_at, id) descendente, tras `after` si se indica"""
+    query = supabase.table('orders').select(select)
+    # Índices (status, created_at, id), (status, client, ...) y (status, supplier, ...) de add_orders_indexes.sql
+    for column in ('status', 'client', 'supplier'):
+        values = filters[column]
+        if values:
+            query = query.in_(column, values) if len(values) > 1 else query.eq(column, values[0])
+    if filters['date_from']:
+        query = query.gte('created_at', filters['date_from'].isoformat())
+    if filters['date_to']:
+        query = query.lt('created_at', (filters['date_to'] + timedelta(days=1)).isoformat())
+    if filters['min_amount'] is not None:
+        query = query.gte('amount', filters['min_amount'])
+    if filters['max_amount'] is not None:
+        query = query.lte('amount', filters['max_amount'])
+    if after:
+        last_created_at, last_id = after
+        # lte acota el rango del índice; el or desempata por id dentro del mismo instante
+        query = query.lte('created_at', last_created_at).or_(
+            f'created_at.lt."{last_created_at}",and(created_at.eq."{last_created_at}",id.lt.{last_id})'
+        )
+    return query.order('created_at', desc=True).order('id', desc=True)
+
 @api_router.get("/orders", response_model=List[Order])
-async def get_active_orders(current_user: User = Depends(get_current_user)):
-    """Obtener todos los pedidos activos para mostrar en sidebar"""
-    result = supabase.table('orders').select('*').eq('status', 'active').order('created_at', desc=True).execute()
-    return result.data
+async def get_active_orders(
+    request: Request,
+    response: Response,
+    order_status: str = Query('active', alias="status"),
+    client: Optional[str] = None,
+    supplier: Optional[str] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    limit: Optional[int] = Query(None, ge=1, le=ORDERS_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Pedidos del sidebar, del más reciente al más antiguo por (created_at, id).
+
+    Por defecto solo los activos; `status` admite varios valores separados por comas
+    (active, completed, deleted), igual que `client` y `supplier` (coincidencia exacta).
+    `from`/`to` filtran por fecha de creación y `min_amount`/`max_amount` por importe.
+    Con `limit` se pagina por cursor (X-Next-Cursor), como GET /calendar.
+    """
+    filters = parse_orders_filters(order_status, client, supplier, date_from, date_to, min_amount, max_amount)
+    after = decode_orders_cursor(cursor) if cursor else None
+    not_modified = check_collection_not_modified(request, response, 'orders')
+    if not_modified:
+        return not_modified
+
+    def build_query(select: str):
+        query = build_orders_query(select, filters, after)
+        return query.limit(limit + 1) if limit else query
+
+    columns = ORDER_COLUMNS if FAST_JSON_RESPONSES else '*'
+    try:
+        # Documentos del pedido en la misma consulta (add_order_lifecycle.sql)
+        result = await build_query(f'{columns},{ORDER_LIFECYCLE_EMBED}').execute()
+    except APIError as e:
+        # Sin la migración no hay relación que embeber: pedidos sin lifecycle
+        if e.code != 'PGRST200':
+            raise
+        result = await build_query(columns).execute()
+    orders = result.data or []
+
+    if limit and len(orders) > limit:
+        orders = orders[:limit]
+        response.headers['X-Next-Cursor'] = encode_cursor(orders[-1]['created_at'], orders[-1]['id'])
+
+    if FAST_JSON_RESPONSES:
+        return trusted_rows_response(complete_trusted_rows(orders, ORDER_TRUSTED_DEFAULTS), response)
+    return orders
+
+# Vinculaciones con su evento y el nombre del tipo en una sola consulta (embebido PostgREST)
+LINKED_EVENTS_SELECT = 'order_id, event:calendar_events(id, title, order_number, event_type:event_types(name))'
+LINKED_EVENTS_MAX_ORDERS = 200
+
+def build_linked_event(link: Dict[str, Any]) -> Dict[str, Any]:
+    event = link.get('event') or {}
+    event_type = event.get('event_type') or {}
+    return {
+        'id': event['id'],
+        'title': event['title'],
+        'event_type_name': event_type.get('name') or 'Unknown',
+        'order_number': event.get('order_number', '')
+    }
+
+@api_router.get("/orders/linked-events")
+async def get_orders_linked_events(
+    order_ids: str = Query(..., description="IDs de pedidos separados por comas"),
+    current_user: User = Depends(get_current_user)
+):
+    """Obtener los eventos vinculados de varios pedidos a la vez, agrupados por pedido"""
+    ids = list(dict.fromkeys(order_id.strip() for order_id in order_ids.split(',') if order_id.strip()))
+    if len(ids) > LINKED_EVENTS_MAX_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Too many order ids (max {LINKED_EVENTS_MAX_ORDERS})")
+
+    linked_events: Dict[str, List[Dict[str, Any]]] = {order_id: [] for order_id in ids}
+    if not ids:
+        return linked_events
+
+    links_result = await supabase.table('event_links').select(LINKED_EVENTS_SELECT).in_('order_id', ids).execute()
+    for link in links_result.data or []:
+        if link.get('event'):
+            linked_events.setdefault(link['order_id'], []).append(build_linked_event(link))
+
+    return linked_events
 
 @api_router.get("/orders/{order_id}/linked-events")
 async def get_order_linked_events(order_id: str, current_user: User = Depends(get_current_user)):
     """Obtener todos los eventos vinculados a un pedido"""
-    # Obtener los IDs de eventos vinculados
-    links_result = supabase.table('event_links').select('event_id').eq('order_id', order_id).execute()
-    
-    if not links_result.data:
-        return []
-    
-    event_ids = [link['event_id'] for link in links_result.data]
-    
-    # Obtener los eventos completos
-    events_result = supabase.table('calendar_events').select('id, title, event_type_id, order_number').in_('id', event_ids).execute()
-    
-    # Enriquecer con nombre del tipo de evento
-    enriched_events = []
-    for event in events_result.data:
-        event_type_result = supabase.table('event_types').select('name').eq('id', event['event_type_id']).execute()
-        event_type_name = event_type_result.data[0]['name'] if event_type_result.data else 'Unknown'
-        
-        enriched_events.append({
-            'id': event['id'],
-            'title': event['title'],
-            'event_type_name': event_type_name,
-            'order_number': event.get('order_number', '')
-        })
-    
-    return enriched_events
+    links_result = await supabase.table('event_links').select(LINKED_EVENTS_SELECT).eq('order_id', order_id).execute()
+    return [build_linked_event(link) for link in links_result.data or [] if link.get('event')]
 
 @api_router.delete("/orders/{order_id}")
 async def delete_order(order_id: str, current_user: User = Depends(get_current_user)):
     """Eliminar un pedido manualmente desde el sidebar"""
     # Cambiar status a 'deleted' en lugar de eliminar físicamente
-    result = supabase.table('orders').update({'status': 'deleted'}).eq('id', order_id).execute()
+    result = await supabase.table('orders').update({'status': 'deleted'}).eq('id', order_id).execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Order not found")
+    await record_change('delete', {'orders': [order_id]}, current_user)
     return {"message": "Order deleted successfully"}
 
 @api_router.post("/event-links", response_model=EventLink)
@@ -771,27 +2717,26 @@ async def create_event_link(link_data: EventLinkCreate, current_user: User = Dep
     data = link_data.model_dump()
     
     # Verificar que el pedido existe
-    order_result = supabase.table('orders').select('*').eq('id', data['order_id']).execute()
+    order_result = await supabase.table('orders').select('*').eq('id', data['order_id']).execute()
     if not order_result.data:
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Verificar que el evento existe
-    event_result = supabase.table('calendar_events').select('*').eq('id', data['event_id']).execute()
+    event_result = await supabase.table('calendar_events').select('*').eq('id', data['event_id']).execute()
     if not event_result.data:
         raise HTTPException(status_code=404, detail="Event not found")
     
     # Crear vinculación
-    result = supabase.table('event_links').insert(data).execute()
+    result = await supabase.table('event_links').insert(data).execute()
     
     # Actualizar linked_order_id en el evento
-    supabase.table('calendar_events').update({'linked_order_id': data['order_id']}).eq('id', data['event_id']).execute()
+    await supabase.table('calendar_events').update({'linked_order_id': data['order_id']}).eq('id', data['event_id']).execute()
     
     # Si el evento es "Factura Comisiones IBERFOODS", completar el pedido
-    event_type_result = supabase.table('event_types').select('name').eq('id', event_result.data[0]['event_type_id']).execute()
-    if event_type_result.data:
-        event_type_name = event_type_result.data[0]['name']
-        if event_type_name == 'Factura Comisiones IBERFOODS':
-            supabase.table('orders').update({'status': 'completed'}).eq('id', data['order_id']).execute()
+    event_type_name = await event_type_cache.get_name(event_result.data[0]['event_type_id'])
+    if event_type_name == 'Factura Comisiones IBERFOODS':
+        await supabase.table('orders').update({'status': 'completed'}).eq('id', data['order_id']).execute()
+    await record_change('update', {'calendar': [data['event_id']], 'orders': [data['order_id']]}, current_user)
     
     return EventLink(**result.data[0])
 
@@ -799,32 +2744,440 @@ async def create_event_link(link_data: EventLinkCreate, current_user: User = Dep
 async def delete_event_link(link_id: str, current_user: User = Depends(get_current_user)):
     """Eliminar vinculación entre evento y pedido"""
     # Obtener la vinculación para actualizar el evento
-    link_result = supabase.table('event_links').select('*').eq('id', link_id).execute()
+    link_result = await supabase.table('event_links').select('*').eq('id', link_id).execute()
     if not link_result.data:
         raise HTTPException(status_code=404, detail="Link not found")
     
     event_id = link_result.data[0]['event_id']
+    order_id = link_result.data[0]['order_id']
     
     # Eliminar vinculación
-    supabase.table('event_links').delete().eq('id', link_id).execute()
+    await supabase.table('event_links').delete().eq('id', link_id).execute()
     
     # Actualizar linked_order_id en el evento a NULL
-    supabase.table('calendar_events').update({'linked_order_id': None}).eq('id', event_id).execute()
+    await supabase.table('calendar_events').update({'linked_order_id': None}).eq('id', event_id).execute()
+    # El lifecycle embebido en GET /orders cambia con el vínculo
+    await record_change('update', {'calendar': [event_id], 'orders': [order_id]}, current_user)
     
     return {"message": "Link deleted successfully"}
 
+# Informes (add_order_reports.sql). Se cachean por parámetros y versión de pedidos y
+# calendario: una escritura en este proceso los invalida al momento, las de otros
+# workers como mucho tras REPORT_CACHE_TTL_SECONDS
+REPORT_GROUP_BY = ['client', 'supplier', 'month', 'status']
+REPORT_CACHE_TTL_SECONDS = float(os.environ.get('REPORT_CACHE_TTL_SECONDS', '60'))
+report_cache = TTLCache(64, REPORT_CACHE_TTL_SECONDS)
+
+@api_router.get("/reports/orders", response_model=List[OrderReportRow])
+async def get_orders_report(
+    group_by: str = 'month',
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    order_status: Optional[str] = Query(None, alias="status"),
+    current_user: User = Depends(get_current_user)
+):
+    """Pedidos agregados por `group_by` (client, supplier, month, status; varios separados
+    por comas): número, suma y media de `amount`, y días hasta la factura de comisiones.
+
+    `from`/`to` filtran por la fecha del evento del pedido y `status` por estado.
+    """
+    dimensions = split_filter_values(group_by)
+    unknown = [value for value in dimensions if value not in REPORT_GROUP_BY]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by (allowed: {', '.join(REPORT_GROUP_BY)})")
+    statuses = split_filter_values(order_status) or None
+    if statuses and any(value not in ORDER_STATUSES for value in statuses):
+        raise HTTPException(status_code=400, detail=f"Invalid status (allowed: {', '.join(ORDER_STATUSES)})")
+
+    cache_key = (
+        tuple(dimensions), date_from, date_to, tuple(statuses or ()),
+        collection_versions.version('orders'), collection_versions.version('calendar'),
+    )
+    cached = report_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        result = await supabase.rpc('order_report', {
+            'p_group_by': dimensions,
+            'p_from': date_from.isoformat() if date_from else None,
+            'p_to': date_to.isoformat() if date_to else None,
+            'p_statuses': statuses,
+        }).execute()
+    except APIError as e:
+        if e.code == 'PGRST202':
+            raise HTTPException(status_code=503, detail="Order reports not installed (run add_order_reports.sql)")
+        raise
+
+    rows = result.data or []
+    report_cache.set(cache_key, rows)
+    return rows
+
+# Exportación (GET /export/{calendar|orders|kanban}): recorre la tabla por páginas de
+# EXPORT_PAGE_SIZE filas con la misma paginación por clave que los listados y escribe
+# cada página en la respuesta según llega, sin acumular la tabla en memoria.
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', '1000'))
+EXPORT_COLLECTIONS = ['calendar', 'orders', 'kanban']
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': XLSX_MEDIA_TYPE,
+}
+EXPORT_COLUMNS = {
+    'calendar': CALENDAR_EVENT_COLUMNS,
+    'orders': ORDER_COLUMNS.split(','),
+    'kanban': KANBAN_TASK_COLUMNS.split(','),
+}
+# Caracteres de control no admitidos en XML (XLSX)
+XML_ILLEGAL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+class DrainBuffer:
+    """Destino de escritura sin seek: ZipFile escribe aquí y el generador lo vacía por trozos"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+class XlsxStreamWriter:
+    """XLSX mínimo (una hoja, texto en línea) escrito en streaming.
+
+    openpyxl solo entrega el fichero al cerrarlo; aquí cada fila va al XML de la
+    hoja dentro de un zip sin seek y los bytes comprimidos salen según se generan.
+    """
+
+    CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    )
+    ROOT_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    )
+    WORKBOOK = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    )
+    WORKBOOK_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    )
+
+    def __init__(self, sheet_name: str):
+        self.buffer = DrainBuffer()
+        self.zip = zipfile.ZipFile(self.buffer, 'w', compression=zipfile.ZIP_DEFLATED)
+        self.zip.writestr('[Content_Types].xml', self.CONTENT_TYPES)
+        self.zip.writestr('_rels/.rels', self.ROOT_RELS)
+        self.zip.writestr('xl/workbook.xml', self.WORKBOOK.format(name=xml_escape(sheet_name)))
+        self.zip.writestr('xl/_rels/workbook.xml.rels', self.WORKBOOK_RELS)
+        self.sheet = self.zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+        self.sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+
+    @staticmethod
+    def cell(value: Any) -> str:
+        if value is None:
+            return '<c/>'
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return f'<c><v>{value}</v></c>'
+        text = XML_ILLEGAL_CHARS.sub('', export_text(value))
+        return f'<c t="inlineStr"><is><t xml:space="preserve">{xml_escape(text)}</t></is></c>'
+
+    def write_rows(self, rows: List[List[Any]]) -> bytes:
+        self.sheet.write(''.join(
+            '<row>' + ''.join(self.cell(value) for value in row) + '</row>' for row in rows
+        ).encode())
+        return self.buffer.drain()
+
+    def close(self) -> bytes:
+        self.sheet.write(b'</sheetData></worksheet>')
+        self.sheet.close()
+        self.zip.close()
+        return self.buffer.drain()
+
+def export_text(value: Any) -> str:
+    """Valor de una celda CSV/XLSX: JSON para listas y objetos (custom_fields)"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+async def export_calendar_pages(date_from: Optional[date], date_to: Optional[date], with_reminders: bool):
+    columns = ','.join(CALENDAR_EVENT_COLUMNS)
+    if with_reminders:
+        columns += f",reminders:event_reminders({model_columns(EventReminder)})"
+    window = (date_from, date_to) if date_from or date_to else None
+    async for rows in calendar_event_pages(columns, window, EXPORT_PAGE_SIZE):
+        yield rows
+
+async def export_orders_pages(filters: Dict[str, Any]):
+    after = None
+    while True:
+        result = await build_orders_query(ORDER_COLUMNS, filters, after).limit(EXPORT_PAGE_SIZE).execute()
+        rows = result.data or []
+        if rows:
+            yield rows
+        if len(rows) < EXPORT_PAGE_SIZE:
+            return
+        after = (rows[-1]['created_at'], rows[-1]['id'])
+
+async def export_kanban_pages(filters: Dict[str, List[str]]):
+    """Columna a columna (todo, in_progress, done), cada una en el orden del tablero"""
+    for column_status in KANBAN_STATUSES:
+        after = None
+        while True:
+            page = await get_kanban_column(column_status, EXPORT_PAGE_SIZE, filters, after)
+            if page['tasks']:
+                yield page['tasks']
+            if not page['next_cursor']:
+                break
+            after = [page['tasks'][-1]['position'], page['tasks'][-1]['id']]
+
+async def export_stream(pages, columns: List[str], export_format: str, sheet_name: str):
+    if export_format == 'ndjson':
+        async for rows in pages:
+            yield b''.join(ndjson_line({column: row.get(column) for column in columns}) for row in rows)
+    elif export_format == 'xlsx':
+        writer = XlsxStreamWriter(sheet_name)
+        yield writer.write_rows([columns])
+        async for rows in pages:
+            yield writer.write_rows([[row.get(column) for column in columns] for row in rows])
+        yield writer.close()
+    else:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM para que Excel abra el CSV como UTF-8
+        writer.writerow(columns)
+        yield ('\ufeff' + buffer.getvalue()).encode()
+        async for rows in pages:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                [None if row.get(column) is None else export_text(row.get(column)) for column in columns]
+                for row in rows
+            )
+            yield buffer.getvalue().encode()
+
+@api_router.get("/export/{collection}")
+async def export_collection(
+    collection: str,
+    export_format: str = Query('csv', alias="format"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    order_status: str = Query('active', alias="status"),
+    client: Optional[str] = None,
+    supplier: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    assigned_to: Optional[str] = None,
+    task_type_id: Optional[str] = None,
+    priority: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Descarga completa de `calendar`, `orders` o `kanban` en CSV, NDJSON o XLSX (`format`).
+
+    Admite los filtros del listado correspondiente: `from`/`to` en calendar;
+    `status`, `client`, `supplier`, `from`/`to` y `min_amount`/`max_amount` en orders;
+    `assigned_to`, `task_type_id` y `priority` en kanban. En NDJSON los eventos
+    incluyen sus recordatorios; en CSV/XLSX custom_fields se escribe como JSON.
+    """
+    if collection not in EXPORT_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown collection (allowed: {', '.join(EXPORT_COLLECTIONS)})")
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format (allowed: {', '.join(EXPORT_FORMATS)})")
+
+    # Los filtros se validan antes de empezar a enviar la respuesta
+    if collection == 'calendar':
+        pages = export_calendar_pages(date_from, date_to, with_reminders=export_format == 'ndjson')
+    elif collection == 'orders':
+        filters = parse_orders_filters(order_status, client, supplier, date_from, date_to, min_amount, max_amount)
+        pages = export_orders_pages(filters)
+    else:
+        filters = {
+            column: values
+            for column, values in (
+                ('assigned_to', split_filter_values(assigned_to)),
+                ('task_type_id', split_filter_values(task_type_id)),
+                ('priority', split_filter_values(priority)),
+            )
+            if values
+        }
+        pages = export_kanban_pages(filters)
+
+    columns = EXPORT_COLUMNS[collection]
+    if collection == 'calendar' and export_format == 'ndjson':
+        columns = columns + ['reminders']
+    filename = f"{collection}-{datetime.now(timezone.utc):%Y%m%d}.{export_format}"
+    return StreamingResponse(
+        export_stream(pages, columns, export_format, collection),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+# Búsqueda de texto completo (add_search.sql)
+SEARCH_TYPES = ['event', 'order', 'task']
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX_SIZE = 100
+SEARCH_MAX_CANDIDATES = int(os.environ.get('SEARCH_MAX_CANDIDATES', '5000'))
+
+@api_router.get("/search", response_model=List[SearchResult])
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=2, max_length=200),
+    types: Optional[str] = None,
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Eventos, pedidos y tareas que contienen todas las palabras de `q` (como prefijo,
+    sin acentos), ordenados por relevancia.
+
+    `types` limita los resultados (`event,order,task`). Si hay más resultados, la
+    cabecera X-Next-Cursor contiene el valor a enviar como `cursor`.
+    """
+    selected_types = split_filter_values(types) or SEARCH_TYPES
+    unknown = [value for value in selected_types if value not in SEARCH_TYPES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown types: {', '.join(unknown)}")
+
+    params: Dict[str, Any] = {
+        'p_query': q,
+        'p_types': selected_types,
+        'p_limit': limit + 1,
+        'p_max_candidates': SEARCH_MAX_CANDIDATES,
+    }
+    if cursor:
+        last_rank, last_type, last_id = decode_cursor(cursor, 3)
+        if not isinstance(last_rank, (int, float)) or last_type not in SEARCH_TYPES:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        try:
+            last_id = str(uuid.UUID(str(last_id)))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        params.update({'p_after_rank': last_rank, 'p_after_type': last_type, 'p_after_id': last_id})
+
+    try:
+        result = await supabase.rpc('search_all', params).execute()
+    except APIError as e:
+        if e.code == 'PGRST202':
+            raise HTTPException(status_code=503, detail="Search not installed (run add_search.sql)")
+        raise
+
+    results = result.data or []
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last['rank'], last['type'], last['id'])
+    return results
+
+# Live updates (Server-Sent Events)
+def format_sse(event: str, data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+@api_router.post("/live/ticket", response_model=LiveTicket)
+async def create_live_ticket(current_user: User = Depends(get_current_user)):
+    """Ticket para abrir GET /live: EventSource no permite enviar cabeceras y el JWT de
+    sesión no debe acabar en la URL (logs de proxies y accesos). Solo sirve para /live
+    y caduca en LIVE_TICKET_TTL_SECONDS; se comprueba al conectar, no durante el stream.
+    """
+    ticket = create_access_token(
+        data={"sub": current_user.id, "scope": "live"},
+        expires_delta=timedelta(seconds=LIVE_TICKET_TTL_SECONDS),
+    )
+    return LiveTicket(ticket=ticket, expires_in=LIVE_TICKET_TTL_SECONDS)
+
+@api_router.get("/live")
+async def live_updates(
+    ticket: str = Query(..., description="Ticket de POST /live/ticket"),
+    collections: Optional[str] = Query(None, description="calendar,kanban,orders (por defecto todas)"),
+    last_event_id: Optional[str] = Header(None),
+    last_id: Optional[str] = Query(None, description="Last-Event-ID al reabrir con un ticket nuevo"),
+):
+    """Stream de cambios: `event: change` con {collection, op, ids, by}.
+
+    `event: reset` indica que se han perdido mensajes (cliente lento o reconexión a
+    otro worker) y hay que recargar las colecciones suscritas.
+    """
+    await get_user_from_token(ticket, scope='live')
+    requested = [c.strip() for c in collections.split(',') if c.strip()] if collections else LIVE_COLLECTIONS
+    unknown = [c for c in requested if c not in LIVE_COLLECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown collections: {', '.join(unknown)}")
+
+    await change_hub.start()
+    queue = change_hub.subscribe(requested, last_event_id or last_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    entry = await asyncio.wait_for(queue.get(), timeout=LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Mantiene viva la conexión a través de proxies
+                    yield ": ping\n\n"
+                    continue
+                if entry is None:
+                    return
+                event_id, message = entry
+                if message is None:
+                    yield format_sse('reset', {'collections': requested}, event_id)
+                else:
+                    yield format_sse('change', message, event_id)
+        finally:
+            change_hub.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 # Include router
 app.include_router(api_router)
 
+@app.on_event("shutdown")
+async def release_resources():
+    await change_hub.stop()
+    await supabase_http_client.aclose()
+    password_hasher.executor.shutdown(wait=False)
+
 cors_origins_raw = os.environ.get('CORS_ORIGINS', 'http://localhost:3000,http://127.0.0.1:3000')
 cors_origins = [origin.strip() for origin in cors_origins_raw.split(',') if origin.strip()]
 
+app.add_middleware(CompressionMiddleware, compression=response_compression)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=cors_origins,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 logging.basicConfig(
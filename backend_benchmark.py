@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+
+class APIBenchmark:
+    """Benchmarks de carga contra el backend desplegado.
+
+    Lanza N clientes concurrentes contra cada endpoint y mide la latencia
+    (p50/p95/p99) para comprobar que no crece linealmente con la concurrencia.
+    """
+
+    def __init__(self, base_url=None):
+        env_base_url = os.getenv("BACKEND_BASE_URL")
+        resolved_base_url = base_url or env_base_url or "http://localhost:8000/api"
+        self.base_url = resolved_base_url.rstrip("/")
+        self.email = os.getenv("BENCHMARK_EMAIL")
+        self.password = os.getenv("BENCHMARK_PASSWORD")
+        self.requests_per_client = int(os.getenv("BENCHMARK_REQUESTS_PER_CLIENT", "20"))
+        self.concurrency_levels = [
+            int(level) for level in os.getenv("BENCHMARK_CONCURRENCY", "1,5,10,25,50").split(",") if level.strip()
+        ]
+        self.server_cores = int(os.getenv("BENCHMARK_SERVER_CORES", "1"))
+        self.token = None
+        self.results = []
+
+    def login(self):
+        """Obtener token con las credenciales de BENCHMARK_EMAIL / BENCHMARK_PASSWORD"""
+        if not self.email or not self.password:
+            print("❌ BENCHMARK_EMAIL y BENCHMARK_PASSWORD deben estar configurados")
+            return False
+
+        response = requests.post(
+            f"{self.base_url}/auth/login",
+            json={"email": self.email, "password": self.password},
+            timeout=30
+        )
+        if response.status_code != 200:
+            print(f"❌ Login failed: {response.status_code} - {response.text[:200]}")
+            return False
+
+        self.token = response.json()['access_token']
+        return True
+
+    def _headers(self, extra=None):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        if extra:
+            headers.update(extra)
+        return headers
+
+    @staticmethod
+    def _percentile(samples, percent):
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def _timed_request(self, session, method, url, headers, body=None):
+        start = time.perf_counter()
+        response = session.request(method, url, headers=headers, json=body, timeout=60)
+        content = response.content
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        # raw.tell(): bytes recibidos antes de descomprimir (gzip/br)
+        return elapsed_ms, response.status_code, len(content), response.raw.tell() or len(content)
+
+    def _client_worker(self, method, url, headers, body):
+        samples = []
+        with requests.Session() as session:
+            for _ in range(self.requests_per_client):
+                samples.append(self._timed_request(session, method, url, headers, body))
+        return samples
+
+    def run_scenario(self, name, method, endpoint, headers=None, body=None, concurrency_levels=None):
+        """Ejecutar un endpoint con cada nivel de concurrencia y registrar percentiles"""
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        request_headers = self._headers(headers)
+
+        print(f"\n⏱️  {name} ({method} {url})")
+        for clients in concurrency_levels or self.concurrency_levels:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                futures = [
+                    executor.submit(self._client_worker, method, url, request_headers, body)
+                    for _ in range(clients)
+                ]
+                samples = [sample for future in futures for sample in future.result()]
+            wall_seconds = time.perf_counter() - started
+
+            latencies = [sample[0] for sample in samples]
+            errors = sum(1 for sample in samples if sample[1] >= 400)
+            result = {
+                "scenario": name,
+                "endpoint": endpoint,
+                "clients": clients,
+                "requests": len(samples),
+                "errors": errors,
+                "throughput_rps": len(samples) / wall_seconds if wall_seconds else 0,
+                "p50_ms": statistics.median(latencies) if latencies else 0,
+                "p95_ms": self._percentile(latencies, 95),
+                "p99_ms": self._percentile(latencies, 99),
+                "avg_bytes": statistics.mean(sample[2] for sample in samples) if samples else 0,
+                "avg_wire_bytes": statistics.mean(sample[3] for sample in samples) if samples else 0,
+                "accept_encoding": request_headers.get("Accept-Encoding"),
+            }
+            self.results.append(result)
+            print(
+                f"   {clients:>3} clients: p50={result['p50_ms']:.1f}ms "
+                f"p99={result['p99_ms']:.1f}ms rps={result['throughput_rps']:.1f} errors={errors}"
+            )
+
+    def benchmark_list_endpoints(self):
+        """Latencia de los endpoints que el dashboard dispara en paralelo al cargar"""
+        for endpoint in ["calendar", "event-types", "orders", "pending-events", "kanban"]:
+            self.run_scenario(f"GET /{endpoint}", "GET", endpoint)
+
+    def benchmark_compression(self):
+        """Bytes en la red y latencia de /calendar sin comprimir, con gzip y con brotli"""
+        for encoding in ["identity", "gzip", "br"]:
+            self.run_scenario(
+                f"GET /calendar ({encoding})",
+                "GET",
+                "calendar",
+                headers={"Accept-Encoding": encoding},
+                concurrency_levels=[1, 10]
+            )
+        baseline = {
+            result["clients"]: result for result in self.results
+            if result["scenario"] == "GET /calendar (identity)"
+        }
+        for result in self.results:
+            before = baseline.get(result["clients"])
+            if not result["scenario"].startswith("GET /calendar (") or not before or not result["avg_wire_bytes"]:
+                continue
+            result["wire_ratio"] = before["avg_wire_bytes"] / result["avg_wire_bytes"]
+            print(
+                f"   {result['scenario']} {result['clients']:>3} clients: "
+                f"{result['avg_wire_bytes'] / 1024:.1f} KiB ({result['wire_ratio']:.1f}x menos), "
+                f"p50 {before['p50_ms']:.1f}ms -> {result['p50_ms']:.1f}ms"
+            )
+
+    def benchmark_calendar_stream(self):
+        """Tiempo hasta el primer byte y total de /calendar en JSON y en NDJSON (streaming)"""
+        url = f"{self.base_url}/calendar"
+        print(f"\n⏱️  GET /calendar JSON vs NDJSON ({url})")
+        for accept in ["application/json", "application/x-ndjson"]:
+            first_byte, total = [], []
+            with requests.Session() as session:
+                for _ in range(self.requests_per_client):
+                    start = time.perf_counter()
+                    response = session.get(url, headers=self._headers({"Accept": accept}), stream=True, timeout=60)
+                    chunks = response.iter_content(chunk_size=None)
+                    next(chunks, b"")
+                    first_byte.append((time.perf_counter() - start) * 1000)
+                    for _ in chunks:
+                        pass
+                    total.append((time.perf_counter() - start) * 1000)
+            result = {
+                "scenario": f"GET /calendar ({accept})",
+                "endpoint": "calendar",
+                "clients": 1,
+                "requests": len(total),
+                "ttfb_p50_ms": statistics.median(first_byte),
+                "p50_ms": statistics.median(total),
+                "p95_ms": self._percentile(total, 95),
+            }
+            self.results.append(result)
+            print(
+                f"   {accept:<22} ttfb p50={result['ttfb_p50_ms']:.1f}ms "
+                f"total p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms"
+            )
+
+    def benchmark_login(self):
+        """Throughput de login (bcrypt) por núcleo del servidor"""
+        self.run_scenario(
+            "POST /auth/login",
+            "POST",
+            "auth/login",
+            body={"email": self.email, "password": self.password}
+        )
+        for result in self.results:
+            if result["scenario"] == "POST /auth/login":
+                result["rps_per_core"] = result["throughput_rps"] / self.server_cores
+                print(f"   {result['clients']:>3} clients: {result['rps_per_core']:.1f} logins/s per core")
+
+    def run_all_benchmarks(self):
+        print("🚀 Starting Company Management API Benchmarks")
+        print(f"📍 Base URL: {self.base_url}")
+        print("=" * 60)
+
+        if not self.login():
+            return False
+
+        self.benchmark_list_endpoints()
+        self.benchmark_compression()
+        self.benchmark_calendar_stream()
+        self.benchmark_login()
+        return True
+
+
+def main():
+    benchmark = APIBenchmark()
+    success = benchmark.run_all_benchmarks()
+
+    reports_dir_env = os.getenv("BACKEND_TEST_REPORT_DIR")
+    reports_dir = Path(reports_dir_env) if reports_dir_env else Path(__file__).parent / "test_reports"
+    reports_dir.mkdir(parents=True, exist_ok=True)
+    report_file = reports_dir / "backend_benchmark_results.json"
+
+    with report_file.open('w') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'base_url': benchmark.base_url,
+            'requests_per_client': benchmark.requests_per_client,
+            'results': benchmark.results
+        }, f, indent=2)
+
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -488,28 +488,72 @@ class CompanyManagementAPITester:
         return success
 
     def test_get_kanban_tasks_with_types(self):
-        """Test getting kanban tasks and verify task_type_id is included"""
+        """Test getting kanban columns (paged by cursor) and verify task_type_id is included"""
         success, response = self.run_test(
             "Get Kanban Tasks with Types",
             "GET",
-            "kanban",
+            "kanban?limit=2",
             200
         )
-        
-        if success and isinstance(response, list):
-            # Find our typed task and verify it has task_type_id
-            typed_task_found = False
-            for task in response:
-                if hasattr(self, 'typed_task_id') and task.get('id') == self.typed_task_id:
-                    typed_task_found = True
-                    if task.get('task_type_id') != self.task_type_id:
-                        self.log_test("Typed Task Verification", False, "task_type_id not properly returned")
-                        return False
-            
-            if hasattr(self, 'typed_task_id') and not typed_task_found:
-                self.log_test("Typed Task Found", False, "Created typed task not found in list")
+        if not success:
+            return False
+
+        # GET /kanban devuelve columnas: [{status, tasks, next_cursor}]
+        if not isinstance(response, list) or not all(
+            isinstance(column, dict) and {'status', 'tasks', 'next_cursor'} <= column.keys()
+            for column in response
+        ):
+            self.log_test("Kanban Column Shape", False, "Expected [{status, tasks, next_cursor}]")
+            return False
+
+        tasks = []
+        for column in response:
+            column_tasks = list(column['tasks'])
+            cursor = column['next_cursor']
+            # Recorrer el resto de la columna con next_cursor
+            while cursor:
+                success, page = self.run_test(
+                    f"Get Kanban Column Page ({column['status']})",
+                    "GET",
+                    f"kanban?limit=2&cursor={cursor}",
+                    200
+                )
+                if not success:
+                    return False
+                if len(page) != 1 or page[0]['status'] != column['status']:
+                    self.log_test("Kanban Cursor Column", False, "Cursor page must return only its own column")
+                    return False
+                column_tasks.extend(page[0]['tasks'])
+                cursor = page[0]['next_cursor']
+
+            if any(task['status'] != column['status'] for task in column_tasks):
+                self.log_test("Kanban Column Status", False, f"Foreign task in column {column['status']}")
                 return False
-            return True
+            keys = [(task['position'], task['id']) for task in column_tasks]
+            if keys != sorted(keys) or len(set(keys)) != len(keys):
+                self.log_test("Kanban Cursor Order", False, f"Pages of {column['status']} overlap or are out of order")
+                return False
+            tasks.extend(column_tasks)
+
+        # Find our typed task and verify it has task_type_id
+        typed_task_found = False
+        for task in tasks:
+            if hasattr(self, 'typed_task_id') and task.get('id') == self.typed_task_id:
+                typed_task_found = True
+                if task.get('task_type_id') != self.task_type_id:
+                    self.log_test("Typed Task Verification", False, "task_type_id not properly returned")
+                    return False
+
+        if hasattr(self, 'typed_task_id') and not typed_task_found:
+            self.log_test("Typed Task Found", False, "Created typed task not found in any column")
+            return False
+
+        success, _ = self.run_test(
+            "Get Kanban Tasks with Invalid Cursor",
+            "GET",
+            "kanban?cursor=not-a-cursor",
+            400
+        )
         return success
 
     def test_delete_task_type_with_tasks(self):
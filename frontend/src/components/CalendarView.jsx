@@ -1,4 +1,4 @@
-import { useState, useEffect, useMemo } from 'react';
+import { useState, useEffect, useMemo, useRef } from 'react';
 import { axiosInstance } from '@/App';
 import { Button } from '@/components/ui/button';
 import { Card } from '@/components/ui/card';
@@ -9,6 +9,7 @@ import { format, startOfMonth, endOfMonth, eachDayOfInterval, addMonths, subMont
 import { es } from 'date-fns/locale';
 import EventDialog from './EventDialog';
 import EventPopover from './EventPopover';
+import { useLiveUpdates } from '@/hooks/use-live-updates';
 
 const CalendarView = ({ user }) => {
   const [events, setEvents] = useState([]);
@@ -19,16 +20,30 @@ const CalendarView = ({ user }) => {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingEvent, setEditingEvent] = useState(null);
   const [hoveredEventId, setHoveredEventId] = useState(null);
+  // Cursor de /calendar/changes; null si el registro de cambios no está disponible
+  const syncCursorRef = useRef(null);
   const [viewportWidth, setViewportWidth] = useState(
     typeof window !== 'undefined' ? window.innerWidth : 1024
   );
 
   useEffect(() => {
-    loadEvents();
     loadEventTypes();
     loadOrders();
   }, []);
 
+  useEffect(() => {
+    loadEvents();
+  }, [selectedDate, viewMode]);
+
+  // Cambios de otros usuarios: delta del calendario y pedidos (304 si no cambiaron)
+  useLiveUpdates(['calendar', 'orders'], (change) => {
+    if (change.collection === 'calendar') {
+      syncEvents();
+    } else {
+      loadOrders();
+    }
+  });
+
   useEffect(() => {
     if (typeof window === 'undefined') return;
     const handleResize = () => setViewportWidth(window.innerWidth);
@@ -46,18 +61,120 @@ const CalendarView = ({ user }) => {
   const weeklyEventHeight = isMobile ? 52 : 58;
   const weeklyTrackOffset = isMobile ? 52 : 58;
 
+  const getVisibleRange = () => {
+    const visibleDays = getDaysInView();
+    return {
+      from: format(visibleDays[0], 'yyyy-MM-dd'),
+      to: format(visibleDays[visibleDays.length - 1], 'yyyy-MM-dd'),
+    };
+  };
+
   const loadEvents = async () => {
     try {
-      const response = await axiosInstance.get('/calendar');
-      console.log('[CalendarView] Events loaded:', response.data);
-      console.log('[CalendarView] First event reminders:', response.data[0]?.reminders);
-      setEvents(response.data);
+      // El cursor se pide antes de la carga: lo que cambie durante ella llegará en la siguiente sincronización
+      try {
+        const cursorResponse = await axiosInstance.get('/calendar/changes');
+        syncCursorRef.current = cursorResponse.data.cursor;
+      } catch (error) {
+        syncCursorRef.current = null;
+      }
+
+      // Solo se piden los eventos del rango visible (mes o semana)
+      const params = { ...getVisibleRange(), limit: 500 };
+      const loadedEvents = [];
+      let cursor = null;
+      do {
+        const response = await axiosInstance.get('/calendar', {
+          params: cursor ? { ...params, cursor } : params,
+        });
+        loadedEvents.push(...response.data);
+        cursor = response.headers['x-next-cursor'] || null;
+      } while (cursor);
+      console.log('[CalendarView] Events loaded:', loadedEvents);
+      setEvents(loadedEvents);
     } catch (error) {
       console.error('[CalendarView] Error loading events:', error);
       toast.error('Error al cargar eventos');
     }
   };
 
+  // Tras crear/editar/borrar solo se piden los cambios desde el último cursor
+  const syncEvents = async () => {
+    if (!syncCursorRef.current) {
+      return loadEvents();
+    }
+    try {
+      const changedEvents = new Map();
+      const changedReminders = new Map();
+      let cursor = syncCursorRef.current;
+      let hasMore = true;
+      while (hasMore) {
+        const response = await axiosInstance.get('/calendar/changes', { params: { since: cursor } });
+        const { events: eventChanges, reminders: reminderChanges } = response.data;
+        eventChanges.upserted.forEach((event) => changedEvents.set(event.id, event));
+        eventChanges.deleted.forEach((id) => changedEvents.set(id, null));
+        reminderChanges.upserted.forEach((reminder) => changedReminders.set(reminder.id, reminder));
+        reminderChanges.deleted.forEach((id) => changedReminders.set(id, null));
+        cursor = response.data.cursor;
+        hasMore = response.data.has_more;
+      }
+      syncCursorRef.current = cursor;
+      if (changedEvents.size || changedReminders.size) {
+        const { from, to } = getVisibleRange();
+        // Recordatorio que entra en la vista de un evento que no tenemos: hace falta el evento
+        const loadedIds = new Set(events.map((event) => event.id));
+        const missingEvent = [...changedReminders.values()].some((reminder) =>
+          reminder && reminderInRange(reminder, from, to)
+            && !changedEvents.has(reminder.event_id) && !loadedIds.has(reminder.event_id)
+        );
+        if (missingEvent) {
+          return loadEvents();
+        }
+        setEvents((current) => applyCalendarChanges(current, changedEvents, changedReminders, from, to));
+      }
+    } catch (error) {
+      // Cursor caducado (410) u otro error: recarga completa
+      console.error('[CalendarView] Error syncing events:', error);
+      loadEvents();
+    }
+  };
+
+  const reminderInRange = (reminder, from, to) => {
+    const day = reminder.reminder_date.slice(0, 10);
+    return day >= from && day <= to;
+  };
+
+  // Misma regla que la ventana del servidor (calendar_events_window): el evento solapa
+  // el rango o tiene algún recordatorio dentro
+  const eventInRange = (event, from, to) =>
+    (event.fecha_inicio.slice(0, 10) <= to && event.fecha_fin.slice(0, 10) >= from)
+    || (event.reminders || []).some((reminder) => reminderInRange(reminder, from, to));
+
+  const applyCalendarChanges = (current, changedEvents, changedReminders, from, to) => {
+    const eventsById = new Map(current.map((event) => [event.id, event]));
+    changedEvents.forEach((event, id) => {
+      if (event) {
+        eventsById.set(id, { ...event, reminders: eventsById.get(id)?.reminders || [] });
+      } else {
+        eventsById.delete(id);
+      }
+    });
+
+    if (changedReminders.size) {
+      eventsById.forEach((event, id) => {
+        const reminders = (event.reminders || []).filter((reminder) => !changedReminders.has(reminder.id));
+        changedReminders.forEach((reminder) => {
+          if (reminder && reminder.event_id === id) reminders.push(reminder);
+        });
+        eventsById.set(id, { ...event, reminders });
+      });
+    }
+
+    return [...eventsById.values()].filter((event) => eventInRange(event, from, to)).sort((a, b) =>
+      a.fecha_inicio.localeCompare(b.fecha_inicio) || a.id.localeCompare(b.id)
+    );
+  };
+
   const loadEventTypes = async () => {
     try {
       const response = await axiosInstance.get('/event-types');
@@ -127,7 +244,7 @@ const CalendarView = ({ user }) => {
     try {
       await axiosInstance.delete(`/calendar/${eventId}`);
       toast.success('Evento eliminado');
-      loadEvents();
+      syncEvents();
       loadOrders(); // Recargar pedidos en caso de que sea un pedido
       closeDialog(); // Cerrar el modal si está abierto
     } catch (error) {
@@ -146,7 +263,7 @@ const CalendarView = ({ user }) => {
   };
 
   const handleSaveEvent = () => {
-    loadEvents();
+    syncEvents();
     loadOrders(); // Recargar pedidos activos después de guardar evento
     closeDialog();
   };
@@ -71,6 +71,7 @@ const EventDialog = ({ open, onClose, onSave, onDelete, editingEvent, eventTypes
           reminderDate = '';
         }
         return {
+          id: reminder.id,
           title: reminder.title || '',
           description: reminder.description || '',
           reminder_date: reminderDate,
@@ -197,6 +198,8 @@ const EventDialog = ({ open, onClose, onSave, onDelete, editingEvent, eventTypes
       payload.reminders = reminders
         .filter((reminder) => reminder.title && reminder.reminder_date)
         .map((reminder) => ({
+          // El id permite al backend actualizar solo los recordatorios que cambian
+          ...(reminder.id ? { id: reminder.id } : {}),
           title: reminder.title,
           description: reminder.description || null,
           reminder_date: reminder.reminder_date,
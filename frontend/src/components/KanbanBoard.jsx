@@ -1,5 +1,7 @@
 import { useState, useEffect } from 'react';
 import { axiosInstance } from '@/App';
+import { useLiveUpdates } from '@/hooks/use-live-updates';
+import { keyBetween, compareKeys } from '@/lib/rank';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent } from '@/components/ui/card';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '@/components/ui/dialog';
@@ -34,6 +36,9 @@ const columns = [
   { id: 'done', title: 'Completado', color: 'from-emerald-500 to-green-600', icon: '✅' },
 ];
 
+// Tareas por columna en cada página de GET /kanban
+const KANBAN_PAGE_SIZE = 100;
+
 const priorityConfig = {
   low: { bg: 'bg-gray-100', text: 'text-gray-700', border: 'border-gray-300', label: 'Baja', icon: '⚪' },
   medium: { bg: 'bg-yellow-100', text: 'text-yellow-700', border: 'border-yellow-300', label: 'Media', icon: '🟡' },
@@ -47,6 +52,8 @@ const KanbanBoard = ({ user }) => {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingTask, setEditingTask] = useState(null);
   const [activeId, setActiveId] = useState(null);
+  // next_cursor de cada columna (null si ya está completa)
+  const [columnCursors, setColumnCursors] = useState({});
   const [formData, setFormData] = useState({
     title: '',
     description: '',
@@ -76,6 +83,8 @@ const KanbanBoard = ({ user }) => {
     loadUsers(); // Cargar usuarios
   }, []);
 
+  useLiveUpdates(['kanban'], () => loadTasks());
+
   const loadUsers = async () => {
     try {
       const response = await axiosInstance.get('/users');
@@ -100,8 +109,25 @@ const KanbanBoard = ({ user }) => {
 
   const loadTasks = async () => {
     try {
-      const response = await axiosInstance.get('/kanban');
-      setTasks(response.data);
+      const response = await axiosInstance.get('/kanban', { params: { limit: KANBAN_PAGE_SIZE } });
+      setTasks(response.data.flatMap((column) => column.tasks));
+      setColumnCursors(Object.fromEntries(response.data.map((column) => [column.status, column.next_cursor])));
+    } catch (error) {
+      toast.error('Error al cargar tareas');
+    }
+  };
+
+  const loadMoreTasks = async (status) => {
+    const cursor = columnCursors[status];
+    if (!cursor) return;
+    try {
+      const response = await axiosInstance.get('/kanban', { params: { limit: KANBAN_PAGE_SIZE, cursor } });
+      const [column] = response.data;
+      setTasks((current) => {
+        const loadedIds = new Set(current.map((task) => task.id));
+        return [...current, ...column.tasks.filter((task) => !loadedIds.has(task.id))];
+      });
+      setColumnCursors((current) => ({ ...current, [status]: column.next_cursor }));
     } catch (error) {
       toast.error('Error al cargar tareas');
     }
@@ -166,7 +192,7 @@ const KanbanBoard = ({ user }) => {
   const getTasksByStatus = (status) => {
     return tasks
       .filter((task) => task.status === status)
-      .sort((a, b) => (a.position || 0) - (b.position || 0));
+      .sort((a, b) => compareKeys(a.position, b.position));
   };
 
   const handleDragStart = (event) => {
@@ -224,24 +250,53 @@ const KanbanBoard = ({ user }) => {
 
     console.log('Final newStatus:', newStatus, 'Original:', activeTask.status);
 
-    // SIMPLIFICADO: Siempre intentar actualizar si hay cambio de status
-    if (newStatus !== activeTask.status) {
-      console.log('🚀 Status changed, updating task...');
-      try {
-        await axiosInstance.put(`/kanban/${activeTask.id}`, {
-          status: newStatus,
-        });
-        toast.success(`Tarea movida a ${newStatus}`);
-        loadTasks();
-      } catch (error) {
-        console.error('Error updating task:', error);
-        toast.error('Error al mover tarea');
+    const isColumnDrop = over.id.toString().startsWith('column-');
+    if ((!overTask && !isColumnDrop) || (overTask && overTask.id === activeTask.id)) {
+      setActiveId(null);
+      return;
+    }
+
+    // Destino: antes de la tarjeta sobre la que se suelta (después si baja en la misma
+    // columna) o al final si se suelta sobre la columna
+    const sameColumn = newStatus === activeTask.status;
+    const columnTasks = getTasksByStatus(newStatus).filter((t) => t.id !== activeTask.id);
+    let targetIndex = columnTasks.length;
+    if (overTask) {
+      targetIndex = columnTasks.findIndex((t) => t.id === overTask.id);
+      if (sameColumn && compareKeys(activeTask.position, overTask.position) < 0) {
+        targetIndex += 1;
       }
-    } else {
-      console.log('ℹ️ No status change, no update needed');
     }
+    const originalIndex = getTasksByStatus(activeTask.status).findIndex((t) => t.id === activeTask.id);
 
+    if (sameColumn && targetIndex === originalIndex) {
+      console.log('ℹ️ Same position, no update needed');
+      setActiveId(null);
+      return;
+    }
+
+    // Nueva clave entre las vecinas: solo se modifica la tarjeta movida
+    const newPosition = keyBetween(columnTasks[targetIndex - 1]?.position, columnTasks[targetIndex]?.position);
+    setTasks((current) =>
+      current.map((t) => (t.id === activeTask.id ? { ...t, status: newStatus, position: newPosition } : t))
+    );
     setActiveId(null);
+
+    try {
+      const { data: updated } = await axiosInstance.put('/kanban/batch', {
+        changes: [{ id: activeTask.id, status: newStatus, position: newPosition }],
+      });
+      // Claves definitivas (incluye la columna entera si el servidor la renumeró)
+      const byId = new Map(updated.map((t) => [t.id, t]));
+      setTasks((current) => current.map((t) => byId.get(t.id) || t));
+      if (!sameColumn) {
+        toast.success(`Tarea movida a ${newStatus}`);
+      }
+    } catch (error) {
+      console.error('Error updating task:', error);
+      toast.error('Error al mover tarea');
+      loadTasks();
+    }
   };
 
   return (
@@ -387,7 +442,7 @@ const KanbanBoard = ({ user }) => {
                           <h3 className="text-base sm:text-lg md:text-xl font-bold">{column.title}</h3>
                         </div>
                         <p className="text-xs sm:text-sm opacity-90">
-                          {columnTasks.length} {columnTasks.length === 1 ? 'tarea' : 'tareas'}
+                          {columnTasks.length}{columnCursors[column.id] ? '+' : ''} {columnTasks.length === 1 ? 'tarea' : 'tareas'}
                         </p>
                       </div>
                     </div>
@@ -415,6 +470,16 @@ const KanbanBoard = ({ user }) => {
                         );
                       })}
                     </SortableContext>
+                    {columnCursors[column.id] && (
+                      <Button
+                        variant="ghost"
+                        className="w-full"
+                        onClick={() => loadMoreTasks(column.id)}
+                        data-testid={`kanban-load-more-${column.id}`}
+                      >
+                        Cargar más
+                      </Button>
+                    )}
                   </DroppableColumn>
                 </div>
               );
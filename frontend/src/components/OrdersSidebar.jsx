@@ -1,12 +1,30 @@
 import { useState, useEffect } from 'react';
 import { axiosInstance } from '@/App';
+import { useLiveUpdates } from '@/hooks/use-live-updates';
 import { Card, CardContent } from '@/components/ui/card';
 import { Popover, PopoverContent, PopoverTrigger } from '@/components/ui/popover';
 import { toast } from 'sonner';
 import { Package, Trash2, FileText, CalendarClock } from 'lucide-react';
 
+const ORDERS_PAGE_SIZE = 50;
+
+// Documentos del ciclo de vida del pedido (order.lifecycle, add_order_lifecycle.sql)
+const LIFECYCLE_STAGES = [
+  { key: 'albaran_at', label: 'Albarán' },
+  { key: 'factura_proforma_at', label: 'Proforma' },
+  { key: 'factura_at', label: 'Factura' },
+  { key: 'factura_comisiones_at', label: 'Comisiones' },
+];
+
+// Número de vinculados: del lifecycle embebido o, sin la migración, de los eventos cargados
+const linkedCount = (order, linkedEvents) => (
+  order.lifecycle ? order.lifecycle.linked_events : (linkedEvents[order.id] || []).length
+);
+
 const OrdersSidebar = () => {
   const [orders, setOrders] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [linkedEvents, setLinkedEvents] = useState({});
   const [loadingEvents, setLoadingEvents] = useState({});
   const [pendingEvents, setPendingEvents] = useState([]);
@@ -27,13 +45,42 @@ const OrdersSidebar = () => {
     };
   }, []);
 
+  // Los pendientes son eventos del calendario
+  useLiveUpdates(['orders', 'calendar'], (change) => {
+    if (change.collection === 'orders') {
+      loadOrders();
+    } else {
+      loadPendingEvents();
+    }
+  });
+
   const loadOrders = async () => {
     try {
-      const response = await axiosInstance.get('/orders');
+      const response = await axiosInstance.get('/orders', { params: { limit: ORDERS_PAGE_SIZE } });
       setOrders(response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+      loadAllLinkedEvents(ordersWithoutLifecycle(response.data), true);
+    } catch (error) {
+      console.error('Error loading orders:', error);
+      toast.error('Error al cargar pedidos');
+    }
+  };
+
+  const loadMoreOrders = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await axiosInstance.get('/orders', {
+        params: { limit: ORDERS_PAGE_SIZE, cursor: nextCursor },
+      });
+      setOrders(prev => [...prev, ...response.data]);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+      loadAllLinkedEvents(ordersWithoutLifecycle(response.data), false);
     } catch (error) {
       console.error('Error loading orders:', error);
       toast.error('Error al cargar pedidos');
+    } finally {
+      setLoadingMore(false);
     }
   };
 
@@ -46,6 +93,27 @@ const OrdersSidebar = () => {
     }
   };
 
+  // Con order_lifecycle el recuento viene en el propio pedido; el detalle se carga al abrirlo
+  const ordersWithoutLifecycle = (loaded) => loaded.filter(order => !order.lifecycle).map(order => order.id);
+
+  // Carga los eventos vinculados de todos los pedidos en bloques, sin una petición por pedido
+  const loadAllLinkedEvents = async (orderIds, replace) => {
+    const chunkSize = 100;
+    try {
+      const loaded = {};
+      for (let start = 0; start < orderIds.length; start += chunkSize) {
+        const chunk = orderIds.slice(start, start + chunkSize);
+        const response = await axiosInstance.get('/orders/linked-events', {
+          params: { order_ids: chunk.join(',') },
+        });
+        Object.assign(loaded, response.data);
+      }
+      setLinkedEvents(prev => (replace ? loaded : { ...prev, ...loaded }));
+    } catch (error) {
+      console.error('Error loading linked events:', error);
+    }
+  };
+
   const loadLinkedEvents = async (orderId) => {
     if (linkedEvents[orderId]) {
       return; // Ya cargado
@@ -100,7 +168,9 @@ const OrdersSidebar = () => {
           <Package className="h-4 w-4" />
           Pedidos Activos
         </h3>
-        <p className="text-xs text-gray-500 mt-1">{orders.length} {orders.length === 1 ? 'pedido' : 'pedidos'}</p>
+        <p className="text-xs text-gray-500 mt-1">
+          {orders.length}{nextCursor ? '+' : ''} {orders.length === 1 && !nextCursor ? 'pedido' : 'pedidos'}
+        </p>
       </div>
 
       <div className="space-y-2 px-4 max-h-64 overflow-y-auto">
@@ -125,14 +195,27 @@ const OrdersSidebar = () => {
                         </span>
                       </div>
                       <p className="text-xs text-gray-600 truncate">{order.supplier}</p>
-                      {linkedEvents[order.id] && linkedEvents[order.id].length > 0 && (
+                      {linkedCount(order, linkedEvents) > 0 && (
                         <div className="flex items-center gap-1 mt-1">
                           <FileText className="h-3 w-3 text-green-600" />
                           <span className="text-xs text-green-600 font-medium">
-                            {linkedEvents[order.id].length} vinculado{linkedEvents[order.id].length !== 1 ? 's' : ''}
+                            {linkedCount(order, linkedEvents)} vinculado{linkedCount(order, linkedEvents) !== 1 ? 's' : ''}
                           </span>
                         </div>
                       )}
+                      {order.lifecycle && (
+                        <div className="flex flex-wrap gap-1 mt-1">
+                          {LIFECYCLE_STAGES.map(stage => (
+                            <span
+                              key={stage.key}
+                              title={order.lifecycle[stage.key] || 'Pendiente'}
+                              className={`text-[10px] px-1 rounded ${order.lifecycle[stage.key] ? 'bg-green-100 text-green-700' : 'bg-gray-100 text-gray-400'}`}
+                            >
+                              {stage.label}
+                            </span>
+                          ))}
+                        </div>
+                      )}
                     </div>
                     <button
                       onClick={(e) => {
@@ -193,6 +276,16 @@ const OrdersSidebar = () => {
             </PopoverContent>
           </Popover>
         ))}
+        {nextCursor && (
+          <button
+            onClick={loadMoreOrders}
+            disabled={loadingMore}
+            className="w-full text-xs text-blue-600 hover:underline py-1"
+            data-testid="load-more-orders"
+          >
+            {loadingMore ? 'Cargando...' : 'Cargar más'}
+          </button>
+        )}
       </div>
 
       {pendingEvents.length > 0 && (
@@ -0,0 +1,65 @@
+import { useEffect, useRef } from 'react';
+import { API, axiosInstance } from '@/App';
+
+const RECONNECT_DELAY_MS = 3000;
+
+// Suscripción al canal en vivo del backend (GET /api/live, Server-Sent Events).
+// onChange recibe {collection, op, ids, by}; `ids` vacío significa "recargar la colección".
+// Tras un `reset` (mensajes perdidos) se llama con op 'reset' por cada colección suscrita.
+// La conexión se abre con un ticket de corta duración (POST /api/live/ticket), nunca con
+// el JWT de sesión en la URL. EventSource reconecta solo mientras el ticket es válido;
+// si lo rechaza (caducado), se pide otro y se reabre con last_id para recuperar lo perdido.
+export function useLiveUpdates(collections, onChange) {
+  const handlerRef = useRef(onChange);
+  handlerRef.current = onChange;
+  const key = collections.join(',');
+
+  useEffect(() => {
+    if (!localStorage.getItem('token') || typeof EventSource === 'undefined') return undefined;
+
+    let source = null;
+    let retryTimer = null;
+    let closed = false;
+    let lastEventId = null;
+
+    const track = (event) => {
+      if (event.lastEventId) lastEventId = event.lastEventId;
+    };
+
+    const connect = async () => {
+      let ticket;
+      try {
+        ({ data: { ticket } } = await axiosInstance.post('/live/ticket'));
+      } catch (error) {
+        if (!closed && error.response?.status !== 401) retryTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+        return;
+      }
+      if (closed) return;
+
+      const params = new URLSearchParams({ ticket, collections: key });
+      if (lastEventId) params.set('last_id', lastEventId);
+      source = new EventSource(`${API}/live?${params}`);
+      source.addEventListener('change', (event) => {
+        track(event);
+        handlerRef.current(JSON.parse(event.data));
+      });
+      source.addEventListener('reset', (event) => {
+        track(event);
+        key.split(',').forEach((collection) => handlerRef.current({ collection, op: 'reset', ids: [] }));
+      });
+      source.onerror = () => {
+        // CLOSED: el servidor rechazó la reconexión (ticket caducado); hay que pedir otro
+        if (source.readyState === EventSource.CLOSED && !closed) {
+          retryTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
+  }, [key]);
+}
@@ -0,0 +1,43 @@
+// Claves de orden fraccional del Kanban (add_kanban_rank.sql).
+// Texto en base 62 que nunca termina en '0': siempre cabe otra clave entre dos vecinas,
+// así mover una tarjeta solo cambia su propia clave. La BD renumera la columna cuando
+// una clave pasa de 48 caracteres o coincide con otra.
+const DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz';
+
+const midpoint = (lower, upper) => {
+  if (upper !== null) {
+    let common = 0;
+    while (common < upper.length && (lower[common] || '0') === upper[common]) {
+      common += 1;
+    }
+    if (common > 0) {
+      return upper.slice(0, common) + midpoint(lower.slice(common), upper.slice(common));
+    }
+  }
+
+  const digitLower = lower ? DIGITS.indexOf(lower[0]) : 0;
+  const digitUpper = upper !== null ? DIGITS.indexOf(upper[0]) : DIGITS.length;
+  if (digitUpper - digitLower > 1) {
+    return DIGITS[Math.floor((digitLower + digitUpper + 1) / 2)];
+  }
+  if (upper !== null && upper.length > 1) {
+    return upper[0];
+  }
+  return DIGITS[digitLower] + midpoint(lower.slice(1), null);
+};
+
+// Clave entre `before` y `after` (null/undefined = sin vecina por ese lado). Si las
+// vecinas no están ordenadas (clave repetida) no cabe nada entre ellas: se repite
+// `before` y el servidor renumera la columna.
+export function keyBetween(before, after) {
+  if (before && after && before >= after) return before;
+  return midpoint(before || '', after || null);
+}
+
+// Comparación por código (collation "C"), no localeCompare; sin clave al final
+export function compareKeys(a, b) {
+  if (a === b) return 0;
+  if (a == null) return 1;
+  if (b == null) return -1;
+  return a < b ? -1 : 1;
+}
@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py crea el cliente de Supabase al importarse: basta con una URL y clave
+# cualquiera, las pruebas de tests/ no salen a la red
+os.environ.setdefault('SUPABASE_URL', 'https://test.supabase.co')
+os.environ.setdefault('SUPABASE_SERVICE_KEY', 'test-service-key')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
@@ -0,0 +1,45 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from server import decode_calendar_cursor, decode_cursor, encode_cursor, parse_calendar_fields
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor('2026-03-01', 'abc', 3)
+    assert '=' not in cursor
+    assert decode_cursor(cursor, 3) == ['2026-03-01', 'abc', 3]
+
+
+@pytest.mark.parametrize('cursor', ['not-base64!', encode_cursor('a'), encode_cursor('a', 'b', 'c'), 'eyJhIjogMX0'])
+def test_decode_cursor_rejects_malformed(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+
+
+def test_decode_calendar_cursor_normalizes_values():
+    event_id = uuid.uuid4()
+    cursor = encode_cursor('2026-03-01', str(event_id).upper())
+    assert decode_calendar_cursor(cursor) == ('2026-03-01', str(event_id))
+
+
+@pytest.mark.parametrize('values', [('01/03/2026', str(uuid.uuid4())), ('2026-03-01', 'not-a-uuid')])
+def test_decode_calendar_cursor_rejects_bad_values(values):
+    with pytest.raises(HTTPException) as error:
+        decode_calendar_cursor(encode_cursor(*values))
+    assert error.value.status_code == 400
+
+
+def test_parse_calendar_fields():
+    assert parse_calendar_fields(None) is None
+    assert parse_calendar_fields('') is None
+    assert parse_calendar_fields(' id, title ,,reminders') == ['id', 'title', 'reminders']
+
+
+def test_parse_calendar_fields_rejects_unknown():
+    with pytest.raises(HTTPException) as error:
+        parse_calendar_fields('id,password_hash,order')
+    assert error.value.status_code == 400
+    assert error.value.detail == 'Unknown fields: password_hash, order'
@@ -0,0 +1,156 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from postgrest import APIError
+
+import server
+from server import CalendarEventCreate, diff_reminders, prepare_event_payload
+
+
+def event(**overrides):
+    return CalendarEventCreate(**{
+        'title': 'Contenedor',
+        'fecha_inicio': '2026-03-01',
+        'fecha_fin': '2026-03-02',
+        'event_type_id': 'type-1',
+        **overrides,
+    })
+
+
+def test_prepare_event_payload_splits_reminders():
+    data, reminders = prepare_event_payload(event(
+        client='',
+        reminders=[
+            {'title': 'Llamar', 'reminder_date': '2026-02-28'},
+            {'id': 'r1', 'title': 'Revisar', 'description': 'BL', 'reminder_date': '2026-02-27T09:30'},
+        ],
+    ))
+    assert 'reminders' not in data
+    assert data['custom_fields'] == {}
+    assert data['client'] is None
+    assert reminders == [
+        {'title': 'Llamar', 'description': None, 'reminder_date': '2026-02-28T00:00:00'},
+        {'id': 'r1', 'title': 'Revisar', 'description': 'BL', 'reminder_date': '2026-02-27T09:30:00'},
+    ]
+
+
+def test_prepare_event_payload_without_reminders():
+    # None = no tocar los recordatorios (PUT sin el campo); [] = borrarlos todos
+    assert prepare_event_payload(event())[1] is None
+    assert prepare_event_payload(event(reminders=[]))[1] == []
+
+
+EXISTING = [
+    {'id': 'r1', 'title': 'Llamar', 'description': None, 'reminder_date': '2026-02-28T00:00:00'},
+    {'id': 'r2', 'title': 'Revisar', 'description': 'BL', 'reminder_date': '2026-02-27T09:30:00'},
+]
+
+
+def test_diff_reminders_unchanged_payload_is_a_no_op():
+    # Mismo contenido con otro formato de fecha: no se reescribe
+    payload = [{**EXISTING[0], 'reminder_date': '2026-02-28'}, EXISTING[1]]
+    assert diff_reminders(EXISTING, payload) == ([], [], [])
+
+
+def test_diff_reminders_insert_update_delete():
+    payload = [
+        {'id': 'r2', 'title': 'Revisar', 'description': 'BL y factura', 'reminder_date': '2026-02-27T09:30:00'},
+        {'id': 'r9', 'title': 'Nuevo', 'description': None, 'reminder_date': '2026-03-01T00:00:00'},
+    ]
+    to_insert, to_update, to_delete = diff_reminders(EXISTING, payload)
+    # Un id que no es del evento se inserta como recordatorio nuevo, sin ese id
+    assert to_insert == [{'title': 'Nuevo', 'description': None, 'reminder_date': '2026-03-01T00:00:00'}]
+    assert to_update == [payload[0]]
+    assert to_delete == ['r1']
+
+
+def test_diff_reminders_reuses_identical_rows_without_id():
+    payload = [
+        {'title': 'Revisar', 'description': 'BL', 'reminder_date': '2026-02-27T09:30:00'},
+        {'title': 'Revisar', 'description': 'BL', 'reminder_date': '2026-02-27T09:30:00'},
+    ]
+    to_insert, to_update, to_delete = diff_reminders(EXISTING, payload)
+    assert to_insert == [payload[1]]
+    assert to_update == []
+    assert to_delete == ['r1']
+
+
+def test_diff_reminders_ids_claim_before_rows_without_id():
+    # El elemento sin id va primero pero r1 ya lo reclama el que trae id
+    payload = [
+        {'title': 'Llamar', 'description': None, 'reminder_date': '2026-02-28T00:00:00'},
+        {'id': 'r1', 'title': 'Llamar', 'description': None, 'reminder_date': '2026-02-28T00:00:00'},
+    ]
+    to_insert, to_update, to_delete = diff_reminders(EXISTING, payload)
+    assert to_insert == [payload[0]]
+    assert to_update == []
+    assert to_delete == ['r2']
+
+
+@pytest.fixture
+def postgrest(monkeypatch):
+    """Sustituye la red por `respond(request) -> httpx.Response`"""
+    calls = []
+
+    def use(respond):
+        def handler(request):
+            calls.append((request.url.path, json.loads(request.content or b'null')))
+            return respond(request)
+        monkeypatch.setattr(server.supabase_http_client, '_transport', httpx.MockTransport(handler))
+        return calls
+
+    monkeypatch.setattr(server, 'calendar_event_rpc_available', {})
+    return use
+
+
+def test_call_calendar_event_rpc_returns_rows(postgrest):
+    calls = postgrest(lambda request: httpx.Response(200, json=[{'id': 'e1'}]))
+    rows = asyncio.run(server.call_calendar_event_rpc('create_calendar_event', {'p_event': {'title': 'x'}}))
+    assert rows == [{'id': 'e1'}]
+    assert calls == [('/rest/v1/rpc/create_calendar_event', {'p_event': {'title': 'x'}})]
+    assert server.calendar_event_rpc_available == {'create_calendar_event': True}
+
+
+def test_call_calendar_event_rpc_missing_function_falls_back(postgrest):
+    calls = postgrest(lambda request: httpx.Response(404, json={
+        'code': 'PGRST202', 'message': 'Could not find the function', 'details': None, 'hint': None,
+    }))
+    assert asyncio.run(server.call_calendar_event_rpc('create_calendar_event', {})) is None
+    assert server.calendar_event_rpc_available == {'create_calendar_event': False}
+    # Ya sabido que falta: no se vuelve a preguntar a la BD
+    assert asyncio.run(server.call_calendar_event_rpc('create_calendar_event', {})) is None
+    assert len(calls) == 1
+
+
+def test_call_calendar_event_rpc_propagates_other_errors(postgrest):
+    postgrest(lambda request: httpx.Response(400, json={
+        'code': '23503', 'message': 'violates foreign key constraint', 'details': None, 'hint': None,
+    }))
+    with pytest.raises(APIError) as error:
+        asyncio.run(server.call_calendar_event_rpc('create_calendar_event', {}))
+    assert error.value.code == '23503'
+    assert server.calendar_event_rpc_available == {}
+
+
+def test_missing_import_rpc_keeps_the_other_functions_enabled(postgrest):
+    # BD con la versión anterior de add_calendar_event_rpc.sql: sin import_calendar_batch
+    def respond(request):
+        if request.url.path.endswith('/import_calendar_batch'):
+            return httpx.Response(404, json={
+                'code': 'PGRST202', 'message': 'Could not find the function', 'details': None, 'hint': None,
+            })
+        return httpx.Response(200, json=[{'id': 'e1'}])
+
+    calls = postgrest(respond)
+    assert asyncio.run(server.call_calendar_event_rpc('create_calendar_event', {})) == [{'id': 'e1'}]
+    assert asyncio.run(server.call_calendar_event_rpc('import_calendar_batch', {})) is None
+    assert asyncio.run(server.call_calendar_event_rpc('create_calendar_event', {})) == [{'id': 'e1'}]
+    assert asyncio.run(server.call_calendar_event_rpc('update_calendar_event', {})) == [{'id': 'e1'}]
+    assert [path.rsplit('/', 1)[-1] for path, _ in calls] == [
+        'create_calendar_event', 'import_calendar_batch', 'create_calendar_event', 'update_calendar_event',
+    ]
+    assert server.calendar_event_rpc_available == {
+        'create_calendar_event': True, 'import_calendar_batch': False, 'update_calendar_event': True,
+    }
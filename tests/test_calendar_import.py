@@ -0,0 +1,168 @@
+import asyncio
+import io
+from datetime import date, datetime
+
+import httpx
+import openpyxl
+import pytest
+from fastapi import HTTPException, UploadFile
+from postgrest import APIError
+
+import server
+
+from server import ImportReader, import_cell, parse_import_date, parse_import_datetime, parse_import_row
+
+EVENT_TYPE = {'id': 'type-1', 'name': 'Embarque'}
+EVENT_TYPES = {'type-1': EVENT_TYPE, 'embarque': EVENT_TYPE}
+
+
+@pytest.mark.parametrize('value', ['2026-03-01', '01/03/2026', '01-03-2026', '2026-03-01T10:00:00'])
+def test_parse_import_date_formats(value):
+    assert parse_import_date(value) == '2026-03-01'
+
+
+@pytest.mark.parametrize('value', ['31/02/2026', '2026/03/01', 'mañana', ''])
+def test_parse_import_date_rejects(value):
+    with pytest.raises(ValueError):
+        parse_import_date(value)
+
+
+def test_parse_import_datetime_keeps_iso_time():
+    assert parse_import_datetime('2026-03-01T09:30') == '2026-03-01T09:30:00'
+    assert parse_import_datetime('01/03/2026') == '2026-03-01'
+    with pytest.raises(ValueError):
+        parse_import_datetime('31/02/2026')
+
+
+def test_import_cell():
+    assert import_cell('  ') is None
+    assert import_cell(None) is None
+    assert import_cell(' ABC ') == 'ABC'
+    assert import_cell(1234.0) == '1234'
+    assert import_cell(12.5) == '12.5'
+    assert import_cell(date(2026, 3, 1)) == '2026-03-01'
+    assert import_cell(datetime(2026, 3, 1, 9, 30)) == '2026-03-01T09:30:00'
+
+
+def test_parse_import_row():
+    parsed = parse_import_row({
+        'title': 'Contenedor MSCU',
+        'fecha_inicio': '01/03/2026',
+        'fecha_fin': '',
+        'event_type': 'EMBARQUE',
+        'amount': 1500.0,
+        'lot': 'L-7',
+        'reminder_date': '28/02/2026',
+        'linked_order_number': 'PO-1',
+    }, EVENT_TYPES)
+    event = parsed['event']
+    assert event['fecha_inicio'] == event['fecha_fin'] == '2026-03-01'
+    assert event['event_type_id'] == 'type-1'
+    assert event['amount'] == 1500
+    assert event['custom_fields'] == {'lot': 'L-7'}
+    assert parsed['reminders'] == [
+        {'title': 'Contenedor MSCU', 'description': None, 'reminder_date': '2026-02-28T00:00:00'},
+    ]
+    assert parsed['type_name'] == 'Embarque'
+    assert parsed['linked_order_number'] == 'PO-1'
+
+
+def test_parse_import_row_reports_every_error():
+    with pytest.raises(ValueError) as error:
+        parse_import_row({
+            'title': '',
+            'fecha_inicio': '05/03/2026',
+            'fecha_fin': '01/03/2026',
+            'event_type': 'desconocido',
+            'reminder_date': '31/02/2026',
+        }, EVENT_TYPES)
+    assert error.value.args[0] == [
+        "event_type: unknown 'desconocido'",
+        'fecha_fin: before fecha_inicio',
+        "reminder_date: invalid date '31/02/2026'",
+        'title: Field required',
+    ]
+
+
+def test_parse_import_row_invalid_start_date_is_reported_once():
+    with pytest.raises(ValueError) as error:
+        parse_import_row({'title': 'x', 'fecha_inicio': '2026-13-01', 'event_type_id': 'type-1'}, EVENT_TYPES)
+    # fecha_fin vacía toma fecha_inicio: su error no se repite
+    assert error.value.args[0] == ["fecha_inicio: invalid date '2026-13-01'"]
+
+
+def upload(content: bytes, filename: str) -> UploadFile:
+    return UploadFile(io.BytesIO(content), filename=filename)
+
+
+def test_import_reader_csv_chunks():
+    content = 'Title;Fecha_Inicio;Event_Type\nA;01/03/2026;embarque\n;;\nB;02/03/2026;embarque\nC;03/03/2026;embarque\n'
+    reader = ImportReader(upload(content.encode('utf-8-sig'), 'eventos.csv'))
+    reader.open()
+    assert reader.columns == ['title', 'fecha_inicio', 'event_type']
+    first, second = reader.next_chunk(2), reader.next_chunk(2)
+    # Las filas vacías se saltan pero cuentan para el número de fila
+    assert [(number, row['title']) for number, row in first] == [(2, 'A'), (4, 'B')]
+    assert [(number, row['title']) for number, row in second] == [(5, 'C')]
+    assert reader.next_chunk(2) == []
+    reader.close()
+
+
+def test_import_reader_rejects_missing_columns():
+    reader = ImportReader(upload(b'title,event_type\nA,embarque\n', 'eventos.csv'))
+    with pytest.raises(HTTPException) as error:
+        reader.open()
+    assert error.value.status_code == 400
+    assert error.value.detail == 'Missing columns: fecha_inicio'
+
+
+def xlsx(rows) -> bytes:
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_import_reader_xlsx_reads_and_closes_workbook():
+    reader = ImportReader(upload(xlsx([
+        ['title', 'fecha_inicio', 'event_type', 'order_number'],
+        ['A', datetime(2026, 3, 1), 'embarque', 4521.0],
+    ]), 'eventos.xlsx'))
+    reader.open()
+    [(number, row)] = reader.next_chunk(10)
+    assert number == 2
+    assert parse_import_row(row, EVENT_TYPES)['event']['order_number'] == '4521'
+    workbook = reader.workbook
+    reader.close()
+    assert reader.workbook is None
+    # Cerrado: el ZIP del fichero subido ya no se puede leer
+    with pytest.raises(Exception):
+        list(workbook.active.iter_rows())
+
+
+def test_import_reader_rejects_other_files():
+    with pytest.raises(HTTPException) as error:
+        ImportReader(upload(b'{}', 'eventos.json')).open()
+    assert error.value.status_code == 415
+
+
+def test_insert_in_steps_keeps_the_original_error(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append((request.method, request.url.path.rsplit('/', 1)[-1]))
+        if request.url.path.endswith('/event_reminders'):
+            return httpx.Response(400, json={'code': '22007', 'message': 'bad reminder', 'details': None, 'hint': None})
+        if request.method == 'DELETE':
+            return httpx.Response(503, json={'code': '503', 'message': 'unavailable', 'details': None, 'hint': None})
+        return httpx.Response(201)
+
+    monkeypatch.setattr(server.supabase_http_client, '_transport', httpx.MockTransport(handler))
+    with pytest.raises(APIError) as error:
+        asyncio.run(server.insert_import_batch_in_steps(
+            [{'id': 'e1'}], [{'event_id': 'e1'}], [], [], set(),
+        ))
+    assert error.value.message == 'bad reminder'
+    assert requests == [('POST', 'calendar_events'), ('POST', 'event_reminders'), ('DELETE', 'calendar_events')]
@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent / 'backend'
+
+
+def import_server(search_fields):
+    env = {**os.environ, 'CALENDAR_SEARCH_FIELDS': search_fields}
+    return subprocess.run(
+        [sys.executable, '-c', 'import server; print(sorted(server.CALENDAR_SEARCH_FIELDS.items()))'],
+        cwd=BACKEND, env=env, capture_output=True, text=True,
+    )
+
+
+def test_search_fields_default_to_text():
+    result = import_server('lot, weight:number ,order_date:date')
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[('lot', 'text'), ('order_date', 'date'), ('weight', 'number')]"
+
+
+def test_unknown_search_type_fails_at_startup():
+    result = import_server('lot:text,weight:numbr')
+    assert result.returncode != 0
+    assert 'CALENDAR_SEARCH_FIELDS: unknown type in weight:numbr' in result.stderr
@@ -0,0 +1,97 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+import server
+from server import CompressionMiddleware, ResponseCompression
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    # El paquete brotli es opcional: para negociar basta con que "exista"
+    monkeypatch.setattr(server, 'brotli', object())
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip, deflate, br', 'br'),
+    ('gzip', 'gzip'),
+    ('br;q=0.5, gzip;q=0.8', 'gzip'),
+    ('GZIP;q=1.0, br;q=1.0', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*', 'br'),
+    ('*;q=0.1, br;q=0', 'gzip'),
+    ('identity', None),
+    ('gzip;q=0, br;q=0', None),
+    ('gzip;q=abc', None),
+    ('', None),
+])
+def test_negotiate(with_brotli, accept_encoding, expected):
+    assert ResponseCompression(1024, ['br', 'gzip']).negotiate(accept_encoding) == expected
+
+
+def test_negotiate_prefers_configured_order_on_ties(with_brotli):
+    assert ResponseCompression(1024, ['gzip', 'br']).negotiate('br, gzip') == 'gzip'
+
+
+def test_brotli_is_not_offered_without_the_package(monkeypatch):
+    monkeypatch.setattr(server, 'brotli', None)
+    compression = ResponseCompression(1024, ['br', 'gzip'])
+    assert compression.algorithms == ['gzip']
+    assert compression.negotiate('br') is None
+
+
+def make_client(minimum_size=100):
+    compression = ResponseCompression(minimum_size, ['gzip'])
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, compression=compression)
+    body = 'x' * 1000
+
+    @app.get('/large')
+    def large():
+        return PlainTextResponse(body, headers={'ETag': '"v1"'})
+
+    @app.get('/small')
+    def small():
+        return PlainTextResponse('ok')
+
+    @app.get('/image')
+    def image():
+        return Response(body.encode(), media_type='image/png')
+
+    @app.get('/stream')
+    def stream():
+        return StreamingResponse((line for line in ('a' * 50 + '\n' for _ in range(10))), media_type='application/x-ndjson')
+
+    return TestClient(app), compression, body
+
+
+def test_middleware_compresses_large_bodies():
+    client, compression, body = make_client()
+    response = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.headers['etag'] == 'W/"v1"'
+    assert int(response.headers['content-length']) < len(body)
+    assert response.text == body
+    assert compression.stats()['compressed'] == {'gzip': 1}
+
+
+def test_middleware_skips_small_and_precompressed_bodies():
+    client, compression, body = make_client()
+    small = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    image = client.get('/image', headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/large', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in small.headers and small.text == 'ok'
+    assert 'content-encoding' not in image.headers and image.content == body.encode()
+    assert 'content-encoding' not in plain.headers and plain.headers['etag'] == '"v1"'
+    assert compression.compressed == {}
+
+
+def test_middleware_compresses_streams_chunk_by_chunk():
+    client, compression, _ = make_client(minimum_size=10_000)
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    # En streaming no se conoce el tamaño final: se comprime aunque no llegue al mínimo
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'content-length' not in response.headers
+    assert response.text == ('a' * 50 + '\n') * 10
@@ -0,0 +1,91 @@
+import asyncio
+import csv
+import io
+import json
+import zipfile
+
+import openpyxl
+
+from server import XlsxStreamWriter, export_stream
+
+COLUMNS = ['id', 'title', 'custom_fields']
+PAGES = [
+    [{'id': 'e1', 'title': 'Contenedor, "MSCU"', 'custom_fields': {'lot': 'L-7'}}],
+    [{'id': 'e2', 'title': 'Ñandú', 'custom_fields': None}],
+]
+
+
+def read_xlsx(data: bytes):
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    try:
+        return workbook.sheetnames, list(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def test_xlsx_stream_writer_produces_a_readable_workbook():
+    writer = XlsxStreamWriter('Calendario & pedidos')
+    chunks = [writer.write_rows([['id', 'amount', 'custom_fields', 'notes']])]
+    chunks.append(writer.write_rows([
+        ['e1', 1500.5, {'lot': 'L-7', 'año': 2026}, 'línea\x01 <b>'],
+        ['e2', None, [], True],
+    ]))
+    chunks.append(writer.close())
+
+    sheetnames, rows = read_xlsx(b''.join(chunks))
+    assert sheetnames == ['Calendario & pedidos']
+    assert rows == [
+        ('id', 'amount', 'custom_fields', 'notes'),
+        ('e1', 1500.5, '{"lot": "L-7", "año": 2026}', 'línea <b>'),
+        ('e2', None, '[]', 'True'),
+    ]
+
+
+def test_xlsx_stream_writer_emits_bytes_before_closing():
+    writer = XlsxStreamWriter('Pedidos')
+    chunks = [writer.write_rows([['id', 'title']])]
+    for page in range(100):
+        chunks.append(writer.write_rows([[f'{page}-{index}', f'Pedido {page}/{index}'] for index in range(1000)]))
+    tail = writer.close()
+    # El cuerpo sale según se escribe; al cerrar solo queda lo que retiene deflate
+    # (acotado, no crece con el número de filas) y el directorio del zip
+    assert len(tail) < 64 * 1024
+    assert sum(len(chunk) for chunk in chunks) > 8 * 64 * 1024
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks) + tail)) as archive:
+        assert archive.testzip() is None
+        assert archive.read('xl/worksheets/sheet1.xml').endswith(
+            b'<t xml:space="preserve">Pedido 99/999</t></is></c></row></sheetData></worksheet>'
+        )
+
+
+def export(export_format):
+    async def pages():
+        for page in PAGES:
+            yield page
+
+    async def collect():
+        return [chunk async for chunk in export_stream(pages(), COLUMNS, export_format, 'Calendario')]
+
+    return asyncio.run(collect())
+
+
+def test_export_stream_csv():
+    chunks = export('csv')
+    assert len(chunks) == 3
+    text = b''.join(chunks).decode()
+    assert text.startswith('﻿')
+    assert list(csv.reader(io.StringIO(text[1:]))) == [
+        COLUMNS,
+        ['e1', 'Contenedor, "MSCU"', '{"lot": "L-7"}'],
+        ['e2', 'Ñandú', ''],
+    ]
+
+
+def test_export_stream_ndjson():
+    lines = b''.join(export('ndjson')).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [row for page in PAGES for row in page]
+
+
+def test_export_stream_xlsx():
+    _, rows = read_xlsx(b''.join(export('xlsx')))
+    assert rows == [tuple(COLUMNS), ('e1', 'Contenedor, "MSCU"', '{"lot": "L-7"}'), ('e2', 'Ñandú', None)]
@@ -0,0 +1,49 @@
+import pytest
+from fastapi import HTTPException
+
+from server import KanbanTask, RANK_KEY_PATTERN, rank_key_after, rank_key_from_int, validate_rank_key
+
+
+def test_rank_key_from_int_keeps_integer_order():
+    values = [0, 1, 9, 60, 61, 62, 3843, 3844, 250000]
+    keys = [rank_key_from_int(value) for value in values]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+    assert all(RANK_KEY_PATTERN.match(key) for key in keys)
+    # Negativas (no deberían existir) quedan como la primera posición
+    assert rank_key_from_int(-5) == rank_key_from_int(0)
+
+
+def test_rank_key_after_appends_in_order():
+    keys = [rank_key_after(None)]
+    for _ in range(500):
+        keys.append(rank_key_after(keys[-1]))
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+    assert all(RANK_KEY_PATTERN.match(key) for key in keys)
+    # Crece un carácter cada ~60 inserciones, no uno por inserción
+    assert len(keys[-1]) <= 10
+
+
+def test_rank_key_after_legacy_keys():
+    assert rank_key_after('') == 'V'
+    assert rank_key_after('zz') == 'zz1'
+    assert rank_key_after(rank_key_from_int(41)) > rank_key_from_int(41)
+
+
+@pytest.mark.parametrize('key', ['a', 'V', '0V', 'Zz1', 'z' * 64])
+def test_validate_rank_key_accepts(key):
+    assert validate_rank_key(key) == key
+
+
+@pytest.mark.parametrize('key', ['', 'V0', 'a-b', 'ñ', 'z' * 65])
+def test_validate_rank_key_rejects(key):
+    with pytest.raises(HTTPException) as error:
+        validate_rank_key(key)
+    assert error.value.status_code == 400
+
+
+def test_kanban_task_converts_integer_positions():
+    task = KanbanTask(id='t1', title='x', priority='low', created_by='u1', position=3)
+    assert task.position == rank_key_from_int(3)
+    assert validate_rank_key(task.position) == task.position
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import ChangeBroker, ChangeHub, InProcessBroker
+
+
+def drain(queue):
+    entries = []
+    while not queue.empty():
+        entries.append(queue.get_nowait())
+    return entries
+
+
+def message(collection, *ids):
+    return {'collection': collection, 'op': 'update', 'ids': list(ids), 'by': 'u1'}
+
+
+def test_change_broker_requires_start_and_publish():
+    class Incomplete(ChangeBroker):
+        async def publish(self, message):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_hub_delivers_only_subscribed_collections():
+    async def scenario():
+        hub = ChangeHub(InProcessBroker(), queue_size=10, replay_size=10)
+        calendar = hub.subscribe(['calendar'])
+        everything = hub.subscribe(['calendar', 'kanban'])
+        await hub.publish(message('calendar', 'e1'))
+        await hub.publish(message('kanban', 't1'))
+        return hub, drain(calendar), drain(everything)
+
+    hub, calendar, everything = asyncio.run(scenario())
+    assert [entry[1]['ids'] for entry in calendar] == [['e1']]
+    assert [entry[1]['ids'] for entry in everything] == [['e1'], ['t1']]
+    assert [entry[0] for entry in everything] == [f'{hub.epoch}-1', f'{hub.epoch}-2']
+    assert hub.stats()['published'] == 2
+    assert hub.stats()['delivered'] == 3
+
+
+def test_hub_replays_missed_messages_on_reconnect():
+    async def scenario():
+        hub = ChangeHub(InProcessBroker(), queue_size=10, replay_size=10)
+        for index in range(4):
+            await hub.publish(message('calendar' if index % 2 else 'orders', f'id{index}'))
+        return hub, drain(hub.subscribe(['calendar'], last_event_id=f'{hub.epoch}-1'))
+
+    hub, replayed = asyncio.run(scenario())
+    assert [(entry[0], entry[1]['ids']) for entry in replayed] == [
+        (f'{hub.epoch}-2', ['id1']),
+        (f'{hub.epoch}-4', ['id3']),
+    ]
+
+
+@pytest.mark.parametrize('last_event_id', ['otherepoch-1', 'garbage', None])
+def test_hub_resets_when_history_is_unknown(last_event_id):
+    async def scenario():
+        hub = ChangeHub(InProcessBroker(), queue_size=10, replay_size=2)
+        for index in range(5):
+            await hub.publish(message('calendar', f'id{index}'))
+        # Sin otro epoch: un id más antiguo que el búfer de 2 mensajes
+        return hub, drain(hub.subscribe(['calendar'], last_event_id=last_event_id or f'{hub.epoch}-1'))
+
+    hub, entries = asyncio.run(scenario())
+    assert entries == [(f'{hub.epoch}-5', None)]
+    assert hub.resets == 1
+
+
+def test_hub_resets_slow_subscribers_instead_of_blocking():
+    async def scenario():
+        hub = ChangeHub(InProcessBroker(), queue_size=2, replay_size=10)
+        queue = hub.subscribe(['kanban'])
+        for index in range(3):
+            await hub.publish(message('kanban', f't{index}'))
+        return hub, drain(queue)
+
+    hub, entries = asyncio.run(scenario())
+    assert entries == [(f'{hub.epoch}-3', None)]
+    assert hub.resets == 1
+
+
+def test_live_ticket_and_session_token_are_not_interchangeable():
+    session = server.create_access_token({'sub': 'u1'})
+    ticket = server.create_access_token({'sub': 'u1', 'scope': 'live'})
+    for token, scope in ((session, 'live'), (ticket, None)):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(server.get_user_from_token(token, scope))
+        assert error.value.status_code == 401